@@ -1 +1,3 @@
-from ambercalculator.ambercalculator import AmberCalculator, AmberError, AmberInput, AmberOutput, AmberSnapshot, AmberTopology
+from ambercalculator.ambercalculator import AmberCalculator, AmberError, AmberInput, AmberOutput, \
+    AmberOutputCollection, AmberSegmentedOutput, AmberGradient, AmberSelection, AmberSnapshot, AmberTopology, \
+    AmberTrajectory
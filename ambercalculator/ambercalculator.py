@@ -23,23 +23,30 @@
 
 import os  # filesystem utilities
 import shutil  # filesystem utilities
-import subprocess  # run external program as child process
-import fileinput  # fileinput is used for inplace editing of files
 import shlex  # simple lexical analysis for unix syntax
 import math  # import mathematical functions
 import re  # process output with regular expressions
 import copy  # shallow and deep copy operations
 import time  # provides various time-related functions
-import urllib.request  # Extensible library for opening URLs
+import json  # read and write data in json format
+import hashlib  # secure hashes and message digests
+import numbers  # abstract base classes of numbers
+import operator  # standard operators as functions
+import collections  # container datatypes
+import atexit  # functions executed at the exit of the interpreter
+import queue  # synchronized queues
+import threading  # threads of execution
+import weakref  # references that do not keep objects alive
+import io  # text streams
+import sys  # interpreter state
+import uuid  # unique identifiers
 
 # imports of local modules
 
 import ambercalculator.constants as constants  # physical and mathematical constants
 
-# math libraries
-
-import numpy as np  # numpy: arrays and math utilities
-from scipy.io import netcdf  # read NetCDF file using scipy
+# heavy modules (subprocess, fileinput, urllib, numpy, scipy) are imported only in the methods that need them,
+# so that processes that use only a part of the package (e.g. to write an input) do not pay their import time
 
 
 #####################################################################################################
@@ -48,6 +55,105 @@ class AmberError(Exception):
     """A custom exception used to report errors in use of Amber"""
 
 
+#####################################################################################################
+
+class _DirectoryCleanup:
+    """ Removal of the directories of the calculations in a background thread. A directory is first moved, with an
+    atomic rename, to a trash directory in its parent directory, so that its path is free at once for a new
+    calculation; then it is deleted by a worker thread, and the trash directory is removed when it is empty.
+    At the exit of the interpreter, the instances that are still alive are closed and the pending removals are
+    completed; after that, and while the interpreter is shutting down, the directories are removed immediately.
+    """
+
+    # name of the trash directory, that is created in the parent directory of the directories that are removed
+    TRASHNAME = ".ambercalculator-trash"
+
+    def __init__(self):
+        self._start()
+        # instances that are closed at the exit of the interpreter, and state of the exit
+        self._instances = weakref.WeakSet()
+        self._exiting = False
+        atexit.register(self._atexit)
+        # a child process created with fork does not have the worker thread, and starts with an empty queue
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        """ Start the worker thread, with an empty queue. The thread is started once, when the service is created,
+        because remove is called by the destructors of the instances: these can run at any time, also while this
+        thread is creating another thread, and then they should not take any lock (SimpleQueue.put is safe) """
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._work, name="ambercalculator-cleanup", daemon=True)
+        self._thread.start()
+
+    def remove(self, path):
+        """ Move the directory path to the trash and schedule its deletion. When the directory cannot be moved
+        (e.g. the trash cannot be created), it is removed immediately.
+
+        :param path: path of the directory
+        """
+
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            return
+        # at the exit of the interpreter, there is no worker thread to wait for
+        if self._exiting or sys.is_finalizing():
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        trash = os.path.join(os.path.dirname(path), _DirectoryCleanup.TRASHNAME)
+        target = os.path.join(trash, "{0}.{1}".format(os.path.basename(path), uuid.uuid4().hex))
+        # the worker removes the trash when it is empty, possibly between makedirs and rename: then try again
+        for _ in range(3):
+            try:
+                os.makedirs(trash, exist_ok=True)
+                os.rename(path, target)
+            except FileNotFoundError:
+                if os.path.isdir(path):
+                    continue
+                return
+            except OSError:
+                break
+            self._queue.put((target, trash))
+            return
+        shutil.rmtree(path)
+
+    def track(self, instance):
+        """ Register an instance with a close method, that is called at the exit of the interpreter """
+        self._instances.add(instance)
+
+    def flush(self):
+        """ Wait until all the scheduled deletions are completed: the worker takes the directories in order,
+        so they are all deleted when it reaches an event that is put in the queue now """
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def _atexit(self):
+        """ Close the instances that are still alive, then complete the removals """
+        for instance in list(self._instances):
+            instance.close()
+        self._exiting = True
+        self.flush()
+
+    def _work(self):
+        """ Worker thread: delete the directories of the queue, one at a time, and signal the events of flush """
+        while True:
+            item = self._queue.get()
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            target, trash = item
+            shutil.rmtree(target, ignore_errors=True)
+            try:
+                os.rmdir(trash)
+            except OSError:  # other directories are still in the trash
+                pass
+
+
+# the service that removes the directories of the calculations for all the instances of the module
+_CLEANUP = _DirectoryCleanup()
+
+
 #####################################################################################################
 
 class AmberCalculator:
@@ -59,6 +165,17 @@ class AmberCalculator:
     mpirun = ""
     # class variable that controls when the check on the environment has been done
     _amberCheck = False
+    # paths of the executables that have been already used, stored as {name: path}
+    _executables = {}
+    # name of the file in the ambercalculator cache with the record of the environment
+    _ENVRECORDNAME = "environment.json"
+    # functions that are called with the record of each run, see addRunHook
+    _runHooks = []
+    # directory of the ambercalculator cache with the files of the solvents (the name includes the layout version)
+    _SOLVENTCACHENAME = os.path.join("solvents", "v1")
+    # directory of the ambercalculator cache with the parameters of the molecules, and names of the cached files
+    _PARAMCACHENAME = "parameters"
+    _PARAMFILES = ["molecule.mol2", "molecule.frcmod"]
 
     # constant class variables with the names of the Amber I/O files
     INPNAME = "inp"
@@ -93,7 +210,17 @@ class AmberCalculator:
 
     def __init__(self):
         """ the constructor of the AmberCalculator class checks if the environment for AMBER execution
-        is properly defined and if all the necessary executables are available """
+        is properly defined. The version of AMBER and the paths of the executables are determined only
+        when they are needed for the first time, and they are cached on disk (see _environmentRecord) """
+
+        AmberCalculator._setupEnvironment()
+
+    # ================================================================================
+
+    @staticmethod
+    def _setupEnvironment():
+        """ Read the environment variables that define the AMBER installation and the MPI command.
+        This check is done only once, and it does not involve any access to the filesystem. """
 
         if not AmberCalculator._amberCheck:
 
@@ -109,39 +236,153 @@ class AmberCalculator:
             except KeyError:
                 AmberCalculator.mpirun = 'mpirun -np'
 
-            # call update_amber to check the current version of amber
+            # set class variable to true, to skip this check at next initialization
+            AmberCalculator._amberCheck = True
+
+    # ================================================================================
+
+    @staticmethod
+    def _cachePath(*names):
+        """ Return the path of a file or directory in the on-disk cache of ambercalculator. The cache is
+        located in $AMBERCALCULATOR_CACHE when this variable is defined, otherwise in the standard user
+        cache directory ($XDG_CACHE_HOME/ambercalculator or ~/.cache/ambercalculator)
+
+        :param names: components of the path, relative to the root of the cache
+        :return: the path of the file or directory
+        """
+
+        try:
+            cacheDir = os.environ['AMBERCALCULATOR_CACHE']
+        except KeyError:
+            cacheDir = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser("~"), ".cache")),
+                                    "ambercalculator")
+        return os.path.join(cacheDir, *names)
+
+    # ================================================================================
+
+    @staticmethod
+    def _environmentRecord(update=None):
+        """ Read or update the on-disk record with the AMBER version and the paths of the executables that
+        have been found in the current environment. Records are stored in a small json file, with a key
+        that depends on $AMBERHOME and $PATH. The record is updated with an atomic file replacement,
+        so that concurrent processes never read a partially written file.
+
+        :param update: dictionary with the new data of the record, None when the record is only read
+        :return: dictionary with the record of the current environment (empty when there is no record)
+        """
+        recordFile = AmberCalculator._cachePath(AmberCalculator._ENVRECORDNAME)
+        key = "{0}\n{1}".format(AmberCalculator.amberhome, os.environ.get("PATH", ""))
+        key = hashlib.sha1(key.encode()).hexdigest()
+
+        # read the existing records, a missing or corrupted file is equivalent to an empty cache
+        try:
+            with open(recordFile, "r") as f:
+                records = json.load(f)
+        except (IOError, ValueError):
+            records = {}
+
+        if update is not None:
+            records[key] = dict(records.get(key, {}), **update)
+            try:
+                os.makedirs(os.path.dirname(recordFile), exist_ok=True)
+                with open(recordFile + ".{0}".format(os.getpid()), "w") as f:
+                    json.dump(records, f)
+                os.replace(recordFile + ".{0}".format(os.getpid()), recordFile)
+            except OSError:  # a read-only cache is not an error, the environment is simply checked again next time
+                pass
+
+        return records.get(key, {})
+
+    # ================================================================================
+
+    @staticmethod
+    def _mtime(path):
+        """ Return the modification time of a file, or None when the file does not exist """
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    # ================================================================================
+
+    @staticmethod
+    def _version():
+        """ Determine the version of AMBER installed in $AMBERHOME by calling update_amber. The result is stored in
+        the class variable amberVersion and in the on-disk record, that is reused until update_amber is modified.
+
+        :return: list of strings with the components of the AMBER version, e.g. ['19', '0']
+        """
+
+        if AmberCalculator.amberVersion is None:
+            AmberCalculator._setupEnvironment()
             updateExe = os.path.join(AmberCalculator.amberhome, "update_amber")
-            if os.path.isfile(updateExe) and os.access(updateExe, os.X_OK):
-                command = shlex.split(updateExe + " -v")
-                proc = subprocess.run(command, stdout=subprocess.PIPE)
-                # process the std out line-by-line
-                for line in proc.stdout.splitlines():
-                    if b"AmberTools version" in line:
-                        AmberCalculator.amberVersion = line.decode().split()[2].split(".")
+            updateTime = AmberCalculator._mtime(updateExe)
+
+            # use the cached version, when update_amber has not been changed since the version was determined
+            record = AmberCalculator._environmentRecord()
+            if "version" in record and record.get("updateTime") == updateTime:
+                AmberCalculator.amberVersion = record["version"]
+
             else:
-                AmberCalculator.amberVersion = ["8"]
+                # call update_amber to check the current version of amber
+                if os.path.isfile(updateExe) and os.access(updateExe, os.X_OK):
+                    import subprocess  # run external program as child process
+                    proc = subprocess.run([updateExe, "-v"], stdout=subprocess.PIPE)
+                    # process the std out line-by-line
+                    for line in proc.stdout.splitlines():
+                        if b"AmberTools version" in line:
+                            AmberCalculator.amberVersion = line.decode().split()[2].split(".")
+                if AmberCalculator.amberVersion is None:
+                    AmberCalculator.amberVersion = ["8"]
+                AmberCalculator._environmentRecord({"version": AmberCalculator.amberVersion, "updateTime": updateTime})
+
+            # write message about the AMBER version currently in use
+            print("Running AMBER {0} from {1}\n".format(AmberCalculator.amberVersion[0], AmberCalculator.amberhome))
+
+        return AmberCalculator.amberVersion
+
+    # ================================================================================
+
+    @staticmethod
+    def _executable(program):
+        """ Return the full path of an executable that is needed to run a calculation. The PATH is searched
+        only the first time that the executable is needed, then the path is stored in the class variable
+        _executables and in the on-disk record. The record is reused as long as the executable is unchanged.
+
+        :param program: the name of the executable file, e.g. "sander"
+        :return: full path of the executable
+        """
+
+        if program not in AmberCalculator._executables:
+            AmberCalculator._setupEnvironment()
+
+            # look for the executable in the on-disk record, and check that it has not been changed since then
+            cached = AmberCalculator._environmentRecord().get("executables", {}).get(program)
+            if cached is not None and AmberCalculator._mtime(cached[0]) == cached[1]:
+                AmberCalculator._executables[program] = cached[0]
 
-            # define the list of executables depending on the version of amber
-            if int(AmberCalculator.amberVersion[0]) <= 12:
-                exeList = ["antechamber", "tleap", "sander", "ambpdb", "parmchk", "cpptraj", "ambmask"]
             else:
-                exeList = ["antechamber", "tleap", "sander", "ambpdb", "parmchk2", "cpptraj", "ambmask"]
+                # search the executable in the PATH and update the record
+                exePath = AmberCalculator._which(program)
+                if not exePath:
+                    raise AmberError(program + " executable is not available")
+                AmberCalculator._executables[program] = exePath
+                executables = AmberCalculator._environmentRecord().get("executables", {})
+                executables[program] = [exePath, AmberCalculator._mtime(exePath)]
+                AmberCalculator._environmentRecord({"executables": executables})
 
-            # check if amber executables are available
-            for exe in exeList:
-                if not AmberCalculator._which(exe):
-                    raise AmberError(exe + " executable is not available")
+        return AmberCalculator._executables[program]
 
-            # check that openbabel is available
-            if not AmberCalculator._which("obabel"):
-                raise AmberError("obabel executable is not available")
+    # ================================================================================
 
-            # write message about the AMBER version currently in use
-            print("Running AMBER {0} from {1}\n".format(
-                AmberCalculator.amberVersion[0], AmberCalculator.amberhome))
+    @staticmethod
+    def _parmchk():
+        """ Return the path of the parmchk executable, that has a different name depending on the AMBER version """
 
-            # set class variable to true, to skip this check at next initialization
-            AmberCalculator._amberCheck = True
+        if int(AmberCalculator._version()[0]) <= 12:
+            return AmberCalculator._executable("parmchk")
+        else:
+            return AmberCalculator._executable("parmchk2")
 
     # ================================================================================
 
@@ -174,6 +415,18 @@ class AmberCalculator:
         # store starting dir
         startDir = os.getcwd()
 
+        # initialize the record with the wall time of each stage of the run and the resources used by AMBER
+        runInfo = {"calcDir": calcDir,  # directory of the calculation
+                   "command": None,  # command used to run AMBER (None when existing results are read)
+                   "reused": False,  # results have been read from an existing calculation
+                   "stages": {},  # wall time (in s) of each stage: check, cleanup, write, execute, parse
+                   "exitstatus": None,  # exit status of the AMBER process
+                   "usercpu": None,  # user CPU time (in s) of the AMBER process
+                   "systemcpu": None,  # system CPU time (in s) of the AMBER process
+                   "maxrss": None,  # maximum resident set size of the AMBER process (in kB)
+                   "error": None}  # error message, when the results cannot be read
+        stageStart = time.perf_counter()
+
         # initialize a logical flag readExisting (when true, read results from the dir and do not re-run existing calc)
         readExisting = False
 
@@ -209,11 +462,13 @@ class AmberCalculator:
             # read only when identical setup AND identical initial conditions
             readExisting = identicalSetup and identicalInitCond and identicalTopology
             os.chdir(startDir)
+        stageStart = AmberCalculator._stageTime(runInfo, "check", stageStart)
 
         # when the existing working directory is not re-used, move there and remove it
         if os.path.isdir(calcDir) and not readExisting:
             print("WARNING! overwriting previous " + calcDir + " directory ")
-            shutil.rmtree(calcDir)
+            _CLEANUP.remove(calcDir)
+        stageStart = AmberCalculator._stageTime(runInfo, "cleanup", stageStart)
 
         # if needed create directory and move there
         if not os.path.isdir(calcDir): os.mkdir(calcDir)
@@ -232,65 +487,234 @@ class AmberCalculator:
             # write sander input
             with open(os.path.join(calcDir, AmberCalculator.INPNAME), "w") as f:
                 f.write(inputfile.inputtext)
+            stageStart = AmberCalculator._stageTime(runInfo, "write", stageStart)
 
             # defines command for running SANDER
             if GPU:  # run calculation with cuda support
-                amberCommand = "pmemd.cuda "
+                amberCommand = [AmberCalculator._executable("pmemd.cuda")]
             elif nCores > 1:  # run calculation with MPI (cuda has precedence)
-                amberCommand = "{0} {1} sander.MPI ".format(AmberCalculator.mpirun, nCores)
+                AmberCalculator._setupEnvironment()
+                amberCommand = shlex.split(AmberCalculator.mpirun) + [str(nCores),
+                                                                      AmberCalculator._executable("sander.MPI")]
             else:  # run serially
-                amberCommand = "sander "
+                amberCommand = [AmberCalculator._executable("sander")]
             # add options for input and output files
-            amberCommand += "-O -i {0} -o {1} -p {2} -c {3}".format(
-                AmberCalculator.INPNAME, AmberCalculator.OUTNAME, AmberCalculator.TOPNAME, AmberCalculator.CRDNAME)
-            # split command in pieces with shlex
-            amberCommand = shlex.split(amberCommand)
+            amberCommand += shlex.split("-O -i {0} -o {1} -p {2} -c {3}".format(
+                AmberCalculator.INPNAME, AmberCalculator.OUTNAME, AmberCalculator.TOPNAME, AmberCalculator.CRDNAME))
 
             # run the amber calculation
-            os.chdir(calcDir)
-            subprocess.run(amberCommand, stdout=None, stderr=None)
-            os.chdir(startDir)
-
-            # now create the outputData instance reading from the output of the AMBER calculation
-            # AMBER files are stored only if requested with the argument store
-            outputData = AmberOutput(calcDir, storeFiles=store)
+            runInfo["command"] = amberCommand
+            runInfo.update(AmberCalculator._launch(amberCommand, calcDir))
+            stageStart = AmberCalculator._stageTime(runInfo, "execute", stageStart)
 
         else:
 
             print("WARNING! reading results from pre-existing {0} directory".format(calcDir))
+            runInfo["reused"] = True
 
-            # now create the outputData instance reading from the output of the AMBER calculation
-            # it is assumed that one wants to keep the original AMBER files
-            outputData = AmberOutput(calcDir, storeFiles=True)
+        # now create the outputData instance reading from the output of the AMBER calculation
+        # AMBER files are stored only if requested with the argument store, when the results of a
+        # previous calculation are read, it is assumed that one wants to keep the original AMBER files
+        try:
+            outputData = AmberOutput(calcDir, storeFiles=store or readExisting)
+        except AmberError as error:
+            runInfo["error"] = str(error)
+            AmberCalculator._stageTime(runInfo, "parse", stageStart)
+            AmberCalculator._notifyRunHooks(runInfo)
+            raise
+        AmberCalculator._stageTime(runInfo, "parse", stageStart)
+
+        # attach the record to the output and send it to the hooks
+        outputData.dataDict["runinfo"] = runInfo
+        AmberCalculator._notifyRunHooks(runInfo)
 
         return outputData
 
     # =============================================================================================================
 
+    @staticmethod
+    def _stageTime(runInfo, stage, stageStart):
+        """ Store in the run record the wall time of a stage of the run, that started at time stageStart
+
+        :param runInfo: dictionary with the record of the run
+        :param stage: name of the stage
+        :param stageStart: value of time.perf_counter() at the beginning of the stage
+        :return: value of time.perf_counter() at the end of the stage
+        """
+        stageEnd = time.perf_counter()
+        runInfo["stages"][stage] = stageEnd - stageStart
+        return stageEnd
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _launch(command, workDir):
+        """ Run an external program as a child process in the directory workDir, and collect the resources
+        that it has used: CPU time and maximum resident set size are read from os.wait4 when this is
+        available (on POSIX systems), otherwise only the exit status is returned.
+
+        :param command: list with the executable and its arguments
+        :param workDir: directory where the program is run
+        :return: dictionary with exitstatus, usercpu, systemcpu and maxrss of the child process
+        """
+        import subprocess  # run external program as child process
+
+        proc = subprocess.Popen(command, cwd=workDir, stdout=None, stderr=None)
+        if hasattr(os, "wait4"):
+            pid, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return {"exitstatus": proc.returncode, "usercpu": usage.ru_utime, "systemcpu": usage.ru_stime,
+                    "maxrss": usage.ru_maxrss}
+        else:
+            return {"exitstatus": proc.wait()}
+
+    # =============================================================================================================
+
+    @staticmethod
+    def addRunHook(hook):
+        """ Register a function that is called at the end of each AmberCalculator.run, with the record of the run
+        as argument (a dictionary with the timings of the stages and the resources used, see AmberOutput.runinfo).
+        Hooks can be used to forward the records to an external metrics sink.
+
+        :param hook: callable object that takes the record dictionary as argument
+        """
+        if hook not in AmberCalculator._runHooks:
+            AmberCalculator._runHooks.append(hook)
+
+    # =============================================================================================================
+
+    @staticmethod
+    def removeRunHook(hook):
+        """ Remove a function from the list of the hooks called at the end of each AmberCalculator.run
+
+        :param hook: callable object that has been previously registered with addRunHook
+        """
+        if hook in AmberCalculator._runHooks:
+            AmberCalculator._runHooks.remove(hook)
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _notifyRunHooks(runInfo):
+        """ Send the record of a run to all the registered hooks. Errors in the hooks are reported
+        as warnings, and they never interrupt the calculation.
+
+        :param runInfo: dictionary with the record of the run
+        """
+        for hook in AmberCalculator._runHooks:
+            try:
+                hook(runInfo)
+            except Exception as error:
+                print("WARNING! run hook {0} failed with error: {1}".format(hook, error))
+
+    # =============================================================================================================
+
+    @staticmethod
+    def runSegmented(inputfile, topologyfile, snapshot, segmentSteps, calcDir="amberSegments", nCores=1, GPU=False,
+                     store=False):
+        """ run a long AMBER molecular dynamics as a chain of shorter segments, each one restarting from the
+        final snapshot of the previous one (irest=1, ntx=5). Each segment is run in its own subdirectory of calcDir,
+        and segments that have already been completed are read from disk instead of being run again: when the
+        method is called again after a failure, the dynamics resumes from the last completed segment.
+
+        :rtype: AmberSegmentedOutput
+        :param inputfile: AmberInput class instance with the input file for the whole MD run
+        :param topologyfile: AmberTopology class instance with the topology file
+        :param snapshot: AmberSnapshot class instance with the initial conditions of the whole MD run
+        :param segmentSteps: number of MD steps of each segment
+        :param calcDir: string that specify where the segments of the calculation are run
+        :param nCores: number of cores used in a parallel run
+        :param GPU: use the GPU compiled version of the AMBER code
+        :param store: do not remove output files when the AmberSegmentedOutput instance is disposed
+        :return: AmberSegmentedOutput class instance that collects the results of all the segments
+        """
+
+        # check if inputfile is of AmberInput type
+        if not isinstance(inputfile, AmberInput):
+            raise AmberError("amberCalculator.runSegmented: first argument should be of amberInput type")
+
+        # segmentation makes sense only for a molecular dynamics run
+        try:
+            if int(inputfile["imin"]) != 0:
+                raise AmberError("amberCalculator.runSegmented: input is not a molecular dynamics run")
+            nrSteps = int(inputfile["nstlim"])
+        except KeyError:
+            raise AmberError("amberCalculator.runSegmented: input is not a molecular dynamics run")
+
+        # segments should contain at least one step, an integer number of printed steps and of mdcrd frames
+        if segmentSteps < 1:
+            raise AmberError("amberCalculator.runSegmented: segmentSteps should be a positive number of steps")
+        for key in ["ntpr", "ntwx"]:
+            try:
+                nprint = int(inputfile[key])
+            except KeyError:
+                continue
+            if nprint > 0 and segmentSteps % nprint != 0:
+                raise AmberError("amberCalculator.runSegmented: segmentSteps should be a multiple of {0}".format(key))
+
+        # if needed create directory that will contain the segments
+        if not os.path.isdir(calcDir): os.mkdir(calcDir)
+
+        segmentOutputs = []
+        segSnapshot = snapshot
+        for nSeg, firstStep in enumerate(range(0, nrSteps, segmentSteps)):
+
+            # input of the segment: same directives, with a reduced number of steps
+            segInput = copy.deepcopy(inputfile)
+            segInput["nstlim"] = str(min(segmentSteps, nrSteps - firstStep))
+            # segments after the first one continue the dynamics of the previous one
+            if nSeg > 0:
+                segInput["irest"] = "1"
+                segInput["ntx"] = "5"
+                segSnapshot = segmentOutputs[-1].snapshot(-1)
+
+            # when the segment has been already completed, run will read it from disk (if the setup is identical)
+            # otherwise remove what is left of previous attempts and run the segment from scratch
+            segDir = os.path.join(calcDir, "segment{0:03d}".format(nSeg + 1))
+            completed = AmberOutput.completed(segDir)
+            segmentOutputs.append(AmberCalculator.run(segInput, topologyfile, segSnapshot, calcDir=segDir,
+                                                      overwrite=not completed, nCores=nCores, GPU=GPU, store=True))
+
+        # return the view of the segmented calculation, all the files are stored only if requested with store
+        return AmberSegmentedOutput(calcDir, segmentOutputs, storeFiles=store)
+
+    # =============================================================================================================
+
     @staticmethod
     def createSolvatedMolecule(atomlabels: list, coords: list, solvsize: float, calcDir: str = "solvatedMolecule",
-                               residueName: str = "CHR", solvent: str = "water"):
+                               residueName: str = "CHR", solvent: str = "water", netCharge: int = 0,
+                               useCache: bool = True):
         """ Use AMBER tools to generate the topology and an initial snapshot for a molecule in solvent.
+        The parameters of the molecule computed by antechamber and parmchk (molecule.mol2 and molecule.frcmod)
+        are stored in the ambercalculator cache, with a key that depends on the atomic labels, the connectivity,
+        the net charge, the residue name and the AMBER version: when the same molecule is solvated again,
+        the cached parameters are used and only the coordinates of the mol2 file are updated.
 
         :rtype: (AmberSnapshot, AmberTopology)
         :param atomlabels:      list of atomic labels
         :param coords:          list of 3d coordinates for each atom [[x0,y0,z0], ... [x1,y1,z1]]
-        :param solvsize:        size of the solvation layer added to the molecule (in Anstrom)
+        :param solvsize:        size of the solvation layer added to the molecule (in Anstrom), when None the
+                                molecule is not solvated (e.g. to solvate it later with the solvate method)
         :param calcDir:         name of the directory where the processing will be done
         :param residueName:     three-letter string with the name of the residue
         :param solvent:         string with the common name of the solvent
+        :param netCharge:       net charge of the molecule, used by antechamber to compute the AM1-BCC charges
+        :param useCache:        reuse the parameters of the molecule from the cache, when available
         :return:                snapshot and topology of the box with the molecule and the solvent
         """
+        import subprocess  # run external program as child process
+        import fileinput  # fileinput is used for inplace editing of files
 
         # check whether the solvent is available
-        amberVersion = int(AmberCalculator.amberVersion[0])
+        amberVersion = int(AmberCalculator._version()[0])
         if amberVersion not in AmberCalculator._AMBERSOLVENTS:
             raise AmberError("amberCalculator.createSolvatedMolecule: AMBER v. {} not supported".format(amberVersion))
         if solvent not in AmberCalculator._AMBERSOLVENTS[amberVersion]:
             raise AmberError("amberCalculator.createSolvatedMolecule: solvent {} not available".format(solvent))
 
-        # store starting dir
-        startDir = os.getcwd()
+        # the files of the calculation are written in calcDir, and the programs are run there as child processes
+        def path(fileName):
+            return os.path.join(calcDir, fileName)
 
         # if the dir already exists, remove first, then create it from scratch
         if os.path.isdir(calcDir):
@@ -298,43 +722,71 @@ class AmberCalculator:
             shutil.rmtree(calcDir)
         os.mkdir(calcDir)
 
-        # then move to the working directory
-        os.chdir(calcDir)
-
         # write atoms and coords to xyz format
-        with open("molecule.xyz", "w") as fxyz:
+        with open(path("molecule.xyz"), "w") as fxyz:
             fxyz.write("{}\n{}\n".format(len(atomlabels), "geometry of the molecule for AMBER input preparation"))
             for lab, c in zip(atomlabels, coords):
                 fxyz.write("{0}{1:15.6f}{2:15.6f}{3:15.6f}\n".format(lab, *c))
 
         # convert with openbabel to define the connettivity of the molecule
-        with open("babel.log", "w") as fstdout:
-            subprocess.run(["obabel", "molecule.xyz", "-Omolecule.pdb"], stdout=fstdout, stderr=subprocess.STDOUT)
+        with open(path("babel.log"), "w") as fstdout:
+            subprocess.run([AmberCalculator._executable("obabel"), "molecule.xyz", "-Omolecule.pdb"],
+                           cwd=calcDir, stdout=fstdout, stderr=subprocess.STDOUT)
 
-        # TODO: check existence of molecule.pdb
+        # check existence of molecule.pdb
+        if not os.path.isfile(path("molecule.pdb")):
+            raise AmberError("amberCalculator.createSolvatedMolecule: obabel failed, see {0}".format(
+                path("babel.log")))
 
         # change the name of the residue
-        f = fileinput.FileInput("molecule.pdb", inplace=True)
+        f = fileinput.FileInput(path("molecule.pdb"), inplace=True)
         for line in f:
             print(line.replace("UNL", residueName).rstrip())
         f.close()
 
-        # create nonstandar residue with antechamber
-        with open("antechamber.log", "w") as fstdout:
-            command = shlex.split("antechamber -i molecule.pdb -fi pdb -o molecule.mol2 -fo mol2 -c bcc -at gaff2")
-            subprocess.run(command, stdout=fstdout, stderr=subprocess.STDOUT)
+        # key of the parameters of the molecule in the cache
+        with open(path("molecule.pdb"), "r") as f:
+            bonds = AmberCalculator._pdbConnectivity(f.read())
+        cacheDir = AmberCalculator._cachePath(AmberCalculator._PARAMCACHENAME, AmberCalculator._moleculeDigest(
+            atomlabels, bonds, netCharge, residueName, AmberCalculator._version()))
 
-        # TODO: check existence of molecule.mol2
+        if useCache and all(os.path.isfile(os.path.join(cacheDir, n)) for n in AmberCalculator._PARAMFILES):
 
-        # check force field and define missing parameters with parmchk
-        with open("parmchk.log", "w") as fstdout:
-            if int(AmberCalculator.amberVersion[0]) <= 12:
-                command = shlex.split("parmchk -a Y -i molecule.mol2 -f mol2 -o molecule.frcmod")
-            else:
-                command = shlex.split("parmchk2 -a Y -i molecule.mol2 -f mol2 -o molecule.frcmod")
-            subprocess.run(command, stdout=fstdout, stderr=subprocess.STDOUT)
+            # reuse the parameters, and update the coordinates of the mol2 file with the current geometry
+            print("Reusing the parameters of molecule {0} from {1}".format(residueName, cacheDir))
+            with open(os.path.join(cacheDir, "molecule.mol2"), "r") as f:
+                mol2Text = AmberCalculator._mol2Coordinates(f.read(), coords)
+            with open(path("molecule.mol2"), "w") as f:
+                f.write(mol2Text)
+            shutil.copy(os.path.join(cacheDir, "molecule.frcmod"), path("molecule.frcmod"))
+
+        else:
+
+            # create nonstandar residue with antechamber
+            with open(path("antechamber.log"), "w") as fstdout:
+                command = [AmberCalculator._executable("antechamber")] + \
+                    shlex.split("-i molecule.pdb -fi pdb -o molecule.mol2 -fo mol2 -c bcc -at gaff2 -nc {0}".format(
+                        int(netCharge)))
+                subprocess.run(command, cwd=calcDir, stdout=fstdout, stderr=subprocess.STDOUT)
+
+            # check existence of molecule.mol2
+            if not os.path.isfile(path("molecule.mol2")):
+                raise AmberError("amberCalculator.createSolvatedMolecule: antechamber failed, see {0}".format(
+                    path("antechamber.log")))
+
+            # check force field and define missing parameters with parmchk
+            with open(path("parmchk.log"), "w") as fstdout:
+                command = [AmberCalculator._parmchk()] + \
+                    shlex.split("-a Y -i molecule.mol2 -f mol2 -o molecule.frcmod")
+                subprocess.run(command, cwd=calcDir, stdout=fstdout, stderr=subprocess.STDOUT)
 
-        # TODO: check existence of molecule.frcmod
+            # check existence of molecule.frcmod
+            if not os.path.isfile(path("molecule.frcmod")):
+                raise AmberError("amberCalculator.createSolvatedMolecule: parmchk failed, see {0}".format(
+                    path("parmchk.log")))
+
+            # store the parameters in the cache, for the next solvation of the same molecule
+            if useCache: AmberCalculator._storeParameters(cacheDir, calcDir)
 
         # define the command to source solvent parameters and the name of the solvent box
         paramCmd = AmberCalculator._AMBERSOLVENTS[amberVersion][solvent][0]
@@ -346,210 +798,704 @@ class AmberCalculator:
         print("\nUsing force field and solvent box information obtained \nfrom {0}".format(
             AmberCalculator._AMBERSOLVENTS[amberVersion][solvent][3]))
 
-        # get the files that are needed with the force field and solvent box definitions
-        for filename, address in AmberCalculator._AMBERSOLVENTS[amberVersion][solvent][2].items():
-            urllib.request.urlretrieve(address, filename)
+        # get the files that are needed with the force field and solvent box definitions from the solvent cache
+        for filename, source in AmberCalculator._AMBERSOLVENTS[amberVersion][solvent][2].items():
+            AmberCalculator._solventFile(filename, source, path(filename))
 
         # create input file for leap and run leap
-        with open("leap.script", "w") as f:
+        with open(path("leap.script"), "w") as f:
             inputText = AmberCalculator._LEAP_PREAMBLE[amberVersion] + "\n" + \
                         "{2}\n" + \
                         "loadamberparams molecule.frcmod\n" + \
                         "{0} = loadmol2 molecule.mol2\n" + \
                         "check {0}\n" + \
-                        "solvateOct {0} {1} {3}\n" + \
+                        ("solvateOct {0} {1} {3}\n" if solvsize is not None else "") + \
                         "saveAmberParm {0} molecule_solv.top molecule_solv.crd\n" + \
                         "quit\n"
             f.write(inputText.format(sysName, solvName, paramCmd, solvsize))
 
-        with open("leap.log", "w") as fstdout:
-            subprocess.run(["tleap", "-f", "leap.script"], stdout=fstdout, stderr=subprocess.STDOUT)
+        with open(path("leap.log"), "w") as fstdout:
+            subprocess.run([AmberCalculator._executable("tleap"), "-f", "leap.script"],
+                           cwd=calcDir, stdout=fstdout, stderr=subprocess.STDOUT)
 
-        # TODO: check existence of topology and coordinate file, if they exist give success message
+        # check existence of topology and coordinate file
+        if not os.path.isfile(path("molecule_solv.top")) or not os.path.isfile(path("molecule_solv.crd")):
+            raise AmberError("amberCalculator.createSolvatedMolecule: tleap failed, see {0}".format(
+                path("leap.log")))
 
         # read coordinates and topology
-        with open("molecule_solv.top") as f:
+        with open(path("molecule_solv.top")) as f:
             topology = AmberTopology(f.read())
-        with open("molecule_solv.crd") as f:
+        with open(path("molecule_solv.crd")) as f:
             snapshot = AmberSnapshot.readcrd(f.read())
 
-        # move back to starting directory
-        os.chdir(startDir)
-
         # return topology and snapshot file
         return snapshot, topology
 
     # =============================================================================================================
 
     @staticmethod
-    def cutdroplet(topologyfile, snapshot, spherRad: float = None, nrResidue: int = 1, calcDir: str = "tmpDroplet"):
-        """ run AMBER with the initial conditions defined in inputData and store the results in outputData.
-
-        :rtype:                 (AmberSnapshot, AmberTopology)
-        :param topologyfile:    topology of the AMBER data to process in this method
-        :param snapshot:        snapshot of the AMBER data to process in this method
-        :param spherRad:        radius of the final droplet
-        :param nrResidue:       ordinal number (1,2, ...) of the residue at the center of the droplet
-        :param calcDir:         name of the directory where the processing will be done
-        :return:                snapshot and topology of the droplet, cut from the original structure
+    def createSolvatedMolecules(specs: list, calcDir: str = "solvatedMolecules", nProcesses: int = None,
+                                useCache: bool = True):
+        """ Generate the topologies and the initial snapshots for many molecules in solvent, running the
+        obabel / antechamber / parmchk / tleap pipelines of createSolvatedMolecule in parallel on a pool of
+        processes. Each molecule is processed in its own subdirectory of calcDir (molecule000, molecule001, ...).
+        A failure in the preparation of one molecule does not stop the others: the corresponding item of
+        the list of results is the AmberError instance that describes the failure.
+
+        :rtype: list
+        :param specs:       list of the molecules to process, each molecule is defined either by a tuple
+                            (atomlabels, coords, solvent, solvsize) or by a dictionary with the keyword
+                            arguments of createSolvatedMolecule (atomlabels, coords, solvsize, solvent, ...)
+        :param calcDir:     name of the directory where the processing will be done
+        :param nProcesses:  number of parallel processes (None to use the number of processors of the machine)
+        :param useCache:    reuse the parameters of the molecules from the cache, when available
+        :return:            list with a (snapshot, topology) tuple or an AmberError instance for each molecule
         """
+        import concurrent.futures  # launch parallel tasks on a pool of processes
 
-        # store starting dir and move to directory of the calculation
-        startDir = os.getcwd()
-        # then move to the work d where preprocessing files are stored, if the dir exists, remove first
+        # convert the specifications to the keyword arguments of createSolvatedMolecule
+        arguments = []
+        for n, spec in enumerate(specs):
+            if isinstance(spec, dict):
+                kwargs = dict(spec)
+            else:
+                kwargs = dict(zip(["atomlabels", "coords", "solvent", "solvsize"], spec))
+            kwargs["calcDir"] = os.path.join(calcDir, "molecule{0:03d}".format(n))
+            kwargs.setdefault("useCache", useCache)
+            arguments.append(kwargs)
+
+        # if the dir already exists, remove first, then create it from scratch
         if os.path.isdir(calcDir):
             print("WARNING! overwriting previous " + calcDir + " directory ")
             shutil.rmtree(calcDir)
-        os.mkdir(calcDir), os.chdir(calcDir)
-
-        # write topology to file
-        with open("input00.top", "w") as f:
-            f.write(topologyfile.topotext)
-        # write coordinates and unit cell constants to file
-        with open("input00.crd", "w") as f:
-            f.write(snapshot.crdtext)
+        os.mkdir(calcDir)
 
-        # write first input file for cpptraj (extract snapshot, center and remap coordinates in the first unit cell)
-        with open("cpptrajscript.01", "w") as f:
-            f.write(" parm {0}\n trajin {1}\n".format("input00.top", "input00.crd"))
-            f.write(" center :{0} \n".format(nrResidue))
-            f.write(" image familiar\n")
-            f.write(" trajout {0} restart\n go\n".format("input01.crd"))
+        # determine the AMBER version before starting the processes, that will inherit it
+        amberVersion = int(AmberCalculator._version()[0])
 
-        # run cpptraj
-        with open("cpptrajscript.stdout", "w") as fstdout:
-            subprocess.run(["cpptraj", "-i", "cpptrajscript.01"], stdout=fstdout, stderr=subprocess.STDOUT)
+        # fetch the files of the solvents to the solvent cache before starting the processes, that then find them
+        # there: each file is downloaded once, and the processes do not race to store it in the cache
+        solventDir = os.path.join(calcDir, "solvents")
+        os.mkdir(solventDir)
+        for solvent in sorted({kwargs.get("solvent", "water") for kwargs in arguments}, key=str):
+            solventData = AmberCalculator._AMBERSOLVENTS.get(amberVersion, {}).get(solvent)
+            for filename, source in (solventData[2] if solventData else {}).items():
+                try:
+                    AmberCalculator._solventFile(filename, source, os.path.join(solventDir, filename))
+                except AmberError:  # the failure is reported in the results of the molecules with this solvent
+                    pass
+        shutil.rmtree(solventDir)
 
-        # write second input file for cpptraj (create droplet with spherical radius)
-        with open("cpptrajscript.02", "w") as f:
-            f.write(" parm {0}\n trajin {1}\n reference {1}\n".format("input00.top", "input01.crd"))
-            if spherRad: f.write(" strip :1>:{0} outprefix droplet\n".format(spherRad))
-            f.write(" trajout {0} restart\n go\n".format("input02.crd"))
+        # run the pipelines, serially when a single process is requested
+        if nProcesses == 1:
+            return [AmberCalculator._solvateItem(kwargs) for kwargs in arguments]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=nProcesses) as executor:
+            return list(executor.map(AmberCalculator._solvateItem, arguments))
 
-        # run cpptraj
-        with open("cpptrajscript.stdout", "a") as fstdout:
-            subprocess.run(["cpptraj", "-i", "cpptrajscript.02"], stdout=fstdout, stderr=subprocess.STDOUT)
-        # handling errors, when the processed topology is not present
-        if not os.path.isfile("droplet.input00.top"):
-            with open("cpptrajscript.stdout") as fstdout:
-                cpptrajout = fstdout.read()
-            if "No atoms to strip. Skipping 'strip' for topology 'input00.top'" in cpptrajout:
-                # in this case, it means that the new topology is identical to the old one
-                os.rename("input00.top", "input02.top")
-            else:
-                raise AmberError("cpptraj unknown failure in topology stripping")
-        else:
-            os.rename("droplet.input00.top", "input02.top")
+    # =============================================================================================================
 
-        # now read the processed topology and coordinate file
-        with open("input02.crd", "r") as f:
-            dropletSnapshot = AmberSnapshot.readcrd(f.read())
-        with open("input02.top", "r") as f:
-            dropletTopology = AmberTopology(f.read())
+    @staticmethod
+    def _solvateItem(kwargs):
+        """ Run createSolvatedMolecule for one of the molecules of createSolvatedMolecules, and return
+        the error as an AmberError instance instead of raising it
 
-        # move back to starting directory
-        os.chdir(startDir)
-        # clean up processing directory
-        shutil.rmtree(calcDir)
+        :param kwargs: dictionary with the keyword arguments of createSolvatedMolecule
+        :return: (snapshot, topology) tuple, or AmberError instance when the preparation failed
+        """
 
-        # return snapshot and topology for the droplet
-        return dropletSnapshot, dropletTopology
+        try:
+            return AmberCalculator.createSolvatedMolecule(**kwargs)
+        except AmberError as error:
+            return error
+        except Exception as error:  # any other failure is reported in the same way
+            return AmberError("amberCalculator.createSolvatedMolecule: {0} in {1}: {2}".format(
+                type(error).__name__, kwargs.get("calcDir"), error))
 
     # =============================================================================================================
 
     @staticmethod
-    def extractAtomsAndResidues(topology, snapshot):
-        """Processing the PDB output obtained from the input topology and the input snapshot, this method
-        extracts complete information about the atomic structure: the atomic labels, the atomic coordinates
-        and the assignment of each atom to the residues defined in the topology
+    def solventBox(solvent: str = "water", calcDir: str = "solventBox"):
+        """ Use tleap to save the topology and the snapshot of the pre-equilibrated box of a solvent of the
+        library, to be used with the solvate method.
 
-        :rtype:             (list, list, list)
-        :param topology:    topology of the AMBER data to process in this method
-        :param snapshot:    snapshot of the AMBER data to process in this method
-        :return:            lists with: 1) the atomic symbols, 2) the atomic coords, 3) the residue the atom belongs to
+        :rtype: (AmberSnapshot, AmberTopology)
+        :param solvent:     string with the common name of the solvent
+        :param calcDir:     name of the directory where the processing will be done
+        :return:            snapshot and topology of the solvent box
         """
+        import subprocess  # run external program as child process
 
-        # write topology to file
-        with open("tmp.top", "w") as f:
-            f.write(topology.topotext)
-        # write coordinates and unit cell constants to file
-        with open("tmp.crd", "w") as f:
-            f.write(snapshot.crdtext)
-
-        # create PDB file with ambpdb
-        ambtext = subprocess.run(["ambpdb", "-p", "tmp.top", "-c", "tmp.crd"], check=True, stdout=subprocess.PIPE)
+        # check whether the solvent is available
+        amberVersion = int(AmberCalculator._version()[0])
+        if solvent not in AmberCalculator._AMBERSOLVENTS.get(amberVersion, {}):
+            raise AmberError("amberCalculator.solventBox: solvent {} not available".format(solvent))
+        paramCmd, boxName, files, reference = AmberCalculator._AMBERSOLVENTS[amberVersion][solvent]
 
-        # move back to starting directory and remove temporary one
-        os.remove("tmp.top"), os.remove("tmp.crd")
+        # if the dir already exists, remove first, then create it from scratch
+        if os.path.isdir(calcDir):
+            print("WARNING! overwriting previous " + calcDir + " directory ")
+            shutil.rmtree(calcDir)
+        os.mkdir(calcDir)
 
-        # initialize lists to store the data
-        symbolList = []  # list containing the atomic labels
-        coordsList = []  # list with the atomic coordinates
-        residueList = []  # list with the number of residue to which each atom belongs
+        # get the files with the solvent box definitions, and run leap to save the box
+        for filename, source in files.items():
+            AmberCalculator._solventFile(filename, source, os.path.join(calcDir, filename))
+        with open(os.path.join(calcDir, "leap.script"), "w") as f:
+            f.write(AmberCalculator._LEAP_PREAMBLE[amberVersion] + "\n" + paramCmd + "\n" +
+                    "saveAmberParm {0} box.top box.crd\nquit\n".format(boxName))
+        with open(os.path.join(calcDir, "leap.log"), "w") as fstdout:
+            subprocess.run([AmberCalculator._executable("tleap"), "-f", "leap.script"],
+                           cwd=calcDir, stdout=fstdout, stderr=subprocess.STDOUT)
+
+        # check existence of topology and coordinate file
+        if not os.path.isfile(os.path.join(calcDir, "box.top")) or not os.path.isfile(os.path.join(calcDir, "box.crd")):
+            raise AmberError("amberCalculator.solventBox: tleap failed, see {0}".format(
+                os.path.join(calcDir, "leap.log")))
 
-        # loop over the lines of the PDB file
-        for line in ambtext.stdout.splitlines():
-            if b"END" in line:  # loop until the "END" code is found
-                break
-            elif b"ATOM" in line:  # store the data corresponding to current atom
-                symbolList.append(line[76:78].strip().decode())
-                coordsList.append([float(x) for x in line[30:54].split()])
-                residueList.append(int(line[22:26]))
-            else:  # otherwise, there is nothing to do
-                pass
+        # read coordinates and topology
+        with open(os.path.join(calcDir, "box.top")) as f:
+            topology = AmberTopology(f.read())
+        with open(os.path.join(calcDir, "box.crd")) as f:
+            snapshot = AmberSnapshot.readcrd(f.read())
 
-        return symbolList, coordsList, residueList
+        return snapshot, topology
 
     # =============================================================================================================
 
     @staticmethod
-    def atomlist2amberformat(atomlist):
-        """Convert a list of atoms to an Amber-style string,
-        eg. [1,2,3,5,9,10,11,12] -> '1-3,5,9-12' """
-
-        # first order atomlist
-        atomlist = sorted(atomlist)
-
-        # initialization of lists for start and end of the sequences
-        start, end = [], []
-        # the fist serie of consecutive numbers start with the first element
-        start.append(atomlist[0])
-        # then at each discontinuity in the numbers of atomlist, close the current sequence and start another one
-        for i in range(len(atomlist) - 1):
-            if atomlist[i] != atomlist[i + 1] - 1:
-                start.append(atomlist[i + 1])
-                end.append(atomlist[i])
-        # close the last sequence with the last number
-        end.append(atomlist[-1])
-
-        # now join together the intervals and return the comma-separeted interval string
-        listpieces = [str(s) if s == e else "{0}-{1}".format(s, e) for s, e in zip(start, end)]
-        return "':" + ",".join(listpieces) + "'"
+    def solvate(topology, snapshot, solventTopology, solventSnapshot, solvsize: float, closeness: float = 2.2):
+        """ Solvate a molecule in a truncated octahedron without running tleap: the pre-equilibrated box of
+        the solvent is replicated around the molecule, the solvent residues outside the truncated octahedron
+        and the ones that overlap with the molecule (or with the periodic images of the system) are removed,
+        and the remaining residues are added to the topology. The box is the smallest truncated octahedron
+        with a distance of at least solvsize between the molecule and its faces, as in tleap solvateOct.
 
-    # =============================================================================================================
+        :rtype: (AmberSnapshot, AmberTopology)
+        :param topology:        topology of the molecule to solvate
+        :param snapshot:        snapshot with the coordinates of the molecule
+        :param solventTopology: topology of the solvent box, with identical residues (e.g. from solventBox)
+        :param solventSnapshot: snapshot of the solvent box, with an orthorhombic unit cell
+        :param solvsize:        size of the solvation layer added to the molecule (in Angstrom)
+        :param closeness:       minimum distance (in Angstrom) between the atoms of the solvent and the other atoms
+        :return:                snapshot and topology of the box with the molecule and the solvent
+        """
+        import numpy as np  # numpy: arrays and math utilities
+        from scipy.spatial import cKDTree  # kd-tree for nearest-neighbor lookup
+
+        # the solvent box should be made of identical residues, in an orthorhombic box
+        solventSections = solventTopology.sections
+        nrSolvent = solventSections["POINTERS"][1][11]
+        residueSize = solventSections["POINTERS"][1][0] // nrSolvent
+        if set(solventSections["RESIDUE_LABEL"][1]) != {solventSections["RESIDUE_LABEL"][1][0]} or \
+                np.any(solventSections["RESIDUE_POINTER"][1] != 1 + residueSize * np.arange(nrSolvent)):
+            raise AmberError("amberCalculator.solvate: the solvent box should have identical residues")
+        if solventSnapshot.unitcell is None or not np.allclose(solventSnapshot.unitcell[3:], math.pi / 2.):
+            raise AmberError("amberCalculator.solvate: the solvent box should have an orthorhombic unit cell")
+        boxLengths = np.array(solventSnapshot.unitcell[0:3])
+
+        # residues of the solvent box, made whole by taking the image of each atom closest to the first atom
+        residues = np.array(solventSnapshot.coords, dtype=float).T.reshape(nrSolvent, residueSize, 3)
+        residues -= boxLengths * np.round((residues - residues[:, :1, :]) / boxLengths)
+        # then the centers of the residues are moved inside the box
+        residues -= boxLengths * np.floor(residues.mean(axis=1, keepdims=True) / boxLengths)
+        velocities = None
+        if solventSnapshot.velocity is not None:
+            velocities = np.array(solventSnapshot.velocity, dtype=float).T.reshape(nrSolvent, residueSize, 3)
+
+        # center the molecule at the origin
+        solute = np.array(snapshot.coords, dtype=float).T
+        solute -= 0.5 * (solute.max(axis=0) + solute.min(axis=0))
+
+        # the truncated octahedron is the Wigner-Seitz cell of a lattice with a = b = c and angles of 109.47 deg:
+        # a point x is inside the cell when x . v <= |v|^2 / 2 for all the lattice vectors v of the neighbours
+        angle = math.acos(-1. / 3.)
+        neighbours = np.array([n for n in np.ndindex(3, 3, 3) if n != (1, 1, 1)]) - 1
+        directions = neighbours @ AmberCalculator._latticeVectors([1., 1., 1., angle, angle, angle])
+        norms = np.linalg.norm(directions, axis=1)
+        # edge of the box, such that the distance between the molecule and the faces is at least solvsize
+        boxEdge = np.max(2. * ((solute @ directions.T).max(axis=0) + solvsize * norms) / norms ** 2)
+        lattice = boxEdge * directions
+
+        # replicate the solvent box to cover the sphere circumscribed to the truncated octahedron
+        nrTiles = np.ceil(boxEdge * math.sqrt(5. / 12.) / boxLengths).astype(int)
+        tiles = np.stack(np.meshgrid(*[np.arange(-n, n) for n in nrTiles], indexing="ij"), axis=-1).reshape(-1, 3)
+        centers = residues.mean(axis=1)[None, :, :] + (tiles * boxLengths)[:, None, :]
+        inside = np.all(centers @ lattice.T <= 0.5 * np.sum(lattice ** 2, axis=1), axis=2)
+        tileIndex, residueIndex = np.nonzero(inside)
+        solvent = residues[residueIndex] + (tiles * boxLengths)[tileIndex][:, None, :]
+
+        # remove the solvent residues that overlap with the molecule or with its periodic images
+        images = (solute[None, :, :] + np.concatenate(([np.zeros(3)], lattice))[:, None, :]).reshape(-1, 3)
+        distances = cKDTree(images).query(solvent.reshape(-1, 3), distance_upper_bound=closeness)[0]
+        keep = ~np.any(np.isfinite(distances).reshape(-1, residueSize), axis=1)
+        solvent, residueIndex = solvent[keep], residueIndex[keep]
+
+        # remove the solvent residues with an image that overlaps with other residues: for each pair of opposite
+        # lattice vectors only one is considered, so that only one of the two residues in contact is removed
+        # (only the residues close to the faces of the cell are checked)
+        positive = lattice[[i for i, n in enumerate(neighbours) if n[np.flatnonzero(n)[0]] > 0]]
+        centers = solvent.mean(axis=1)
+        depth = np.min((0.5 * np.sum(lattice ** 2, axis=1) - centers @ lattice.T) / np.linalg.norm(lattice, axis=1),
+                       axis=1)
+        border = np.flatnonzero(depth < closeness + np.max(np.linalg.norm(solvent - centers[:, None, :], axis=2)))
+        shifted = (solvent[border].reshape(-1, 3)[None, :, :] + positive[:, None, :]).reshape(-1, 3)
+        distances = cKDTree(solvent.reshape(-1, 3)).query(shifted, distance_upper_bound=closeness)[0]
+        overlap = np.zeros(len(solvent), dtype=bool)
+        overlap[border] = np.any(np.isfinite(distances).reshape(len(positive), -1, residueSize), axis=(0, 2))
+        solvent, residueIndex = solvent[~overlap], residueIndex[~overlap]
+        print("Solvated molecule with {0} solvent residues in a truncated octahedron of edge {1:.3f} Ang".format(
+            len(solvent), boxEdge))
+
+        # snapshot and topology of the solvated molecule
+        coords = np.concatenate((solute, solvent.reshape(-1, 3))).T
+        velocity = None
+        if snapshot.velocity is not None:
+            solventVelocity = np.zeros(solvent.shape) if velocities is None else velocities[residueIndex]
+            velocity = np.concatenate((np.array(snapshot.velocity, dtype=float).T, solventVelocity.reshape(-1, 3))).T
+        unitcell = np.array([boxEdge] * 3 + [angle] * 3)
+        return AmberSnapshot(coords, unitcell, velocity), topology.addsolvent(solventTopology, len(solvent), unitcell)
+
+    # =============================================================================================================
 
     @staticmethod
-    def amberformat2atomlist(amberformat):
-        """Convert an Amber-style string that defines a list of atoms to the list of atoms with integer indices,
-        eg. '1-3,5,9-12' -> [1,2,3,5,9,10,11,12] """
-
-        # remove starting and ending "/'
-        amberformat = amberformat.strip(" \'\":")
-        # split the string to a list of intervals using comma as separator
-        intervallist = amberformat.split(",")
-
-        # initialize the list
-        atomlist = []
-        # now loop over the intervals
-        for interval in intervallist:
-            if "-" in interval:  # this means that the interval contains more than one element
-                begin, end = [int(i) for i in interval.split("-")]
-                atomlist += list(range(begin, end + 1))
+    def _latticeVectors(unitcell):
+        """ Lattice vectors of a unit cell (lengths in Angstrom and angles in radians, as in AmberSnapshot),
+        with the first vector along x and the second in the xy plane
+
+        :param unitcell: list with the lengths a, b, c and the angles alpha, beta, gamma of the unit cell
+        :return: array with the lattice vectors as rows
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        a, b, c, alpha, beta, gamma = unitcell
+        cy = (math.cos(alpha) - math.cos(beta) * math.cos(gamma)) / math.sin(gamma)
+        return np.array([[a, 0., 0.],
+                         [b * math.cos(gamma), b * math.sin(gamma), 0.],
+                         [c * math.cos(beta), c * cy, c * math.sqrt(1. - math.cos(beta) ** 2 - cy ** 2)]])
+
+    # =============================================================================================================
+
+    @staticmethod
+    def registerSolvent(name: str, boxName: str, files: dict = None, leapCommands: str = "",
+                        reference: str = "user-defined solvent box", amberVersions: list = None):
+        """ Register a new solvent (or replace an existing one) in the library of solvents that can be used in
+        createSolvatedMolecule. The files needed by tleap are defined by a dictionary {filename: source}, where
+        source is a URL or the path of a local file, optionally given together with its sha256 checksum as a
+        tuple (source, checksum). The files are copied to the solvent cache the first time they are used.
+
+        :param name:            common name of the solvent, used as solvent argument of createSolvatedMolecule
+        :param boxName:         name of the solvent box in tleap (e.g. the unit defined in the .off file)
+        :param files:           dictionary with the files that define the solvent box and its parameters
+        :param leapCommands:    tleap commands to load the files, e.g. "loadOff box.off\nloadAmberParams frcmod.box"
+        :param reference:       reference of the force field, printed when the solvent is used
+        :param amberVersions:   list of the AMBER versions for which the solvent is registered (default: all)
+        """
+
+        if amberVersions is None: amberVersions = list(AmberCalculator._LEAP_PREAMBLE.keys())
+        for version in amberVersions:
+            if version not in AmberCalculator._LEAP_PREAMBLE:
+                raise AmberError("amberCalculator.registerSolvent: AMBER v. {} not supported".format(version))
+
+        # local files are stored with their absolute path, and should exist at the moment of the registration
+        library = {}
+        for filename, source in (files or {}).items():
+            address, checksum = AmberCalculator._solventSource(source)
+            if not AmberCalculator._isURL(address):
+                address = os.path.abspath(address)
+                if not os.path.isfile(address):
+                    raise AmberError("amberCalculator.registerSolvent: file {0} not found".format(address))
+            library[filename] = address if checksum is None else (address, checksum)
+
+        for version in amberVersions:
+            AmberCalculator._AMBERSOLVENTS.setdefault(version, {})[name] = [leapCommands, boxName, library, reference]
+
+    # =============================================================================================================
+
+    @staticmethod
+    def seedSolventCache(directory: str):
+        """ Fill the solvent cache with the files found in a local directory, so that the solvents of the library
+        can be used on machines without network access. A file is used for all the registered sources with the
+        same file name, after checking its checksum when this is defined in the library.
+
+        :param directory:   path of the directory with the files of the solvents
+        :return:            list of the names of the files that have been stored in the cache
+        """
+
+        seeded = []
+        for solvents in AmberCalculator._AMBERSOLVENTS.values():
+            for solvent in solvents.values():
+                for filename, source in solvent[2].items():
+                    if os.path.isfile(os.path.join(directory, filename)):
+                        address, checksum = AmberCalculator._solventSource(source)
+                        AmberCalculator._storeSolventFile(filename, address, checksum,
+                                                          os.path.join(directory, filename))
+                        seeded.append(filename)
+
+        return sorted(set(seeded))
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _solventSource(source):
+        """ Split the source of a solvent file in the address (URL or path) and the sha256 checksum (or None) """
+        if isinstance(source, (tuple, list)):
+            return source[0], source[1]
+        return source, None
+
+    @staticmethod
+    def _isURL(address):
+        """ True when the address of a solvent file is a URL, False when it is a local path """
+        return re.match("^[a-z]+://", address) is not None
+
+    @staticmethod
+    def _sha256(fileName):
+        """ Compute the sha256 checksum of a file """
+        digest = hashlib.sha256()
+        with open(fileName, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _solventManifest(address, entry=None):
+        """ Read or update the entry of a source (URL or path) in the manifest of the solvent cache, that stores the
+        file name and the sha256 checksum of the file that has been fetched. Each source has its own file in the
+        manifest directory, named with the sha256 checksum of the source, that is updated with an atomic file
+        replacement: the processes that fetch different files at the same time do not overwrite their entries.
+
+        :param address: source of the file (URL or path)
+        :param entry: dictionary {"filename": name, "sha256": checksum} with the new entry, None to read it
+        :return: dictionary with the entry, empty when the source is not in the manifest
+        """
+        entryFile = AmberCalculator._cachePath(AmberCalculator._SOLVENTCACHENAME, "manifest",
+                                               hashlib.sha256(address.encode()).hexdigest() + ".json")
+
+        if entry is not None:
+            entry = dict(entry, source=address)
+            os.makedirs(os.path.dirname(entryFile), exist_ok=True)
+            with open(entryFile + ".{0}".format(os.getpid()), "w") as f:
+                json.dump(entry, f, indent=1, sort_keys=True)
+            os.replace(entryFile + ".{0}".format(os.getpid()), entryFile)
+            return entry
+
+        try:
+            with open(entryFile, "r") as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        return entry if entry.get("source") == address else {}
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _storeSolventFile(filename, address, checksum, localFile):
+        """ Store a file in the solvent cache, after checking its checksum when this is known. Files are stored
+        with the name of their sha256 checksum, and the manifest links the source of the file to the checksum.
+
+        :param filename: name of the file, as defined in the solvent library
+        :param address: source of the file (URL or path)
+        :param checksum: expected sha256 checksum of the file, None when it is not known
+        :param localFile: path of the file to store
+        :return: path of the file in the cache
+        """
+
+        digest = AmberCalculator._sha256(localFile)
+        if checksum is not None and digest != checksum:
+            raise AmberError("amberCalculator: checksum mismatch for solvent file {0} from {1}".format(
+                filename, address))
+
+        cachedFile = AmberCalculator._cachePath(AmberCalculator._SOLVENTCACHENAME, "files", digest)
+        if not os.path.isfile(cachedFile):
+            os.makedirs(os.path.dirname(cachedFile), exist_ok=True)
+            shutil.copy(localFile, cachedFile + ".{0}".format(os.getpid()))
+            os.replace(cachedFile + ".{0}".format(os.getpid()), cachedFile)
+        AmberCalculator._solventManifest(address, {"filename": filename, "sha256": digest})
+
+        return cachedFile
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _solventFile(filename, source, destination):
+        """ Copy a file of the solvent library to destination. The file is taken from the solvent cache when it
+        is available there with the right checksum, otherwise it is fetched from its source (URL or local path)
+        and stored in the cache. When the checksum is not defined in the library, it is recorded the first time
+        the file is fetched, and then used to check the cached file.
+
+        :param filename: name of the file, as defined in the solvent library
+        :param source: source of the file, address or (address, checksum) tuple
+        :param destination: path where the file is copied
+        """
+
+        address, checksum = AmberCalculator._solventSource(source)
+        if checksum is None:
+            checksum = AmberCalculator._solventManifest(address).get("sha256")
+
+        # use the cached file, when it exists and it is not corrupted
+        if checksum is not None:
+            cachedFile = AmberCalculator._cachePath(AmberCalculator._SOLVENTCACHENAME, "files", checksum)
+            if os.path.isfile(cachedFile) and AmberCalculator._sha256(cachedFile) == checksum:
+                shutil.copy(cachedFile, destination)
+                return
+
+        # otherwise, fetch the file from its source to the destination
+        if AmberCalculator._isURL(address):
+            import urllib.request  # Extensible library for opening URLs
+            print("Downloading solvent file {0} from {1}".format(filename, address))
+            try:
+                urllib.request.urlretrieve(address, destination)
+            except OSError as error:
+                raise AmberError("amberCalculator: cannot download {0} from {1} ({2}), the file can be put in the "
+                                 "solvent cache with seedSolventCache".format(filename, address, error))
+        else:
+            try:
+                shutil.copy(address, destination)
+            except OSError as error:
+                raise AmberError("amberCalculator: cannot read solvent file {0} ({1})".format(address, error))
+
+        # and store it in the cache (a read-only cache is not an error, the file will be fetched again next time)
+        try:
+            AmberCalculator._storeSolventFile(filename, address, checksum, destination)
+        except OSError:
+            pass
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _pdbConnectivity(pdbText):
+        """ Extract the connectivity of a molecule from the CONECT records of a PDB file
+
+        :param pdbText: text of the PDB file
+        :return: sorted list of the bonds, as tuples (i, j) of atom serial numbers with i < j
+        """
+
+        bonds = set()
+        for line in pdbText.splitlines():
+            if line.startswith("CONECT"):
+                # serial numbers are written in fields of 5 characters, starting from column 7
+                fields = [int(line[i:i + 5]) for i in range(6, len(line.rstrip()), 5) if line[i:i + 5].strip()]
+                bonds.update((min(fields[0], j), max(fields[0], j)) for j in fields[1:])
+        return sorted(bonds)
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _moleculeDigest(atomlabels, bonds, netCharge, residueName, amberVersion):
+        """ Compute the key that identifies the parameters of a molecule in the cache: a sha256 digest
+        of the element labels, of the connectivity, of the net charge, of the residue name and of the AMBER version
+
+        :param atomlabels: list of atomic labels
+        :param bonds: list of bonds, as tuples of atom indices
+        :param netCharge: net charge of the molecule
+        :param residueName: name of the residue
+        :param amberVersion: version of AMBER, as list of strings
+        :return: hexadecimal string with the digest
+        """
+
+        description = {"labels": [str(lab).strip().capitalize() for lab in atomlabels],
+                       "bonds": sorted([min(b), max(b)] for b in bonds), "charge": int(netCharge),
+                       "residue": residueName, "amber": ".".join(amberVersion)}
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _mol2Coordinates(mol2Text, coords):
+        """ Replace the coordinates of the atoms in the text of a mol2 file
+
+        :param mol2Text: text of the mol2 file
+        :param coords: list of 3d coordinates for each atom [[x0,y0,z0], ... [x1,y1,z1]]
+        :return: text of the mol2 file with the new coordinates
+        """
+
+        newLines, iAtom, atomSection = [], 0, False
+        for line in mol2Text.splitlines():
+            if line.startswith("@<TRIPOS>"):
+                atomSection = line.strip() == "@<TRIPOS>ATOM"
+            elif atomSection and line.strip():
+                # the fields of the atom line are: id, name, x, y, z, type, residue nr, residue name, charge
+                fields = line.split()
+                if iAtom >= len(coords):
+                    raise AmberError("amberCalculator: inconsistent number of atoms in the cached mol2 file")
+                line = "{0:>7s} {1:<4s} {2:14.4f}{3:11.4f}{4:11.4f} {5:<6s}{6:>5s} {7:<4s} {8:>13s}".format(
+                    fields[0], fields[1], *coords[iAtom], *fields[5:9])
+                iAtom += 1
+            newLines.append(line)
+
+        if iAtom != len(coords):
+            raise AmberError("amberCalculator: inconsistent number of atoms in the cached mol2 file")
+        return "\n".join(newLines) + "\n"
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _storeParameters(cacheDir, workDir):
+        """ Copy the parameters of the molecule from the working directory to the cache. The files are first
+        copied in a temporary directory that is then renamed, so that other processes never find an incomplete
+        set of parameters. When the directory cannot be written, the parameters are simply not cached.
+
+        :param cacheDir: directory of the cache where the parameters are stored
+        :param workDir: directory where the parameters have been computed
+        """
+
+        tmpDir = cacheDir + ".{0}".format(os.getpid())
+        try:
+            os.makedirs(tmpDir, exist_ok=True)
+            for fileName in AmberCalculator._PARAMFILES:
+                shutil.copy(os.path.join(workDir, fileName), os.path.join(tmpDir, fileName))
+            os.rename(tmpDir, cacheDir)
+        except OSError:  # the cache is read-only, or another process has already stored the same parameters
+            shutil.rmtree(tmpDir, ignore_errors=True)
+
+    # =============================================================================================================
+
+    @staticmethod
+    def cutdroplet(topologyfile, snapshot, spherRad: float = None, nrResidue: int = 1, calcDir: str = "tmpDroplet"):
+        """ run AMBER with the initial conditions defined in inputData and store the results in outputData.
+
+        :rtype:                 (AmberSnapshot, AmberTopology)
+        :param topologyfile:    topology of the AMBER data to process in this method
+        :param snapshot:        snapshot of the AMBER data to process in this method
+        :param spherRad:        radius of the final droplet
+        :param nrResidue:       ordinal number (1,2, ...) of the residue at the center of the droplet
+        :param calcDir:         name of the directory where the processing will be done
+        :return:                snapshot and topology of the droplet, cut from the original structure
+        """
+        import subprocess  # run external program as child process
+
+        # store starting dir and move to directory of the calculation
+        startDir = os.getcwd()
+        # then move to the work d where preprocessing files are stored, if the dir exists, remove first
+        if os.path.isdir(calcDir):
+            print("WARNING! overwriting previous " + calcDir + " directory ")
+            shutil.rmtree(calcDir)
+        os.mkdir(calcDir), os.chdir(calcDir)
+
+        # write topology to file
+        with open("input00.top", "w") as f:
+            f.write(topologyfile.topotext)
+        # write coordinates and unit cell constants to file
+        with open("input00.crd", "w") as f:
+            f.write(snapshot.crdtext)
+
+        # write first input file for cpptraj (extract snapshot, center and remap coordinates in the first unit cell)
+        with open("cpptrajscript.01", "w") as f:
+            f.write(" parm {0}\n trajin {1}\n".format("input00.top", "input00.crd"))
+            f.write(" center :{0} \n".format(nrResidue))
+            f.write(" image familiar\n")
+            f.write(" trajout {0} restart\n go\n".format("input01.crd"))
+
+        # run cpptraj
+        with open("cpptrajscript.stdout", "w") as fstdout:
+            subprocess.run([AmberCalculator._executable("cpptraj"), "-i", "cpptrajscript.01"],
+                           stdout=fstdout, stderr=subprocess.STDOUT)
+
+        # write second input file for cpptraj (create droplet with spherical radius)
+        with open("cpptrajscript.02", "w") as f:
+            f.write(" parm {0}\n trajin {1}\n reference {1}\n".format("input00.top", "input01.crd"))
+            if spherRad: f.write(" strip :1>:{0} outprefix droplet\n".format(spherRad))
+            f.write(" trajout {0} restart\n go\n".format("input02.crd"))
+
+        # run cpptraj
+        with open("cpptrajscript.stdout", "a") as fstdout:
+            subprocess.run([AmberCalculator._executable("cpptraj"), "-i", "cpptrajscript.02"],
+                           stdout=fstdout, stderr=subprocess.STDOUT)
+        # handling errors, when the processed topology is not present
+        if not os.path.isfile("droplet.input00.top"):
+            with open("cpptrajscript.stdout") as fstdout:
+                cpptrajout = fstdout.read()
+            if "No atoms to strip. Skipping 'strip' for topology 'input00.top'" in cpptrajout:
+                # in this case, it means that the new topology is identical to the old one
+                os.rename("input00.top", "input02.top")
             else:
-                atomlist.append(int(interval))
+                raise AmberError("cpptraj unknown failure in topology stripping")
+        else:
+            os.rename("droplet.input00.top", "input02.top")
+
+        # now read the processed topology and coordinate file
+        with open("input02.crd", "r") as f:
+            dropletSnapshot = AmberSnapshot.readcrd(f.read())
+        with open("input02.top", "r") as f:
+            dropletTopology = AmberTopology(f.read())
+
+        # move back to starting directory
+        os.chdir(startDir)
+        # clean up processing directory
+        shutil.rmtree(calcDir)
+
+        # return snapshot and topology for the droplet
+        return dropletSnapshot, dropletTopology
+
+    # =============================================================================================================
+
+    @staticmethod
+    def extractAtomsAndResidues(topology, snapshot):
+        """Extract complete information about the atomic structure: the atomic labels, the atomic coordinates
+        and the assignment of each atom to the residues defined in the topology. The data is read directly
+        from the topology and the snapshot (see AmberTopology.atomsandresidues, that returns the same data as
+        arrays): only when the topology has no ATOMIC_NUMBER section, the PDB output of ambpdb is processed.
+
+        :rtype:             (list, list, list)
+        :param topology:    topology of the AMBER data to process in this method
+        :param snapshot:    snapshot of the AMBER data to process in this method
+        :return:            lists with: 1) the atomic symbols, 2) the atomic coords, 3) the residue the atom belongs to
+        """
+        import subprocess  # run external program as child process
+
+        if topology.section("ATOMIC_NUMBER") is not None:
+            symbols, coords, residues = topology.atomsandresidues(snapshot)
+            return symbols.tolist(), coords.tolist(), residues.tolist()
+
+        # write topology to file
+        with open("tmp.top", "w") as f:
+            f.write(topology.topotext)
+        # write coordinates and unit cell constants to file
+        with open("tmp.crd", "w") as f:
+            f.write(snapshot.crdtext)
+
+        # create PDB file with ambpdb
+        ambtext = subprocess.run([AmberCalculator._executable("ambpdb"), "-p", "tmp.top", "-c", "tmp.crd"],
+                                 check=True, stdout=subprocess.PIPE)
+
+        # move back to starting directory and remove temporary one
+        os.remove("tmp.top"), os.remove("tmp.crd")
+
+        # initialize lists to store the data
+        symbolList = []  # list containing the atomic labels
+        coordsList = []  # list with the atomic coordinates
+        residueList = []  # list with the number of residue to which each atom belongs
+
+        # loop over the lines of the PDB file
+        for line in ambtext.stdout.splitlines():
+            if b"END" in line:  # loop until the "END" code is found
+                break
+            elif b"ATOM" in line:  # store the data corresponding to current atom
+                symbolList.append(line[76:78].strip().decode())
+                coordsList.append([float(x) for x in line[30:54].split()])
+                residueList.append(int(line[22:26]))
+            else:  # otherwise, there is nothing to do
+                pass
+
+        return symbolList, coordsList, residueList
+
+    # =============================================================================================================
+
+    @staticmethod
+    def atomlist2amberformat(atomlist):
+        """Convert a list of atoms to an Amber-style string,
+        eg. [1,2,3,5,9,10,11,12] -> '1-3,5,9-12' (see AmberSelection for large selections) """
+        return "'" + AmberSelection.fromatoms(atomlist).mask(prefix=":") + "'"
+
+    # =============================================================================================================
 
-        # now return the list
-        return intervallist
+    @staticmethod
+    def amberformat2atomlist(amberformat):
+        """Convert an Amber-style string that defines a list of atoms to the list of atoms with integer indices,
+        eg. '1-3,5,9-12' -> [1,2,3,5,9,10,11,12] (see AmberSelection for large selections) """
+        return AmberSelection.frommask(amberformat).atoms.tolist()
 
     # =============================================================================================================
 
@@ -557,6 +1503,7 @@ class AmberCalculator:
     def ambermask2atomlist(topologyfile, snapshot, mask, calcDir="amberMask"):
         """Convert an Amber-style string that defines a list of atoms to the list of atoms with integer indices,
         eg. '1-3,5,9-12' -> [1,2,3,5,9,10,11,12]. Use the ambmask Amber utility for the conversion. """
+        import subprocess  # run external program as child process
 
         # check if topologyfile is of AmberTopology type
         if not isinstance(topologyfile, AmberTopology):
@@ -579,8 +1526,9 @@ class AmberCalculator:
             f.write(snapshot.crdtext)
 
         # define command for ambmaks
-        amberCommand = shlex.split("ambmask -p {0} -c {1} -out pdb -find '{2}'".format(
-            os.path.join(calcDir, AmberCalculator.TOPNAME), os.path.join(calcDir, AmberCalculator.CRDNAME), mask))
+        amberCommand = [AmberCalculator._executable("ambmask")] + shlex.split(
+            "-p {0} -c {1} -out pdb -find '{2}'".format(os.path.join(calcDir, AmberCalculator.TOPNAME),
+                                                         os.path.join(calcDir, AmberCalculator.CRDNAME), mask))
         # run ambmaks
         result = subprocess.run(amberCommand, check=True, stdout=subprocess.PIPE)
 
@@ -798,6 +1746,28 @@ class AmberTopology:
     """This small class defines the storage for the topology file (as a string) and implements
     methods to extract information or change the topology."""
 
+    # regular expression of the Fortran format of a section, e.g. (5E16.8): items per line, type, width, decimals
+    _FORMATREGEX = re.compile("\\(([0-9]+)([aAiIeEfF])([0-9]+)(?:\\.([0-9]+))?\\)")
+
+    # sections with one value for each atom
+    _ATOMSECTIONS = ["ATOM_NAME", "CHARGE", "ATOMIC_NUMBER", "MASS", "ATOM_TYPE_INDEX", "NUMBER_EXCLUDED_ATOMS",
+                     "AMBER_ATOM_TYPE", "TREE_CHAIN_CLASSIFICATION", "JOIN_ARRAY", "IROTAT", "RADII", "SCREEN",
+                     "POLARIZABILITY"]
+    # sections with the parameters of bonds, angles, dihedrals and atom types, with the pointer of their number
+    _PARAMSECTIONS = [(["BOND_FORCE_CONSTANT", "BOND_EQUIL_VALUE"], 15),
+                      (["ANGLE_FORCE_CONSTANT", "ANGLE_EQUIL_VALUE"], 16),
+                      (["DIHEDRAL_FORCE_CONSTANT", "DIHEDRAL_PERIODICITY", "DIHEDRAL_PHASE", "SCEE_SCALE_FACTOR",
+                        "SCNB_SCALE_FACTOR"], 17),
+                      (["SOLTY"], 18)]
+    # sections with the lists of bonds, angles and dihedrals: nr of values for each term, pointer of the number
+    # of types, and pointers with the number of terms
+    _BONDSECTIONS = [("BONDS_INC_HYDROGEN", 3, 15, [2]), ("BONDS_WITHOUT_HYDROGEN", 3, 15, [3, 12]),
+                     ("ANGLES_INC_HYDROGEN", 4, 16, [4]), ("ANGLES_WITHOUT_HYDROGEN", 4, 16, [5, 13]),
+                     ("DIHEDRALS_INC_HYDROGEN", 5, 17, [6]), ("DIHEDRALS_WITHOUT_HYDROGEN", 5, 17, [7, 14])]
+
+    # topologies that are shared by the calculations of the same system, by the sha256 digest of their text
+    _SHARED = weakref.WeakValueDictionary()
+
     def __init__(self, topotext):
         """Initialize the instance by storing the text of the topology file."""
 
@@ -805,6 +1775,26 @@ class AmberTopology:
 
     # =============================================================================================================
 
+    @classmethod
+    def shared(cls, topotext):
+        """Return the AmberTopology instance for the text of a topology file, using the same instance (and the same
+        string) for all the equal topologies that are alive in the process. The text that is passed is discarded
+        when an equal topology already exists, so that many calculations of the same system keep a single copy of
+        the topology. As all the methods of AmberTopology, the shared instances should not be modified in place.
+
+        :param topotext: text of the topology file
+        :return: shared AmberTopology instance
+        """
+
+        digest = hashlib.sha256(topotext.encode()).hexdigest()
+        topology = cls._SHARED.get(digest)
+        if topology is None:
+            topology = cls(topotext)
+            cls._SHARED[digest] = topology
+        return topology
+
+    # =============================================================================================================
+
     def __del__(self):
         """Destroy the AmberTopology data"""
         del self.topotext
@@ -885,47 +1875,521 @@ class AmberTopology:
 
         return topatoms
 
+    # =============================================================================================================
 
-# ####################################################################################################7
-
-class AmberSnapshot:
-    """This simple class defines a convenient way to store a single snapshot of
-    an Amber calculation, including the coordinates of the atoms, and possibly
-    their velocities and the unit cell in a calculation with PBCs.
-    The object can be initialized with the standard initializer, using
-    the three arguments explicitely, or the class function 'readfromcrd'
-    can be used, that instantiate AmberSnapshot by reading the data from
-    an input crd file. """
-
-    def __init__(self, coords, unitcell=None, velocity=None):
-        """Define an instance of AmberSnapshot from arguments given explicitely:
-        the coordinates, the unit cell and the velocities. The unit-cell and the
-        velocities can be omitted, in this case it is assumed that the calculation
-        is not periodic (for the unit cell) and that velocity information is
-        not present (for the velocities).
+    def atomsandresidues(self, snapshot):
+        """Extract the atomic symbols, the atomic coordinates and the residue of each atom from the
+        ATOMIC_NUMBER and RESIDUE_POINTER sections of the topology and from a snapshot
 
-        :param coords: input coordinates of the atoms [ [x_0, x_1 ..], [y_0, y_1 ..], [ z_0, z_1 ..] ]
-        :param unitcell: unit cell definition, list of six floats, None if PBC are not present
-        :param velocity: input velocities (same format as coords), None if not velocity is present
+        :param snapshot: AmberSnapshot with the coordinates of the atoms (in Angstrom)
+        :return: arrays with 1) the atomic symbols, 2) the atomic coords with shape (nAtoms, 3), 3) the
+                 number (1, 2, ...) of the residue that each atom belongs to
         """
+        import numpy as np  # numpy: arrays and math utilities
 
-        # store the input variables, coordinates, velocity and topology file
-        self.coords = coords
-        self.unitcell = unitcell
-        self.velocity = velocity
+        atomicNumbers = self.section("ATOMIC_NUMBER")
+        residuePointers = self.section("RESIDUE_POINTER")
+        if atomicNumbers is None or residuePointers is None:
+            raise AmberError("AmberTopology: ATOMIC_NUMBER and RESIDUE_POINTER sections are needed")
+        coords = np.array(snapshot.coords, dtype=float).T
+        if len(coords) != len(atomicNumbers):
+            raise AmberError("AmberTopology: {0} atoms in the snapshot, {1} in the topology".format(
+                len(coords), len(atomicNumbers)))
 
-    # =============================================================================================================
+        # atomic symbols (extra points, with atomic numbers <= 0, have an empty symbol)
+        symbols = np.array(constants.atomicSymbols)[np.where(atomicNumbers > 0, atomicNumbers, 0)]
+        # residue numbers, from the first atom of each residue
+        residueSizes = np.diff(np.append(residuePointers, len(atomicNumbers) + 1))
+        residues = np.repeat(np.arange(1, len(residuePointers) + 1), residueSizes)
 
-    def __del__(self):
-        """Destroy the AmberSnapshot data"""
-        del self.coords
-        del self.unitcell
-        del self.velocity
+        return symbols, coords, residues
 
     # =============================================================================================================
 
-    def __eq__(self, other):
-        """Equality of two instance of the AmberSnapshot class"""
+    @property
+    def sections(self):
+        """Parse all the sections of the Amber topology file, using the Fortran format of each section.
+        Numeric sections are returned as numpy arrays (of integers or floats), text sections as lists of strings.
+
+        :return: dictionary {flag: [format, values]}, with the sections in the order of the topology file
+        """
+
+        sections = {}
+        for block in self.topotext.split("%FLAG")[1:]:  # each block starts with the name of the section
+            flag, fmt, values = AmberTopology._parseSection(block)
+            sections[flag] = [fmt, values]
+
+        return sections
+
+    # =============================================================================================================
+
+    def section(self, flag):
+        """Parse a single section of the Amber topology file, without processing the rest of the file.
+
+        :param flag: name of the section (e.g. CHARGE, RESIDUE_POINTER)
+        :return: numpy array (numeric sections) or list of strings (text sections), None if the section is missing
+        """
+
+        match = re.search("^%FLAG {0}\\s*$".format(flag), self.topotext, re.MULTILINE)
+        if match is None:
+            return None
+        end = self.topotext.find("%FLAG", match.end())
+        block = self.topotext[match.start() + 5:end if end >= 0 else len(self.topotext)]
+        return AmberTopology._parseSection(block)[2]
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _parseSection(block):
+        """Parse the text of a section of the topology file, starting after the %FLAG label
+
+        :param block: text of the section
+        :return: name of the section, format of the section, values (numpy array or list of strings)
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        lines = block.splitlines()
+        flag = lines[0].split()[0]
+        match = AmberTopology._FORMATREGEX.search(lines[1])  # second line is the %FORMAT of the section
+        if match is None:
+            raise AmberError("AmberTopology: unexpected format of the section {0}".format(flag))
+        dataLines = [line for line in lines[2:] if not line.startswith("%COMMENT")]
+        if match.group(2).lower() == "a":
+            # text fields are read with the fixed width defined by the format
+            width = int(match.group(3))
+            values = []
+            for line in dataLines:
+                values += [line[i:i + width].strip() for i in range(0, len(line.rstrip()), width)]
+        elif match.group(2).lower() == "i":
+            values = np.array(" ".join(dataLines).split(), dtype=int)
+        else:
+            values = np.array(" ".join(dataLines).split(), dtype=float)
+
+        return flag, match.group(0)[1:-1], values
+
+    # =============================================================================================================
+
+    @classmethod
+    def fromsections(cls, sections):
+        """Write a new Amber topology file from a dictionary of sections, in the format given by the
+        sections property.
+
+        :param sections: dictionary {flag: [format, values]} with the sections of the topology
+        :return: new AmberTopology instance with the text of the topology file
+        """
+
+        textParts = ["%VERSION  VERSION_STAMP = V0001.000  DATE = {0}{1:16s}\n".format(
+            time.strftime("%m/%d/%y  %H:%M:%S", time.localtime()), "")]
+
+        for flag, (fmt, values) in sections.items():
+            match = AmberTopology._FORMATREGEX.search("(" + fmt + ")")
+            perLine, kind, width = int(match.group(1)), match.group(2).lower(), int(match.group(3))
+            # the whole section is written with a single % operation, with a format string for all the lines
+            field = {"a": "%-{0}.{0}s", "i": "%{0}d", "e": "%{0}.{1}E", "f": "%{0}.{1}f"}[kind].format(
+                width, int(match.group(4) or 0))
+            values = list(values) if kind == "a" else values.tolist()
+            fullLines, lastLine = divmod(len(values), perLine)
+            dataText = (field * perLine + "\n") * fullLines + (field * lastLine + "\n" if lastLine else "")
+            textParts.append("%FLAG {0:74s}\n%FORMAT({1}){2}\n".format(flag, fmt, " " * (71 - len(fmt))))
+            textParts.append((dataText % tuple(values)) if values else "\n")
+
+        return cls("".join(textParts))
+
+    # =============================================================================================================
+
+    def addsolvent(self, solvent, nrResidues, unitcell):
+        """Returns a new Amber topology file in which nrResidues copies of a solvent residue are added after the
+        atoms of this topology, as solvent of a periodic system. The solvent residue is the first residue of
+        the solvent topology, with its parameters: the types of bonds, angles and dihedrals of the solvent are
+        appended to the ones of the solute, and the Lennard-Jones parameters of the solute-solvent pairs are
+        computed with the Lorentz-Berthelot combining rules.
+
+        :param solvent: AmberTopology instance whose first residue defines the solvent molecule
+        :param nrResidues: number of solvent residues to add
+        :param unitcell: unit cell of the periodic system, as in AmberSnapshot (lengths in Ang, angles in rad)
+        :return: new AmberTopology instance with the solvent residues and the periodic box
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        sections, solventSections = self.sections, solvent.sections
+        for top in [sections, solventSections]:
+            if top["POINTERS"][1][20] != 0:
+                raise AmberError("AmberTopology.addsolvent: perturbed topologies are not supported")
+            if "LENNARD_JONES_CCOEF" in top:
+                raise AmberError("AmberTopology.addsolvent: 12-6-4 Lennard-Jones potentials are not supported")
+
+        pointers, solventPointers = sections["POINTERS"][1].copy(), solventSections["POINTERS"][1]
+        nAtoms, nTypes, nResidues = pointers[0], pointers[1], pointers[11]
+        # number of atoms of the solvent residue
+        residueSize = solventSections["RESIDUE_POINTER"][1][1] - 1 if solventPointers[11] > 1 else solventPointers[0]
+        # position of the first atom of each copy of the solvent residue
+        offsets = nAtoms + residueSize * np.arange(nrResidues)
+
+        # solvent pointers and molecules of the solute: the solvent residues will be added as new molecules
+        if "SOLVENT_POINTERS" in sections:
+            solventPtr = sections["SOLVENT_POINTERS"][1].copy()
+            molecules = sections["ATOMS_PER_MOLECULE"][1]
+        else:
+            molecules = AmberTopology._molecules(sections, nAtoms)
+            solventPtr = np.array([nResidues, len(molecules), len(molecules) + 1])
+
+        def extend(flag, newValues):
+            if isinstance(sections[flag][1], list):
+                sections[flag][1] = sections[flag][1] + list(newValues)
+            else:
+                sections[flag][1] = np.concatenate((sections[flag][1], np.asarray(newValues)))
+
+        # atomic properties: the ones of the solvent residue are repeated for each copy of the residue
+        for flag in AmberTopology._ATOMSECTIONS:
+            if flag not in sections:
+                continue
+            if flag not in solventSections:
+                raise AmberError("AmberTopology.addsolvent: section {0} not found in the solvent".format(flag))
+            residueValues = solventSections[flag][1][:residueSize]
+            if flag == "ATOM_TYPE_INDEX":
+                residueValues = residueValues + nTypes
+            if isinstance(residueValues, list):
+                extend(flag, residueValues * nrResidues)
+            else:
+                extend(flag, np.tile(residueValues, nrResidues))
+
+        # residues
+        extend("RESIDUE_LABEL", [solventSections["RESIDUE_LABEL"][1][0]] * nrResidues)
+        extend("RESIDUE_POINTER", offsets + 1)
+        pointers[11] += nrResidues
+        pointers[28] = max(pointers[28], residueSize)
+
+        # parameters of bonds, angles and dihedrals: the types of the solvent follow the ones of the solute
+        for flags, pointer in AmberTopology._PARAMSECTIONS:
+            for flag in flags:
+                if (flag in sections) != (flag in solventSections):
+                    raise AmberError("AmberTopology.addsolvent: section {0} not found in both topologies".format(flag))
+                if flag in sections:
+                    extend(flag, solventSections[flag][1])
+            pointers[pointer] += solventPointers[pointer]
+
+        # bonds, angles and dihedrals of the solvent residue (atom indices are stored as 3*(index-1))
+        for flag, length, typePointer, counters in AmberTopology._BONDSECTIONS:
+            terms = solventSections[flag][1].reshape(-1, length)
+            terms = terms[np.all(np.abs(terms[:, :-1]) < 3 * residueSize, axis=1)]
+            atoms = np.abs(terms[:, :-1])[None, :, :] + 3 * offsets[:, None, None]
+            atoms = np.where(terms[:, :-1] < 0, -atoms, atoms)  # the sign of the indices is a flag for dihedrals
+            types = np.broadcast_to(terms[:, -1:] + pointers[typePointer] - solventPointers[typePointer],
+                                    atoms.shape[:2] + (1,))
+            extend(flag, np.concatenate((atoms, types), axis=2).reshape(-1))
+            for counter in counters:
+                pointers[counter] += nrResidues * len(terms)
+
+        # list of the excluded atoms, with indices starting from 1 and 0 as placeholder for atoms with no exclusion
+        excluded = solventSections["EXCLUDED_ATOMS_LIST"][1][:np.sum(solventSections["NUMBER_EXCLUDED_ATOMS"][1][
+                                                                       :residueSize])]
+        excluded = np.where(excluded[None, :] > 0, excluded[None, :] + offsets[:, None], 0)
+        extend("EXCLUDED_ATOMS_LIST", excluded.reshape(-1))
+        pointers[10] = len(sections["EXCLUDED_ATOMS_LIST"][1])
+
+        # Lennard-Jones parameters, with the combining rules for the pairs of solute and solvent types
+        coefA, coefB, hbond = AmberTopology._combineLennardJones(sections, solventSections)
+        nTypes = len(coefA)
+        lower = np.tril_indices(nTypes)
+        index = np.maximum.outer(np.arange(nTypes), np.arange(nTypes))
+        index = index * (index + 1) // 2 + np.minimum.outer(np.arange(nTypes), np.arange(nTypes)) + 1
+        sections["NONBONDED_PARM_INDEX"][1] = np.where(hbond < 0, hbond, index).reshape(-1)
+        sections["LENNARD_JONES_ACOEF"][1] = coefA[lower]
+        sections["LENNARD_JONES_BCOEF"][1] = coefB[lower]
+        pointers[1] = nTypes
+
+        # 10-12 hydrogen bond parameters (referenced by negative values of NONBONDED_PARM_INDEX)
+        for flag in ["HBOND_ACOEF", "HBOND_BCOEF", "HBCUT"]:
+            extend(flag, solventSections[flag][1])
+        pointers[19] += solventPointers[19]
+
+        # extra points of the solvent (e.g. in the TIP4P water model)
+        if solventPointers[30] > 0:
+            pointers[30] += nrResidues * solventPointers[30] // solventPointers[11]
+        pointers[0] += nrResidues * residueSize
+
+        # sections of the periodic box
+        solventPtr[1] += nrResidues
+        boxSections = {"SOLVENT_POINTERS": ["3I8", solventPtr],
+                       "ATOMS_PER_MOLECULE": ["10I8", np.concatenate((molecules, [residueSize] * nrResidues))],
+                       "BOX_DIMENSIONS": ["5E16.8", np.array([unitcell[4] / constants.Deg2Rad] + list(unitcell[:3]))]}
+        pointers[27] = 2 if abs(unitcell[4] / constants.Deg2Rad - 109.4712206) < 1.e-4 else 1
+
+        # now collect the sections, the box sections are put after IROTAT when they are not already defined
+        sections["POINTERS"][1] = pointers
+        newSections, missing = {}, {flag: s for flag, s in boxSections.items() if flag not in sections}
+        for flag, section in sections.items():
+            newSections[flag] = boxSections.get(flag, section)
+            if flag == "IROTAT":
+                newSections.update(missing)
+                missing = {}
+        newSections.update(missing)
+
+        return AmberTopology.fromsections(newSections)
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _combineLennardJones(sections, solventSections):
+        """Build the matrices of the Lennard-Jones A and B coefficients for the atom types of the solute followed
+        by the atom types of the solvent. The coefficients of the solute-solute and solvent-solvent pairs are the
+        original ones, while the solute-solvent coefficients are computed from the parameters of the single types
+        with the Lorentz-Berthelot combining rules. The pairs with a 10-12 hydrogen bond potential are returned
+        in a third matrix, with the negative index of the HBOND coefficients (0 for Lennard-Jones pairs). """
+        import numpy as np  # numpy: arrays and math utilities
+
+        matrices, hbonds = [], []
+        for top, hbondOffset in [(sections, 0), (solventSections, sections["POINTERS"][1][19])]:
+            nTypes = top["POINTERS"][1][1]
+            index = top["NONBONDED_PARM_INDEX"][1].reshape(nTypes, nTypes)
+            # the LJ coefficients of the hydrogen bond pairs are zero
+            lj = np.where(index > 0, index - 1, 0)
+            matrices.append((np.where(index > 0, top["LENNARD_JONES_ACOEF"][1][lj], 0.),
+                             np.where(index > 0, top["LENNARD_JONES_BCOEF"][1][lj], 0.)))
+            hbonds.append(np.where(index < 0, index - hbondOffset, 0))
+
+        # radius and well depth of each type, from A = eps * rmin^12 and B = 2 * eps * rmin^6
+        radii, depths = [], []
+        for coefA, coefB in matrices:
+            diagA, diagB = np.diag(coefA), np.diag(coefB)
+            nonzero = (diagA > 0.) & (diagB > 0.)
+            radii.append(np.where(nonzero, (2. * diagA / np.where(nonzero, diagB, 1.)) ** (1. / 6.), 0.))
+            depths.append(np.where(nonzero, diagB ** 2 / (4. * np.where(nonzero, diagA, 1.)), 0.))
+        rmin = 0.5 * np.add.outer(radii[0], radii[1])
+        eps = np.sqrt(np.multiply.outer(depths[0], depths[1]))
+
+        coefA = np.block([[matrices[0][0], eps * rmin ** 12], [(eps * rmin ** 12).T, matrices[1][0]]])
+        coefB = np.block([[matrices[0][1], 2. * eps * rmin ** 6], [(2. * eps * rmin ** 6).T, matrices[1][1]]])
+        hbond = np.block([[hbonds[0], np.zeros(eps.shape, dtype=int)], [np.zeros(eps.T.shape, dtype=int), hbonds[1]]])
+        return coefA, coefB, hbond
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _molecules(sections, nAtoms):
+        """Number of atoms of the molecules of a topology, defined as sets of consecutive atoms that are
+        connected by bonds """
+        import numpy as np  # numpy: arrays and math utilities
+        from scipy.sparse import coo_matrix  # sparse matrix in coordinate format
+        from scipy.sparse.csgraph import connected_components  # connected components of a sparse graph
+
+        bonds = np.concatenate([sections[flag][1].reshape(-1, 3)[:, :2] // 3
+                                for flag in ["BONDS_INC_HYDROGEN", "BONDS_WITHOUT_HYDROGEN"]])
+        graph = coo_matrix((np.ones(len(bonds)), (bonds[:, 0], bonds[:, 1])), shape=(nAtoms, nAtoms))
+        labels = connected_components(graph, directed=False)[1]
+        starts = np.concatenate(([0], np.flatnonzero(labels[1:] != labels[:-1]) + 1, [nAtoms]))
+        return np.diff(starts)
+
+
+# ####################################################################################################7
+
+class AmberSelection:
+    """This class defines a selection of atoms (or residues), stored in compact form as a sorted list of
+    disjoint intervals of consecutive Amber numbers (starting from 1), as in the Amber masks like '1-3,5,9-12'.
+    Selections can be combined with the set operators | (union), & (intersection) and - (difference),
+    and converted to and from numpy arrays of indices without expanding them to python lists."""
+
+    # regular expressions of an Amber mask of numbers, and of its elements: single numbers or intervals
+    _MASKREGEX = re.compile("^[:@]?([0-9]+(-[0-9]+)?(,[0-9]+(-[0-9]+)?)*)?$")
+    _INTERVALREGEX = re.compile("([0-9]+)(?:-([0-9]+))?")
+
+    def __init__(self, starts=(), ends=()):
+        """Define an instance of AmberSelection from the first and the last numbers of the intervals
+        (the last number is included in the interval, as in the Amber masks). The intervals can be
+        given in any order, and can overlap.
+
+        :param starts: first Amber number of each interval
+        :param ends: last Amber number of each interval
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        starts, ends = np.asarray(starts, dtype=np.int64).reshape(-1), np.asarray(ends, dtype=np.int64).reshape(-1)
+        if len(starts) != len(ends) or np.any(ends < starts):
+            raise AmberError("AmberSelection: invalid definition of the intervals")
+
+        # the intervals are stored as half-open intervals [start, stop), merging the overlapping and adjacent ones
+        order = np.argsort(starts, kind="stable")
+        starts, stops = starts[order], ends[order] + 1
+        reach = np.maximum.accumulate(stops) if len(stops) else stops
+        first = np.concatenate(([True], starts[1:] > reach[:-1])) if len(starts) else np.zeros(0, dtype=bool)
+        self.starts = starts[first]
+        self.stops = reach[np.append(np.flatnonzero(first)[1:] - 1, len(starts) - 1)] if len(starts) else reach
+
+    # =============================================================================================================
+
+    @classmethod
+    def fromatoms(cls, atoms):
+        """Define the selection from a list or an array of Amber numbers (starting from 1), e.g. [1,2,3,5] """
+        import numpy as np  # numpy: arrays and math utilities
+
+        atoms = np.asarray(atoms, dtype=np.int64).reshape(-1)
+        if np.any(atoms[1:] < atoms[:-1]):  # sort only when needed, the indices often come from a sorted array
+            atoms = np.sort(atoms)
+        # the intervals are broken where the difference of consecutive numbers is larger than 1
+        breaks = np.flatnonzero(np.diff(atoms) > 1)
+        return cls(np.append(atoms[:1], atoms[breaks + 1]), np.append(atoms[breaks], atoms[-1:]))
+
+    @classmethod
+    def fromindices(cls, indices):
+        """Define the selection from a list or an array of indices starting from 0 (e.g. from numpy.flatnonzero) """
+        import numpy as np  # numpy: arrays and math utilities
+        return cls.fromatoms(np.asarray(indices, dtype=np.int64) + 1)
+
+    @classmethod
+    def frommask(cls, mask):
+        """Define the selection from an Amber-style string, e.g. '1-3,5,9-12', ':1-3,5' or '@1-3,5' """
+
+        mask = mask.strip(" \'\"")
+        if not cls._MASKREGEX.match(mask):
+            raise AmberError("AmberSelection: {0} is not an Amber mask of atom or residue numbers".format(mask))
+        intervals = cls._INTERVALREGEX.findall(mask)
+        return cls([int(s) for s, e in intervals], [int(e or s) for s, e in intervals])
+
+    # =============================================================================================================
+
+    @property
+    def atoms(self):
+        """Array with the Amber numbers (starting from 1) of the selection """
+        import numpy as np  # numpy: arrays and math utilities
+
+        # each element is the start of its interval plus its position within the interval
+        lengths = self.stops - self.starts
+        offsets = np.repeat(self.starts - np.cumsum(lengths) + lengths, lengths)
+        return np.arange(len(offsets), dtype=np.int64) + offsets
+
+    @property
+    def indices(self):
+        """Array with the indices (starting from 0) of the selection, to be used with numpy arrays """
+        return self.atoms - 1
+
+    def mask(self, prefix=""):
+        """Amber-style string of the selection, e.g. '1-3,5,9-12'
+
+        :param prefix: prefix of the mask, e.g. ':' for residues and '@' for atoms
+        :return: string with the mask
+        """
+        return prefix + ",".join(str(s) if s == e else "{0}-{1}".format(s, e)
+                                 for s, e in zip(self.starts.tolist(), (self.stops - 1).tolist()))
+
+    # =============================================================================================================
+
+    def contains(self, atoms):
+        """Vectorized membership test
+
+        :param atoms: array of Amber numbers (starting from 1)
+        :return: boolean array, True for the numbers that belong to the selection
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        atoms = np.asarray(atoms, dtype=np.int64)
+        interval = np.searchsorted(self.starts, atoms, side="right") - 1
+        return (interval >= 0) & (atoms < self.stops[np.maximum(interval, 0)] if len(self.stops) else False)
+
+    def __contains__(self, atom):
+        return bool(self.contains(atom))
+
+    def __len__(self):
+        return int((self.stops - self.starts).sum())
+
+    def __iter__(self):
+        return iter(self.atoms.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, AmberSelection):
+            return len(self.starts) == len(other.starts) and bool((self.starts == other.starts).all()) and \
+                   bool((self.stops == other.stops).all())
+        return NotImplemented
+
+    def __repr__(self):
+        return "AmberSelection('{0}')".format(self.mask())
+
+    # =============================================================================================================
+
+    def _combine(self, other, operation):
+        """Combine two selections: the boundaries of the intervals of both selections divide the numbers in
+        segments, that belong to the result when operation(in self, in other) is True. The boundaries are
+        merged with a stable sort of the four sorted arrays, and the coverage of each selection is the
+        cumulative sum of +1 at the starts and -1 at the ends of its intervals. """
+        import numpy as np  # numpy: arrays and math utilities
+
+        if not isinstance(other, AmberSelection):
+            return NotImplemented
+        bounds = np.concatenate((self.starts, self.stops, other.starts, other.stops))
+        if len(bounds) == 0:
+            return AmberSelection()
+        sizes = [len(self.starts), len(other.starts)]
+        inSelf = np.concatenate((np.ones(sizes[0], dtype=np.int8), -np.ones(sizes[0], dtype=np.int8),
+                                 np.zeros(2 * sizes[1], dtype=np.int8)))
+        inOther = np.concatenate((np.zeros(2 * sizes[0], dtype=np.int8), np.ones(sizes[1], dtype=np.int8),
+                                  -np.ones(sizes[1], dtype=np.int8)))
+
+        order = np.argsort(bounds, kind="stable")
+        bounds, inSelf, inOther = bounds[order], np.cumsum(inSelf[order]), np.cumsum(inOther[order])
+        # when more boundaries are at the same number, the coverage after the last one is used
+        last = np.append(bounds[1:] != bounds[:-1], True)
+        bounds, inSelf, inOther = bounds[last], inSelf[last], inOther[last]
+
+        keep = operation(inSelf[:-1] > 0, inOther[:-1] > 0)
+        return AmberSelection(bounds[:-1][keep], bounds[1:][keep] - 1)
+
+    # =============================================================================================================
+
+    def __or__(self, other):
+        import numpy as np  # numpy: arrays and math utilities
+        return self._combine(other, np.logical_or)
+
+    def __and__(self, other):
+        import numpy as np  # numpy: arrays and math utilities
+        return self._combine(other, np.logical_and)
+
+    def __sub__(self, other):
+        return self._combine(other, lambda a, b: a & ~b)
+
+    def __xor__(self, other):
+        import numpy as np  # numpy: arrays and math utilities
+        return self._combine(other, np.logical_xor)
+
+
+# ####################################################################################################7
+
+class AmberSnapshot:
+    """This simple class defines a convenient way to store a single snapshot of
+    an Amber calculation, including the coordinates of the atoms, and possibly
+    their velocities and the unit cell in a calculation with PBCs.
+    The object can be initialized with the standard initializer, using
+    the three arguments explicitely, or the class function 'readfromcrd'
+    can be used, that instantiate AmberSnapshot by reading the data from
+    an input crd file. """
+
+    def __init__(self, coords, unitcell=None, velocity=None):
+        """Define an instance of AmberSnapshot from arguments given explicitely:
+        the coordinates, the unit cell and the velocities. The unit-cell and the
+        velocities can be omitted, in this case it is assumed that the calculation
+        is not periodic (for the unit cell) and that velocity information is
+        not present (for the velocities).
+
+        :param coords: input coordinates of the atoms [ [x_0, x_1 ..], [y_0, y_1 ..], [ z_0, z_1 ..] ]
+        :param unitcell: unit cell definition, list of six floats, None if PBC are not present
+        :param velocity: input velocities (same format as coords), None if not velocity is present
+        """
+
+        # store the input variables, coordinates, velocity and topology file
+        self.coords = coords
+        self.unitcell = unitcell
+        self.velocity = velocity
+
+    # =============================================================================================================
+
+    def __del__(self):
+        """Destroy the AmberSnapshot data"""
+        del self.coords
+        del self.unitcell
+        del self.velocity
+
+    # =============================================================================================================
+
+    def __eq__(self, other):
+        """Equality of two instance of the AmberSnapshot class"""
 
         if isinstance(other, AmberSnapshot):
             return self._identicalData(self.coords, other.coords) and \
@@ -940,6 +2404,7 @@ class AmberSnapshot:
         """Extend the comparison between two variables, as defined in the numpy function np.allclose(),
          by considering the case in which one of the two variables or both can assume a None value.
          When the two variables are both None, the variables are considered equal."""
+        import numpy as np  # numpy: arrays and math utilities
 
         if var1 is None and var2 is None:  # when both variables are None, return True
             return True
@@ -961,6 +2426,7 @@ class AmberSnapshot:
         :param crdText: text of the CRD file
         :return: AmberSnapshot with the data read from the crd file
         """
+        import numpy as np  # numpy: arrays and math utilities
 
         crdLines = crdText.splitlines()  # process text line by line
 
@@ -1018,6 +2484,7 @@ class AmberSnapshot:
 
         :return: string with the text of the CRD file with the data from AmberSnapshot
         """
+        import numpy as np  # numpy: arrays and math utilities
 
         crdText = ""  # initialize string of the crd text
 
@@ -1052,19 +2519,211 @@ class AmberSnapshot:
         return crdText
 
 
+#####################################################################################################
+
+class AmberTrajectory:
+    """The AmberTrajectory class stores a sequence of snapshots of an Amber calculation in stacked arrays,
+    with the frames along the first axis. The arrays have the same format of AmberSnapshot, with a frame
+    index in front: the coordinates (Ang) and the velocities (au) are [frame][X/Y/Z][atom] and the unit cells
+    (Ang + rad) are [frame][6]. The velocities and the unit cells are None when they are not present.
+    Indexing with an integer returns an AmberSnapshot, that is a view on the data of the trajectory. """
+
+    def __init__(self, coords, unitcell=None, velocity=None, frames=None):
+        """Define an instance of AmberTrajectory from the stacked arrays of the snapshots.
+
+        :param coords: array with the coordinates of the atoms, shape (nframes, 3, natoms)
+        :param unitcell: array with the unit cells, shape (nframes, 6), None if PBC are not present
+        :param velocity: array with the velocities (same shape as coords), None if not velocity is present
+        :param frames: array with the indices of the frames in the mdcrd file, None when they are unknown
+        """
+
+        self.coords = coords
+        self.unitcell = unitcell
+        self.velocity = velocity
+        self.frames = frames
+
+    # =============================================================================================================
+
+    @classmethod
+    def concatenate(cls, trajectories):
+        """Join a list of trajectories in a single AmberTrajectory, the velocities and the unit cells are
+        kept only when they are present in all the trajectories.
+
+        :param trajectories: list of AmberTrajectory instances
+        :return: AmberTrajectory with the frames of all the trajectories
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        def join(arrays):
+            return None if any(a is None for a in arrays) else np.concatenate(arrays)
+
+        return cls(np.concatenate([t.coords for t in trajectories]), join([t.unitcell for t in trajectories]),
+                   join([t.velocity for t in trajectories]), join([t.frames for t in trajectories]))
+
+    # =============================================================================================================
+
+    def __len__(self):
+        """Number of frames of the trajectory"""
+        return len(self.coords)
+
+    def __getitem__(self, item):
+        """Return the snapshot with index item, or a new AmberTrajectory when item is a slice or an index array"""
+        if isinstance(item, numbers.Integral):
+            return AmberSnapshot(self.coords[item], None if self.unitcell is None else self.unitcell[item],
+                                 None if self.velocity is None else self.velocity[item])
+        return AmberTrajectory(self.coords[item], None if self.unitcell is None else self.unitcell[item],
+                               None if self.velocity is None else self.velocity[item],
+                               None if self.frames is None else self.frames[item])
+
+    def __iter__(self):
+        """Iterate over the snapshots of the trajectory"""
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return "AmberTrajectory({0} frames, {1} atoms)".format(len(self), self.coords.shape[2])
+
+
+#####################################################################################################
+
+class AmberGradient:
+    """The AmberGradient class gives access to the gradient of the energy stored as forces in the mdcrd files
+    of an Amber MD calculation, without reading the whole trajectory in memory. The gradient (in au) of a frame
+    is read from the file and converted only when it is requested, with shape [atom][X/Y/Z]: the frames can
+    be accessed with an index, a slice or an index array, or one at a time by iterating over the instance.
+    The most recently used frames are kept in a small cache. The whole array is created only when it is
+    explicitly requested, e.g. with numpy.asarray(gradient). """
+
+    # number of frames that are kept in the cache
+    _CACHESIZE = 16
+
+    def __init__(self, forces, dtype=None):
+        """Define an instance of AmberGradient from the forces variables of the mdcrd files.
+
+        :param forces: list of variables (NetCDF3Variable) with the forces, the frames are concatenated
+        :param dtype: floating point type of the gradient, float64 when it is None
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        self._forces = forces
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
+        # index of the first frame of each variable
+        self._offsets = np.cumsum([0] + [len(f) for f in forces])
+        self._cache = collections.OrderedDict()
+
+    # =============================================================================================================
+
+    @property
+    def shape(self):
+        """Shape of the whole gradient, (frames, atoms, 3)"""
+        return (int(self._offsets[-1]),) + tuple(self._forces[0].shape[1:])
+
+    def __len__(self):
+        """Number of frames of the gradient"""
+        return int(self._offsets[-1])
+
+    def astype(self, dtype):
+        """Return an AmberGradient that gives the gradient with the floating point type dtype (e.g. numpy.float32)"""
+        return AmberGradient(self._forces, dtype)
+
+    # =============================================================================================================
+
+    def _frame(self, nrFrame, out=None):
+        """Read the gradient of the frame nrFrame from the file, and convert it to au in the array out"""
+        import numpy as np  # numpy: arrays and math utilities
+
+        nrVariable = int(np.searchsorted(self._offsets, nrFrame, side="right")) - 1
+        forces = self._forces[nrVariable]
+        if out is None:
+            out = np.empty(forces.shape[1:], dtype=self.dtype)
+        AmberOutput._toAtomicUnits(forces.data[nrFrame - self._offsets[nrVariable]], forces.units, out=out)
+        return np.negative(out, out=out)
+
+    def __getitem__(self, item):
+        """Gradient of a frame, or stacked gradients of many frames when item is a slice or an index array.
+        With a tuple, the first element selects the frames and the others index the gradient of the frames."""
+        import numpy as np  # numpy: arrays and math utilities
+
+        if isinstance(item, tuple):
+            frames = self[item[0]]
+            return frames[item[1:]] if isinstance(item[0], numbers.Integral) else frames[(slice(None),) + item[1:]]
+
+        if isinstance(item, numbers.Integral):
+            nrFrame = operator.index(item) + (len(self) if item < 0 else 0)
+            if not 0 <= nrFrame < len(self):
+                raise IndexError("frame {0} is out of range for a gradient of {1} frames".format(item, len(self)))
+            if nrFrame not in self._cache:
+                # the arrays in the cache are shared between the calls, and they are read-only
+                self._cache[nrFrame] = self._frame(nrFrame)
+                self._cache[nrFrame].flags.writeable = False
+                if len(self._cache) > AmberGradient._CACHESIZE: self._cache.popitem(last=False)
+            self._cache.move_to_end(nrFrame)
+            return self._cache[nrFrame]
+
+        frames = range(len(self))[item] if isinstance(item, slice) else np.atleast_1d(np.arange(len(self))[item])
+        gradient = np.empty((len(frames),) + self.shape[1:], dtype=self.dtype)
+        for i, nrFrame in enumerate(frames):
+            self._frame(nrFrame, out=gradient[i])
+        return gradient
+
+    def __iter__(self):
+        """Iterate over the gradients of the frames, that are read one at a time"""
+        for nrFrame in range(len(self)):
+            yield self._frame(nrFrame)
+
+    def __array__(self, dtype=None, copy=None):
+        """Create the array with the whole gradient"""
+        gradient = self[:]
+        return gradient if dtype is None else gradient.astype(dtype, copy=False)
+
+    def __repr__(self):
+        return "AmberGradient({0} frames, {1} atoms, {2})".format(self.shape[0], self.shape[1], self.dtype)
+
+
 #####################################################################################################
 
 class AmberOutput:
     """The AmberOutput class defines the object that stores output information collected from an Amber output file."""
 
-    def __init__(self, outDir, storeFiles=False):
+    # strings of the Amber log file that mark a calculation that has been completed successfully
+    _SUCCESSMARKS = ["Maximum number of minimization cycles reached.", "5.  TIMINGS"]
+
+    # dictionaries {step(nr/time): value} that are created from the records when they are requested: for each
+    # type of calculation, the column of the keys and of the values, with the factors that convert them to au
+    _RECORDVIEWS = {("opt", "energy"): ("NSTEP", 1, "ENERGY", 1. / constants.Hatree2kcalmol),
+                    ("MD", "energy"): ("TIME", constants.ps2au, "Etot", 1. / constants.Hatree2kcalmol),
+                    ("MD", "temperature"): ("TIME", constants.ps2au, "TEMP", 1.),
+                    ("MD", "pressure"): ("TIME", constants.ps2au, "PRESS", 1.),
+                    ("MD", "volume"): ("TIME", constants.ps2au, "VOLUME", 1. / constants.Bohr2Ang ** 3)}
+
+    # factors that convert the data read from NetCDF files to the units used internally by COBRAMM
+    # WARNING!!!!! despite the units that are written to the NETCDF file, the numbers for the
+    # atom velocities are stored in the usual AKMA system of units.
+    # this means that the conversion factor is  1 / constants.Bohr2Ang / constants.MDtime2au
+    # and not 1 / constants.Bohr2Ang / constants.ps2au
+    _UNITFACTORS = {"angstrom": 1.0,
+                    "angstrom/picosecond": 1.0 / constants.Bohr2Ang / constants.MDtime2au,
+                    "degree": constants.Deg2Rad,
+                    "kilocalorie/mole/angstrom": 1.0 / constants.Hatree2kcalmol * constants.Bohr2Ang}
+
+    def __init__(self, outDir, storeFiles=False, keepLog=False, lean=False):
         """ Constructor of the AmberOutput instance. Needs as argument the path of the directory where the
          calculation is stored. The logical variables storeFiles defines whether the Amber files are removed or not
          when cleaning the AmberOutput instance. It should be set to true when the user is interested in keeping
-          the original Amber files for future analysis of the results.
-
-         :param outDir:  path of the directory where the calculation is stored
-         :param storeFiles: Amber files are removed or not when cleaning the AmberOutput instance
+          the original Amber files for future analysis of the results. The log file is parsed line by line and
+          its text is kept in memory only when keepLog is True, otherwise it is read again when logtext is requested.
+          With lean, the instance keeps only the records, the timings and the paths of the files, for scans with
+          many calculations: the topology is shared with the other calculations of the same system (see
+          AmberTopology.shared), the log is never kept, and energy, temperature, pressure and volume are created
+          from the records at each request instead of being stored.
+          The calculation can be read also from an archive written by writeArchive, or from a tar or zip archive
+          (e.g. runs.tar.gz, or runs.tar.gz/run01 for a directory of the archive), without extracting it:
+          archives are never removed.
+
+         :param outDir:  path of the directory where the calculation is stored, or path of the archive
+         :param storeFiles: Amber files are removed or not when closing the AmberOutput instance (see close)
+         :param keepLog: store the whole text of the log file in the AmberOutput instance (ignored with lean)
+         :param lean: keep in memory only the records of the calculation and share the topology
          """
 
         # initialize storeFiles to True, in this way when the constructor dyes unexpectedly we can save the files
@@ -1072,177 +2731,516 @@ class AmberOutput:
 
         # store the path of the directory where the Amber files are read
         self.outDir = outDir
+        # archive of the calculation, when the files are read from an archive instead of a directory
+        self._archive = None
+        # NetCDF files (mdcrd and restrt) that have been opened to read the snapshots
+        self._netcdfFiles = {}
+        # steps of an optimization that are stored in the mdcrd file, in the order of the frames
+        self._storedSteps = None
+        # access to the gradient stored in the mdcrd file
+        self._gradient = None
+        # keep in memory only the records, and the topology shared with the other calculations of the system
+        self._lean = lean
+        self._topology = None
+        # the files have been closed, and the directory has been removed when storeFiles is False
+        self._closed = False
+        _CLEANUP.track(self)
 
         # setup a dictionary that will be used to store the data read from Amber output
         self.dataDict = {
             "type": None,  # the calculation is an optimization or a MD run
             "topology": None,  # topology file of the system
-            "logtext": None,  # log file of the amber calculation
+            "logtext": None,  # log file of the amber calculation (only when keepLog is True)
             "mdcrdstart": None,  # nr of the first step that should be found in the mdcrd file
             "mdcrdfile": None,  # path of the mdcrd file
             "restrtfile": None,  # path of the restrt file
-            "energy": None,  # dictionary of the values of total energy {step(nr/time):Energy}
-            "temperature": None,  # dictionary of the values of temperature (only MD calculation)
-            "pressure": None,  # dictionary of the values of pressure (only MD calculation)
-            "volume": None,  # dictionary of the values of volume (only MD calculation)
+            "records": None,  # structured array with the terms printed at each step, in AMBER units
+            "runinfo": None,  # record with timings and resources of the run (only when created by AmberCalculator)
+            "timings": None,  # dictionary with the timings and performance printed by Amber in the TIMINGS section
         }
 
         # now populate the dictionary, starting from the topology
-        with open(os.path.join(outDir, AmberCalculator.TOPNAME), "r") as top:
-            self.dataDict["topology"] = top.read()
-
-        # now read the output file
-        with open(os.path.join(outDir, AmberCalculator.OUTNAME), "r") as out:
-            self.dataDict["logtext"] = out.read()
+        if not os.path.isdir(outDir):
+            from ambercalculator.runarchive import openarchive  # calculations stored in archives
+            self._archive = openarchive(outDir)
+        if self._archive is not None:
+            with self._archive.open(AmberCalculator.TOPNAME) as top:
+                self.dataDict["topology"] = top.read().decode()
+        else:
+            with open(os.path.join(outDir, AmberCalculator.TOPNAME), "r") as top:
+                self.dataDict["topology"] = top.read()
+        if lean:
+            # the text that has been read is replaced by the text of an equal topology, when there is one
+            self._topology = AmberTopology.shared(self.dataDict["topology"])
+            self.dataDict["topology"] = self._topology.topotext
+
+        # now parse the output file, in a single pass that reads the file line by line
+        keepLog = keepLog and not lean
+        if self._archive is not None:
+            with io.TextIOWrapper(self._archive.open(AmberCalculator.OUTNAME)) as out:
+                log = AmberOutput._parseAmberLog(out, keepText=keepLog)
+        else:
+            with open(os.path.join(outDir, AmberCalculator.OUTNAME), "r") as out:
+                log = AmberOutput._parseAmberLog(out, keepText=keepLog)
+        self.dataDict["logtext"] = log["text"]
 
         # check whether the calculation finished with success
-        if "Maximum number of minimization cycles reached." not in self.dataDict["logtext"] and \
-                "5.  TIMINGS" not in self.dataDict["logtext"]:
+        if not log["completed"]:
             raise AmberError("sander calculation in {0} ended with error".format(outDir))
 
         # check whether the calculation is an optimization or a molecular dynamics run
-        regExpr = "imin *= *([0-9]*),"
-        results = re.findall(regExpr, self.dataDict["logtext"])
-        if results:
+        if log["imin"] is not None:
 
-            if int(results[0]) == 1:  # this calculation is an optimization
+            if log["imin"] == 1:  # this calculation is an optimization
                 self.dataDict["type"] = "opt"
-                # extract the values from the out file
-                steps, energies = AmberOutput._grepAmberOptimization(self.dataDict["logtext"])
-                # store the values in the dictionary
-                self.dataDict["energy"] = dict(zip(steps, energies))
-
             else:  # this calculation is a molecular dynamics simulation
                 self.dataDict["type"] = "MD"
-                # extract the values from the out file
-                times, energies, temperatures, pressures, volumes = \
-                    AmberOutput._grepAmberDynamics(self.dataDict["logtext"])
-                # store the values in the dictionary
-                self.dataDict["energy"] = dict(zip(times, energies))
-                self.dataDict["temperature"] = dict(zip(times, temperatures))
-                if pressures is not None: self.dataDict["pressure"] = dict(zip(times, pressures))
-                if volumes is not None: self.dataDict["volume"] = dict(zip(times, volumes))
+            # store the records of the steps, the dictionaries of energy, temperature, pressure and volume
+            # are created from the records only when they are requested
+            self.dataDict["records"] = log["records"]
 
         else:
             raise AmberError("error reading Amber file {0}: cannot determine 'imin' value".format(
                 AmberCalculator.OUTNAME))
 
         # define the list of steps that are expected in the mdcrd file
-        regExpr = "ntwx *= *([0-9]*),"
-        results = re.findall(regExpr, self.dataDict["logtext"])
-        self.dataDict["mdcrdstart"] = int(results[0])
+        self.dataDict["mdcrdstart"] = log["ntwx"]
+
+        # store the timings and the performance of the calculation
+        self.dataDict["timings"] = log["timings"]
 
         # store the path of the mdcrd file
         self.dataDict["mdcrdfile"] = os.path.join(self.outDir, AmberCalculator.MDCRDNAME)
         # store the path of the restrtfile file
         self.dataDict["restrtfile"] = os.path.join(self.outDir, AmberCalculator.RESTRTNAME)
 
-        # store the value of storeFiles
-        self.storeFiles = storeFiles
+        # store the value of storeFiles, an archive is never removed
+        self.storeFiles = storeFiles or self._archive is not None
 
     # ================================================================================
 
     @staticmethod
-    def _grepAmberOptimization(fileText):
-        """ use regexpr to extract the list of total energies from AMBER output file
+    def completed(outDir):
+        """ Check whether the directory outDir contains an Amber calculation that has been completed
+        successfully, without parsing its results. The log file is read line by line.
 
-        :param fileText: text of the AMBER output file
-        :return: two lists, for each step the first contains the step number and the second the MM energy
+        :param outDir: path of the directory where the calculation is stored
+        :return: True when the log file of the calculation exists and it is complete
         """
 
-        reString = "NSTEP.*?\n *([0-9]* *\-?[0-9]*.[0-9]*E[\+\-][0-9]*).*?\n"
-        results = re.findall(reString, fileText)
+        try:
+            with open(os.path.join(outDir, AmberCalculator.OUTNAME), "r") as out:
+                for line in out:
+                    if any(mark in line for mark in AmberOutput._SUCCESSMARKS):
+                        return True
+        except IOError:
+            pass
+        return False
 
-        enList, stepList = [], []
-        for strg in results:
-            stepList.append(int(strg.split()[0]))
-            enList.append(float(strg.split()[1]) / constants.Hatree2kcalmol)
+    # ================================================================================
 
-        if stepList[-1] == stepList[-2]:
-            stepList.pop()
-            enList.pop()
+    @staticmethod
+    def _parseAmberLog(lines, keepText=False):
+        """ Parse the AMBER output file in a single pass, with a state machine that reads one line at a time:
+        the settings of the run are read from the header, the records of the printed steps are read up to the
+        block of the averages of the dynamics, and the TIMINGS section is passed to _grepAmberTimings.
+        All the terms printed in the records (NSTEP, TIME, TEMP, PRESS, Etot, EKtot, EPtot, BOND, ANGLE, ...
+        for a MD run, NSTEP, ENERGY, RMS, GMAX, BOND, ANGLE, ... for an optimization) are stored in the columns
+        of a structured array, in the units of the AMBER output and with the units removed from the names
+        (e.g. TIME(PS) becomes TIME). A term that is missing in a record is NaN. The columns are accumulated
+        in compact arrays, and apart from them the memory does not depend on the length of the file.
+
+        :param lines: iterable over the lines of the AMBER output file (e.g. the open file object)
+        :param keepText: store also the whole text of the output file
+        :return: dictionary with the values read from the output file
+        """
+        import array  # efficient arrays of numeric values
+        import numpy as np  # numpy: arrays and math utilities
+
+        log = {"completed": False,  # the file contains a mark of a calculation completed successfully
+               "imin": None, "ntwx": None,  # settings of the run
+               "records": None,  # structured array with the terms printed at each step
+               "timings": None,  # dictionary with the timings of the calculation
+               "text": None}  # text of the file, only when keepText is True
+
+        settingExpr = {"imin": re.compile("imin *= *([0-9]*),"), "ntwx": re.compile("ntwx *= *([0-9]*),")}
+        boxExpr = re.compile("Box X = *(-?[0-9]*\\.[0-9]*) *Box Y = *(-?[0-9]*\\.[0-9]*) *Box Z = *(-?[0-9]*\\.[0-9]*)")
+        angleExpr = re.compile(" *Alpha = *(-?[0-9]*\\.[0-9]*) *Beta  = *(-?[0-9]*\\.[0-9]*) *"
+                               "Gamma = *(-?[0-9]*\\.[0-9]*)")
+
+        # the records are stored in blocks of consecutive records with the same terms, each block is a tuple
+        # with the names of the terms and a compact array with the values; fieldNames maps the names of the
+        # terms in the output to the names of the columns
+        blocks, fieldNames, layouts = [], {}, {}
+
+        def storeRecord(record):
+            names = tuple(record)
+            if not blocks or blocks[-1][0] != names:
+                blocks.append((names, array.array("d")))
+            blocks[-1][1].extend(record.values())
+
+        def readTerms(line, record):
+            # the line is a sequence of "NAME = value", in which the value is followed by the name of the next term:
+            # the lines of the records repeat with the same format, and the names and the positions of the values
+            # are stored in layouts, with a key made of the beginning of the line and of the number of tokens
+            tokens = line.split()
+            key = (line[:12], len(tokens))
+            if key not in layouts:
+                parts, names = line.split("="), []
+                for part in parts[:-1]:
+                    name = part.split(None, 1)[-1].strip() if names else part.strip()
+                    if name not in fieldNames: fieldNames[name] = re.sub("\\(.*\\)$", "", name).strip()
+                    names.append(fieldNames[name])
+                positions = [i + 1 for i, token in enumerate(tokens[:-1]) if token == "="]
+                layouts[key] = (names, positions) if len(names) == len(positions) else None
+            if layouts[key] is None: return
+            for name, i in zip(*layouts[key]):
+                try:
+                    record[name] = float(tokens[i])
+                except ValueError:  # the value overflows the format of the output, e.g. "*******"
+                    pass
 
-        return stepList, enList
+        # the state is "records" up to the averages of the dynamics, then "averages" up to the TIMINGS section;
+        # expected is the kind of line that may follow the previous one (the values of the table of an optimization
+        # step or the angles of the box), record is the dictionary of the terms of the record that is being read
+        state, expected, pending, record = "records", None, None, None
+        unitCell, textLines, timingsLines = None, [], []
+        marks, completed = tuple(AmberOutput._SUCCESSMARKS), False
+        for line in lines:
+            if keepText: textLines.append(line)
+
+            # the TIMINGS section is short, and it is stored to be parsed at the end
+            if state == "timings":
+                timingsLines.append(line)
+                continue
+
+            # terms of the record that is being read, the record ends with the first line that is not blank
+            # and has no term (the table of an optimization step is followed by a blank line)
+            if record is not None:
+                if " = " in line and "NSTEP" not in line:
+                    readTerms(line, record)
+                    continue
+                elif not line.strip():
+                    continue
+                storeRecord(record)
+                record = None
+
+            # marks of completion, and blocks of the output that follow the records
+            if not completed:
+                for mark in marks:
+                    if mark in line: completed = True
+            if "5.  TIMINGS" in line:
+                state = "timings"
+                timingsLines.append(line)
+                continue
+            if state == "averages":
+                continue
+            if "A V E R A G E S   O V E R" in line:
+                state = "averages"
+                continue
+
+            # values of the table that opens the record of an optimization step, or angles of the box
+            if expected is not None:
+                if expected == "NSTEP":
+                    values = line.split()
+                    if values and values[0].isdigit():
+                        record = {"NSTEP": int(values[0])}
+                        for name, value in zip(pending[1:4], values[1:4]):
+                            record[name] = float(value)
+                elif expected == "BOX":
+                    match = angleExpr.match(line)
+                    if match: unitCell = pending + match.groups()
+                expected = None
+                continue
+
+            # first line of a record: the first line of the terms of a MD step, or the header of the table
+            # that opens the record of an optimization step
+            if "NSTEP" in line:
+                if " = " in line:
+                    record = {}
+                    readTerms(line, record)
+                else:
+                    expected, pending = "NSTEP", line.split()
+
+            # settings of the run, size of the system and box, written in the header before the records
+            elif not blocks:
+                for key, regExpr in settingExpr.items():
+                    if log[key] is None and key in line:
+                        match = regExpr.search(line)
+                        if match: log[key] = int(match.group(1))
+                if "NATOM" in line or "AMBER/MPI" in line:
+                    timingsLines.append(line)
+                if unitCell is None and "Box X" in line:
+                    match = boxExpr.search(line)
+                    if match: expected, pending = "BOX", match.groups()
+
+        if record is not None: storeRecord(record)
+
+        # store the blocks in a structured array, with the columns in the order of first appearance
+        # and the step number as integer, the terms that are not present in a block are NaN
+        names = list(dict.fromkeys(name for block in blocks for name in block[0]))
+        records = np.zeros(sum(len(values) // len(blockNames) for blockNames, values in blocks),
+                           dtype=[(name, np.int64 if name == "NSTEP" else np.float64) for name in names])
+        for name in names:
+            if name != "NSTEP": records[name] = np.nan
+        start = 0
+        for blockNames, values in blocks:
+            values = np.asarray(values).reshape(-1, len(blockNames))
+            for i, name in enumerate(blockNames):
+                records[name][start:start + len(values)] = values[:, i]
+            start += len(values)
+
+        # the final results of an optimization repeat the last step
+        if "NSTEP" in names and len(records) > 1 and records["NSTEP"][-1] == records["NSTEP"][-2]:
+            records = records[:-1]
+
+        # without the volume in the records of a MD, the volume is computed from the unit cell when it is available
+        if "TIME" in names and "VOLUME" not in names and unitCell is not None:
+            a, b, c = [float(x) for x in unitCell[0:3]]
+            alpha, beta, gamma = [float(x) * constants.Deg2Rad for x in unitCell[3:6]]
+            volume = a * b * c * math.sqrt(1.0 - math.cos(alpha) ** 2 - math.cos(beta) ** 2 - math.cos(gamma) ** 2
+                                           + 2.0 * math.cos(alpha) * math.cos(beta) * math.cos(gamma))
+            withVolume = np.zeros(len(records), dtype=records.dtype.descr + [("VOLUME", np.float64)])
+            for name in names:
+                withVolume[name] = records[name]
+            withVolume["VOLUME"] = volume
+            records = withVolume
+
+        log["records"] = records
+
+        log["completed"] = completed
+        log["timings"] = AmberOutput._grepAmberTimings("".join(timingsLines))
+        if keepText: log["text"] = "".join(textLines)
+        return log
 
     # ================================================================================
 
     @staticmethod
-    def _grepAmberDynamics(fileText):
-        """ use regexpr to extract information from AMBER output for a Molecular Dynamics run
+    def _grepAmberTimings(fileText):
+        """ use regexpr to extract the information on the timings of the calculation from the AMBER output file.
+        The breakdown of the time spent in the routines of the code is stored in a dictionary with
+        a key that describes the position of the routine in the hierarchy of the timings, e.g.
+        "Total time/Runmd Time/Force time/Nonbond force" for sander or "PME Reciprocal Force CPU Time/FFT"
+        for pmemd. The dictionary contains also the performance (ns/day), the total CPU and wall times,
+        the number of atoms and the number of MPI tasks of the calculation.
 
         :param fileText: text of the AMBER output file
-        :return: lists of time, energy, temperature, pressure, volume for each step of the output file
+        :return: dictionary with the timings of the calculation
+        """
+
+        timings = {"routines": {},  # time (in s) spent in each routine
+                   "elapsed": None,  # elapsed time (in s) of the MD steps
+                   "msperstep": None,  # time per MD step (in ms)
+                   "nsperday": None,  # simulated time per day of calculation (in ns/day)
+                   "secondsperns": None,  # time needed to simulate one ns (in s)
+                   "setupcputime": None,  # CPU time (in s) for the setup of the calculation
+                   "cputime": None,  # total CPU time (in s)
+                   "walltime": None,  # total wall time (in s)
+                   "natom": None,  # number of atoms of the system
+                   "ntasks": 1}  # number of MPI tasks of the calculation
+
+        # size of the system and number of MPI tasks are written at the beginning of the output
+        results = re.findall("NATOM *= *([0-9]+)", fileText)
+        if results: timings["natom"] = int(results[0])
+        results = re.findall("Running AMBER/MPI version on *([0-9]+) *(?:nodes|MPI tasks)", fileText)
+        if results: timings["ntasks"] = int(results[0])
+
+        # the rest of the information is in the TIMINGS section
+        nmin = fileText.find("5.  TIMINGS")
+        if nmin == -1:
+            return timings
+
+        # sander writes a tree of timings, in which each routine is followed by its parent with lower indentation
+        # pmemd writes instead tables of routines, each one with a title
+        treeExpr = re.compile("^\\|( *)(.+?) +([0-9]+\\.[0-9]+) \\( *[0-9.]+% of .*\\)")
+        tableExpr = re.compile("^\\| +(.+?) +([0-9]+\\.[0-9]+)(?: +[0-9]+\\.[0-9]+)? *$")
+        pending, tableTitle = [], None
+        for line in fileText[nmin:].splitlines():
+            match = treeExpr.match(line)
+            if match:
+                depth, name, seconds = len(match.group(1)), match.group(2), float(match.group(3))
+                children = []
+                while pending and pending[-1][0] > depth:
+                    children.insert(0, pending.pop())
+                pending.append((depth, name, seconds, children))
+                continue
+            if line.strip().endswith("Time:") or line.strip().endswith("Routines:"):
+                tableTitle = line.strip(" |:")
+                continue
+            match = tableExpr.match(line)
+            if tableTitle and match:
+                timings["routines"]["{0}/{1}".format(tableTitle, match.group(1))] = float(match.group(2))
+            elif not line.strip(" |-"):
+                continue
+            elif "Routine" not in line:
+                tableTitle = None
+
+        # convert the tree of the sander timings to the keys of the dictionary
+        def storeTree(nodes, parent):
+            for depth, name, seconds, children in nodes:
+                key = name if not parent else parent + "/" + name
+                timings["routines"][key] = seconds
+                storeTree(children, key)
+        storeTree(pending, "")
+
+        # performance: the last values refer to the average over all the steps
+        results = re.findall("Elapsed\\(s\\) = *([0-9.]+) *Per Step\\(ms\\) = *([0-9.]+)", fileText[nmin:])
+        if results: timings["elapsed"], timings["msperstep"] = float(results[-1][0]), float(results[-1][1])
+        results = re.findall("ns/day = *([0-9.]+) *seconds/ns = *([0-9.]+)", fileText[nmin:])
+        if results: timings["nsperday"], timings["secondsperns"] = float(results[-1][0]), float(results[-1][1])
+
+        # total CPU and wall times (of the master process, in a parallel run)
+        for key, regExpr in [("setupcputime", "\\| *(?:Master )?Setup CPU time: *([0-9.]+)"),
+                             ("cputime", "\\| *(?:Master )?Total CPU time: *([0-9.]+)"),
+                             ("walltime", "\\| *(?:Master )?Total wall time: *([0-9.]+)")]:
+            results = re.findall(regExpr, fileText[nmin:])
+            if results: timings[key] = float(results[-1])
+
+        return timings
+
+    # ================================================================================
+
+    @staticmethod
+    def timingsProfile(outputs):
+        """ Aggregate the timings of many AmberOutput instances, grouping the calculations by the size of
+        the system and by the number of MPI tasks. For each group, the profile contains the number of
+        calculations, the average, minimum and maximum of the performance (ns/day) and of the CPU and wall
+        times, and the average time spent in each routine.
+
+        :param outputs: list of AmberOutput instances
+        :return: dictionary {(natom, ntasks): profile of the group}
         """
 
-        # select the first part of the text, up to the string "A V E R A G E S   O V E R"
-        nmax = fileText.find("A V E R A G E S   O V E R")
+        # group the timings of the outputs
+        groups = {}
+        for output in outputs:
+            if output.timings is not None:
+                groups.setdefault((output.timings["natom"], output.timings["ntasks"]), []).append(output.timings)
+
+        profiles = {}
+        for key, timings in groups.items():
+            profile = {"count": len(timings), "routines": {}}
+            # average, minimum and maximum of the global quantities, when they are available
+            for quantity in ["nsperday", "msperstep", "cputime", "walltime"]:
+                values = [t[quantity] for t in timings if t[quantity] is not None]
+                if values:
+                    profile[quantity] = {"mean": sum(values) / len(values), "min": min(values), "max": max(values)}
+                else:
+                    profile[quantity] = None
+            # average time of each routine
+            for routine in sorted(set(r for t in timings for r in t["routines"])):
+                values = [t["routines"][routine] for t in timings if routine in t["routines"]]
+                profile["routines"][routine] = sum(values) / len(values)
+            profiles[key] = profile
+
+        return profiles
 
-        regExpr = "TIME\(PS\) = *([0-9]*\.[0-9]*) *TEMP\(K\) = *(\-?[0-9]*\.[0-9]*) *" \
-                  "PRESS = *(\-?[0-9]*\.[0-9]*).*\n.*Etot   = *(\-?[0-9]*\.[0-9]*)"
-        results = re.findall(regExpr, fileText[0:nmax])
+    # ================================================================================
 
-        tList, enList, tempList, presList = [], [], [], []
-        for x in results:
-            tList.append(float(x[0]) * constants.ps2au)
-            tempList.append(float(x[1]))
-            presList.append(float(x[2]))
-            enList.append(float(x[3]) / constants.Hatree2kcalmol)
+    def close(self):
+        """ Close the files of the calculation (NetCDF files and archive) and, unless storeFiles is True,
+        remove the directory of the calculation. The removal does not block the caller: the directory is moved
+        to a trash directory at once, and deleted by a background thread (see flushCleanup). The data that
+        have been read (records, topology, ...) are still available after close, while snapshots and
+        gradient cannot be read any more. Calling close more than once has no effect. """
 
-        # when the pressure is always == 0, this is a constant cell / non periodic calculatio, pressure means nothing
-        if np.all(np.array(presList) == 0): presList = None
+        for ncFile in self._netcdfFiles.values():
+            ncFile.close()
+        self._netcdfFiles, self._gradient = {}, None
+        if self._archive is not None:
+            self._archive.close()
 
-        regExpr = "VOLUME     = *(\-?[0-9]*\.[0-9]*)"
-        results = re.findall(regExpr, fileText[0:nmax])
+        if not self.storeFiles and not self._closed:
+            _CLEANUP.remove(self.outDir)
+        self._closed = True
 
-        volList = []
-        if results:
-            for x in results:
-                volList.append(float(x) / (constants.Bohr2Ang ** 3))
-        else:
-            try:
-                regExpr = "Box X = *(\-?[0-9]*\.[0-9]*) *Box Y = *(\-?[0-9]*\.[0-9]*) *Box Z = *(\-?[0-9]*\.[0-9]*) *" \
-                          "\n *Alpha = *(\-?[0-9]*\.[0-9]*) *Beta  = *(\-?[0-9]*\.[0-9]*) *Gamma = *(\-?[0-9]*\.[0-9]*)"
-                unitCellStrings = re.findall(regExpr, fileText[0:nmax])[0]
-                unitCell = [float(x) / constants.Bohr2Ang for x in unitCellStrings[0:3]] + \
-                           [float(x) * constants.Deg2Rad for x in unitCellStrings[3:6]]
-                volume = unitCell[0] * unitCell[1] * unitCell[2] * math.sqrt(
-                    1.0 - math.cos(unitCell[3]) ** 2 - math.cos(unitCell[4]) ** 2 - math.cos(unitCell[5]) ** 2
-                    + 2.0 * math.cos(unitCell[3]) * math.cos(unitCell[4]) * math.cos(unitCell[5]))
-                volList = [volume] * len(tList)
-            except IndexError:
-                volList = None
-
-        return tList, enList, tempList, presList, volList
+    def __enter__(self):
+        return self
 
-    # ================================================================================
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def __del__(self):
-        """ destroy the data stored in the class instance, and possibly
-        remove the directory of the calculation unless it is requested otherwise """
-
-        if not self.storeFiles:
-            shutil.rmtree(self.outDir)
+        """ close the instance (see close), when it has been initialized """
+        if "dataDict" in self.__dict__:
+            self.close()
 
-        del self.dataDict
-        del self.outDir
-        del self.storeFiles
+    @staticmethod
+    def flushCleanup():
+        """ Wait until the directories of the calculations that have been closed are deleted. This is done
+        also at the exit of the interpreter, and it is needed only to be sure that the space on disk is free. """
+        _CLEANUP.flush()
 
     # ================================================================================
 
     def __getattr__(self, item):
         """Catches non-standard class attributes, by using the "item" key to access the
         datadictionary self.dataDict that store the results of the calculation."""
-        return self.dataDict[item]
+        # the attributes of an instance that is not initialized (e.g. after a failure of the constructor,
+        # or while it is unpickled) cannot be found in dataDict, that does not exist yet
+        dataDict = self.__dict__.get("dataDict")
+        if dataDict is None or item.startswith("__"):
+            raise AttributeError("'{0}' object has no attribute '{1}'".format(type(self).__name__, item))
+        if item == "logtext" and dataDict["logtext"] is None:
+            return self._readLog()
+        if item in ("energy", "temperature", "pressure", "volume") and item not in dataDict:
+            if self._lean:
+                return self._recordView(item)
+            dataDict[item] = self._recordView(item)
+        if item not in dataDict:
+            raise AttributeError("'{0}' object has no attribute '{1}'".format(type(self).__name__, item))
+        return dataDict[item]
 
     def __getitem__(self, item):
         """Returns variables stored in the dataDict dictionary, by using
         the syntax self[item]. When item is an integer, return one of the
         snapshots of the calculation, otherwise try to access the
         dataDict dictionary using item as key. """
-        if isinstance(item, int):
+        if isinstance(item, numbers.Integral):
             return self.snapshot(item)
+        elif isinstance(item, str):
+            try:
+                return self.__getattr__(item)
+            except AttributeError:
+                raise KeyError(item) from None
         else:
-            return self.dataDict[item]
+            return self.snapshots(item)
+
+    def _readLog(self):
+        """Read the text of the log file of the calculation, that is not kept in memory unless
+        the instance has been created with keepLog. Return None when there is no log file."""
+        if self._archive is not None:
+            return self._archive.read(AmberCalculator.OUTNAME).decode()
+        logFile = os.path.join(self.outDir, AmberCalculator.OUTNAME)
+        if not os.path.isfile(logFile):
+            return None
+        with open(logFile, "r") as out:
+            return out.read()
+
+    def _recordView(self, item):
+        """Create the dictionary {step(nr/time): value} of energy, temperature, pressure or volume from the
+        records of the calculation, with the values in atomic units. Return None when the quantity is not
+        defined for this calculation, or when the pressure is always zero (constant cell or non periodic run)."""
+        records = self.dataDict["records"]
+        if AmberOutput._recordColumn(self.type, records, item) is None:
+            return None
+        keyName, keyFactor, valueName, valueFactor = AmberOutput._RECORDVIEWS[(self.type, item)]
+        return dict(zip((records[keyName] * keyFactor).tolist(), (records[valueName] * valueFactor).tolist()))
+
+    @staticmethod
+    def _recordColumn(runType, records, item):
+        """Name of the column of the records with the values of energy, temperature, pressure or volume for
+        a calculation of type runType, or None when the quantity is not defined (see _recordView)."""
+        import numpy as np  # numpy: arrays and math utilities
+
+        if (runType, item) not in AmberOutput._RECORDVIEWS:
+            return None
+        valueName = AmberOutput._RECORDVIEWS[(runType, item)][2]
+        if valueName not in records.dtype.names or np.all(np.isnan(records[valueName])):
+            return None
+        if item == "pressure" and np.all(records[valueName] == 0):
+            return None
+        return valueName
 
     # ================================================================================
 
@@ -1256,21 +3254,21 @@ class AmberOutput:
 
          :param nrSnap: requested snapshot to extract
          :return: AmberSnapshot object with the requested snapshot"""
+        import numpy as np  # numpy: arrays and math utilities
 
         # this calculation is an optimization
         if self.type == "opt":
             # first check if the requested snapshot is present
-            laststep = sorted(self.energy.items())[-1][0]
-            if nrSnap == -1 or nrSnap == laststep:
+            if nrSnap == -1 or nrSnap == self.records["NSTEP"].max():
                 lastSnapshot = True  # when last snapshot is requested, results will be read from restart file
                 snapKey = None
             else:
                 lastSnapshot = False  # otherwise, we need to ensure that the step is present in the mdcrd file
-                snapList = [n for n in self.energy.keys() if n % self.mdcrdstart == 0]
-                if nrSnap not in snapList:
+                storedSteps = self._stepIndex()
+                snapKey = int(np.searchsorted(storedSteps, nrSnap))
+                if snapKey == len(storedSteps) or storedSteps[snapKey] != nrSnap:
                     print("WARNING! requested snapshot is not present in Amber results")
                     return None
-                snapKey = snapList.index(nrSnap)
         else:
             # in the case of an md run, do thing in an immediate way:
             # -1 means read snapshot from the restart file
@@ -1283,61 +3281,35 @@ class AmberOutput:
                 snapKey = nrSnap  # the key is the integer argument of the function
 
         #  ############### READ COORDINATES AND VELOCITIES ###############
-        if lastSnapshot:  # the final step is requested, use the restart file
-            with netcdf.netcdf_file(self.restrtfile) as restrt:
-                # read coordinates
-                coords = copy.deepcopy(restrt.variables["coordinates"].data)
-                coords = self._toAtomicUnits(coords, restrt.variables["coordinates"].units)
-                # read velocities
-                try:
-                    vels = copy.deepcopy(restrt.variables["velocities"].data)
-                    if np.all(vels == 0.0):
-                        vels = None
-                    else:
-                        vels = self._toAtomicUnits(vels, restrt.variables["velocities"].units)
-                except KeyError:
-                    vels = None
-        else:  # an intermediate snapshot is requested, read coordinates and velocities from mdcrd
-            with netcdf.netcdf_file(self.mdcrdfile) as mdcrd:
-                # read coordinates
-                coords = copy.deepcopy(mdcrd.variables["coordinates"].data[snapKey])
-                coords = self._toAtomicUnits(coords, mdcrd.variables["coordinates"].units)
-                # read velocities
-                try:
-                    vels = copy.deepcopy(mdcrd.variables["velocities"].data[snapKey])
-                    if np.all(vels == 0.0):
-                        vels = None
-                    else:
-                        vels = self._toAtomicUnits(vels, mdcrd.variables["velocities"].units)
-                except KeyError:
-                    vels = None
+        # the final step is requested, use the restart file, otherwise read coordinates and velocities from mdcrd
+        ncFile = self._netcdf(self.restrtfile if lastSnapshot else self.mdcrdfile)
+        frame = () if lastSnapshot else snapKey
+        # read coordinates
+        coords = self._toAtomicUnits(ncFile.variables["coordinates"].data[frame],
+                                     ncFile.variables["coordinates"].units)
+        # read velocities
+        try:
+            vels = ncFile.variables["velocities"].data[frame]
+            if np.all(vels == 0.0):
+                vels = None
+            else:
+                vels = self._toAtomicUnits(vels, ncFile.variables["velocities"].units)
+        except KeyError:
+            vels = None
 
         #  ############### READ UNIT CELL CONSTANTS ###############
         # for the unit cell is a bit more complicated:
         # - for an optimization run, data is always in the restrt
         # - for a dynamical run, either use restrt or mdcrd depending on the step requested
         if self.type == "opt" or lastSnapshot:
-            with netcdf.netcdf_file(self.restrtfile) as restrt:
-                try:
-                    # unit cell information is always read from the restrt file, regardless the step requested
-                    cell_lengths = copy.deepcopy(restrt.variables["cell_lengths"].data)
-                    cell_lengths = self._toAtomicUnits(cell_lengths, restrt.variables["cell_lengths"].units)
-                    cell_angles = copy.deepcopy(restrt.variables["cell_angles"].data)
-                    cell_angles = self._toAtomicUnits(cell_angles, restrt.variables["cell_angles"].units)
-                    unitcell = np.array(list(cell_lengths) + list(cell_angles))
-                except KeyError:  # when keyerror is raised, it means that this is not a periodic calculation
-                    unitcell = None
-        else:
-            with netcdf.netcdf_file(self.mdcrdfile) as mdcrd:
-                try:
-                    # unit cell information is always read from the restrt file, regardless the step requested
-                    cell_lengths = copy.deepcopy(mdcrd.variables["cell_lengths"].data[snapKey])
-                    cell_lengths = self._toAtomicUnits(cell_lengths, mdcrd.variables["cell_lengths"].units)
-                    cell_angles = copy.deepcopy(mdcrd.variables["cell_angles"].data[snapKey])
-                    cell_angles = self._toAtomicUnits(cell_angles, mdcrd.variables["cell_angles"].units)
-                    unitcell = np.array(list(cell_lengths) + list(cell_angles))
-                except KeyError:  # when keyerror is raised, it means that this is not a periodic calculation
-                    unitcell = None
+            ncFile, frame = self._netcdf(self.restrtfile), ()
+        try:
+            cell_lengths = ncFile.variables["cell_lengths"]
+            cell_angles = ncFile.variables["cell_angles"]
+            unitcell = np.concatenate([self._toAtomicUnits(cell_lengths.data[frame], cell_lengths.units),
+                                       self._toAtomicUnits(cell_angles.data[frame], cell_angles.units)])
+        except KeyError:  # when keyerror is raised, it means that this is not a periodic calculation
+            unitcell = None
 
         # now transpose the data to store them in the COBRAMM typical format [Xlist, Ylist, Zlist]
         if coords is not None:
@@ -1349,149 +3321,898 @@ class AmberOutput:
 
     # ================================================================================
 
+    def snapshots(self, selection=slice(None)):
+        """Extract many snapshots of the Amber calculation from the mdcrd file, in a single pass over the
+        requested frames. The selection can be an integer, a slice or a list/array of integers: for a MD run
+        these are the indices of the frames of the mdcrd file (negative indices count from the last frame),
+        for an optimization these are step numbers (e.g. output[100:1000:10] selects the steps from 100 to 999
+        every 10 steps that are stored in the mdcrd file). The coordinates (Ang), the unit cells (Ang + rad)
+        and the velocities (au) are returned stacked in an AmberTrajectory instance.
+
+         :param selection: requested snapshots
+         :return: AmberTrajectory object with the requested snapshots"""
+        import numpy as np  # numpy: arrays and math utilities
+
+        frames = self._selectFrames(selection)
+        mdcrd = self._netcdf(self.mdcrdfile)
+
+        # read coordinates and velocities
+        coords = self._readFrames(mdcrd.variables["coordinates"], frames)
+        vels = self._readFrames(mdcrd.variables["velocities"], frames) if "velocities" in mdcrd.variables else None
+        if vels is not None and np.all(vels == 0.0):
+            vels = None
+
+        # unit cell constants: for an optimization run the data is always in the restrt
+        ncFile = self._netcdf(self.restrtfile) if self.type == "opt" else mdcrd
+        if "cell_lengths" in ncFile.variables and "cell_angles" in ncFile.variables:
+            if self.type == "opt":
+                cell = np.concatenate([self._toAtomicUnits(ncFile.variables[name].data, ncFile.variables[name].units)
+                                       for name in ("cell_lengths", "cell_angles")])
+                unitcell = np.tile(cell, (len(frames), 1))
+            else:
+                unitcell = np.concatenate([self._readFrames(ncFile.variables[name], frames)
+                                           for name in ("cell_lengths", "cell_angles")], axis=1)
+        else:  # this is not a periodic calculation
+            unitcell = None
+
+        # coordinates and velocities in the COBRAMM typical format [Xlist, Ylist, Zlist] for each frame
+        return AmberTrajectory(np.transpose(coords, (0, 2, 1)), unitcell,
+                               None if vels is None else np.transpose(vels, (0, 2, 1)), frames)
+
+    # ================================================================================
+
+    def _stepIndex(self):
+        """ For an optimization, return the array with the steps that are stored in the mdcrd file: the position
+        of a step in the array is its frame in the mdcrd file. The index is computed only the first time. """
+
+        if self._storedSteps is None:
+            steps = self.records["NSTEP"]
+            self._storedSteps = steps[steps % self.mdcrdstart == 0]
+        return self._storedSteps
+
+    def _selectFrames(self, selection):
+        """ Convert a selection of snapshots (integer, slice or list/array of integers, see the snapshots method)
+        to the array of the indices of the corresponding frames of the mdcrd file """
+        import numpy as np  # numpy: arrays and math utilities
+
+        if self.type != "opt":
+            return np.atleast_1d(np.arange(self._netcdf(self.mdcrdfile).numrecs)[selection])
+
+        # for an optimization, the selection is made of step numbers
+        storedSteps = self._stepIndex()
+        if isinstance(selection, slice):
+            if selection.step is not None and selection.step <= 0:
+                raise AmberError("the steps of an optimization can be selected only in increasing order")
+            selected = np.ones(len(storedSteps), dtype=bool)
+            if selection.start is not None: selected &= storedSteps >= selection.start
+            if selection.stop is not None: selected &= storedSteps < selection.stop
+            if selection.step is not None: selected &= (storedSteps - (selection.start or 0)) % selection.step == 0
+            return np.flatnonzero(selected)
+        steps = np.atleast_1d(np.asarray(selection, dtype=np.int64))
+        frames = np.searchsorted(storedSteps, steps)
+        missing = (frames == len(storedSteps)) | (storedSteps[np.minimum(frames, len(storedSteps) - 1)] != steps)
+        if np.any(missing):
+            raise AmberError("requested steps {0} are not present in Amber results".format(steps[missing].tolist()))
+        return frames
+
+    def _framesBySegment(self, selection=slice(None)):
+        """ Locate a selection of snapshots (see the snapshots method) in the mdcrd files of the calculation:
+        return a list of (AmberOutput, frames) tuples, with the AmberOutput instance that owns the mdcrd file and
+        the array of the indices of the frames of that file, in the order of the selection """
+        return [(self, self._selectFrames(selection))]
+
+    def _readFrames(self, variable, frames):
+        """ Read the frames of a record variable of a NetCDF file, converted to atomic units. The frames
+        are converted in a single pass into the array that is returned: when the frames are equally spaced
+        they are read as a strided view of the file, otherwise they are read one by one in the array. """
+        import numpy as np  # numpy: arrays and math utilities
+
+        steps = np.diff(frames)
+        if len(frames) > 0 and (len(steps) == 0 or (steps[0] > 0 and np.all(steps == steps[0]))):
+            stride = int(steps[0]) if len(steps) > 0 else 1
+            return self._toAtomicUnits(variable.data[frames[0]:frames[-1] + 1:stride], variable.units)
+        converted = np.empty((len(frames),) + variable.shape[1:], dtype=variable.data.dtype.newbyteorder("="))
+        for i, frame in enumerate(frames):
+            self._toAtomicUnits(variable.data[frame], variable.units, out=converted[i])
+        return converted
+
+    # ================================================================================
+
     @property
     def gradient(self):
-        """Extract the forces stored in the mdcrd output file of an Amber MD calculation,
-        using the nrSnap integer index. If the force is not present in the calculation,
-        return None. """
+        """Give access to the gradient of the energy (opposite of the forces) stored in the mdcrd output
+        file of an Amber MD calculation, with an AmberGradient instance that reads the frames only when
+        they are requested. If the force is not present in the calculation, return None. """
 
         if self.type == "opt":  # this calculation is an optimization, the forces are not stored
             return None
 
         else:  # the calculation is an MD run, we can get the forces from the mdcrd file
-            with netcdf.netcdf_file(self.mdcrdfile) as mdcrd:
-                forces = copy.deepcopy(mdcrd.variables["forces"].data)
-                return - self._toAtomicUnits(forces, mdcrd.variables["forces"].units)
+            if self._gradient is None:
+                mdcrd = self._netcdf(self.mdcrdfile)
+                if "forces" not in mdcrd.variables:
+                    return None
+                self._gradient = AmberGradient([mdcrd.variables["forces"]])
+            return self._gradient
+
+    # ================================================================================
+
+    def analysis(self, topology=None, chunkSize=64, nProcesses=1):
+        """Create an AmberAnalysis instance (defined in ambercalculator.analysis) to compute RMSD, RMSF,
+        radius of gyration, RDF, MSD and solvent shell occupancy over the frames of the mdcrd file. The frames
+        are streamed from the file in chunks of chunkSize frames, that can be processed on a pool of processes.
+
+        :param topology: AmberTopology of the system, when None the topology of the calculation is used
+        :param chunkSize: number of frames that are read and processed together
+        :param nProcesses: number of parallel processes (None to use the number of processors of the machine)
+        :return: AmberAnalysis instance
+        """
+        from ambercalculator.analysis import AmberAnalysis  # chunked analysis of the trajectories
+
+        return AmberAnalysis(self, topology, chunkSize=chunkSize, nProcesses=nProcesses)
+
+    # ================================================================================
+
+    def _netcdf(self, fileName):
+        """ Open the NetCDF file fileName (mdcrd or restrt) with the memory-mapped reader of netcdf3.
+        The opened files are stored in the instance, so that the header is read only once and the
+        following calls access the data of the file without opening it again.
+
+        :param fileName: path of the NetCDF file
+        :return: NetCDF3File instance
+        """
+
+        if fileName not in self._netcdfFiles:
+            if self._archive is not None and os.path.dirname(fileName) == os.path.normpath(self.outDir):
+                self._netcdfFiles[fileName] = self._archive.netcdf(os.path.basename(fileName))
+            else:
+                self._netcdfFiles[fileName] = AmberOutput._openNetCDF(fileName)
+        return self._netcdfFiles[fileName]
+
+    @staticmethod
+    def _openNetCDF(fileName):
+        """ Open the NetCDF file fileName, that is either a file of the directory of a calculation or a file
+        stored in an archive (a path like archive/mdcrd, where archive is the file written by writeArchive,
+        or runs.tgz/run01/mdcrd for a tar or zip archive)
+
+        :param fileName: path of the NetCDF file
+        :return: NetCDF3File instance, or an object with the same interface for a file of an archive
+        """
+        from ambercalculator.netcdf3 import NetCDF3File  # memory-mapped reader of NetCDF3 files
+
+        if not os.path.exists(fileName):
+            from ambercalculator.runarchive import opennetcdf, splitpath  # calculations stored in archives
+            if splitpath(fileName)[0] is not None:
+                return opennetcdf(fileName)
+        return NetCDF3File(fileName)
+
+    # ================================================================================
+
+    def writeArchive(self, fileName, precision=1.e-3, velocities=None, forces=None, blockSize=100):
+        """ Write the files of the calculation in a compressed archive (see ambercalculator.archive), that can be
+        opened with AmberOutput(fileName) in place of the directory. The coordinates of the trajectory are
+        quantized with the given precision, the velocities and the forces are stored only when their precision
+        is given. The frames are stored in compressed blocks, and each frame can be read decompressing only
+        its block.
+
+        :param fileName: path of the archive
+        :param precision: precision of the coordinates (Angstrom)
+        :param velocities: precision of the velocities (in the units of the mdcrd), None to skip the velocities
+        :param forces: precision of the forces (kcal/mol/Angstrom), None to skip the forces
+        :param blockSize: number of frames of each compressed block
+        """
+        from ambercalculator.archive import AmberArchive  # compressed archives of the calculations
+
+        AmberArchive.write(self, fileName, precision=precision, velocities=velocities, forces=forces,
+                           blockSize=blockSize)
 
     # ================================================================================
 
     @staticmethod
-    def _toAtomicUnits(data, units):
+    def _toAtomicUnits(data, units, out=None):
         """ Convert data read from NetCDF file to the units used internally by COBRAMM.
-            Internal units are: Angstrom for length, a.u. for velocity, radiants for angles, au for forces
-
-        :param data: numerical data that is converted
-        :param units: byte object with the units of the input data
-        :return:
-        """
-        if units.decode() == 'angstrom':
-            return data
-        elif units.decode() == 'angstrom/picosecond':
-            # WARNING!!!!! despite the units that are written to the NETCDF file, the numbers for the
-            # atom velocities are stored in the usual AKMA system of units.
-            # this means that the conversion factor is  1 / constants.Bohr2Ang / constants.MDtime2au
-            # and not 1 / constants.Bohr2Ang / constants.ps2au
-            return data / constants.Bohr2Ang / constants.MDtime2au
-        elif units.decode() == 'degree':
-            return data * constants.Deg2Rad
-        elif units.decode() == "kilocalorie/mole/angstrom":
-            return data / constants.Hatree2kcalmol * constants.Bohr2Ang
-        else:
-            raise AmberError("{0} unit not yet implemented".format(units.decode()))
+            Internal units are: Angstrom for length, a.u. for velocity, radiants for angles, au for forces.
+            The data is read and converted in a single pass, and the result is a new array in native
+            byte order, or the buffer out when it is given by the caller.
+
+        :param data: numerical data that is converted (e.g. a view on a memory-mapped file)
+        :param units: str or byte object with the units of the input data
+        :param out: optional array where the converted data is stored
+        :return: array with the converted data
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        units = units.decode() if isinstance(units, bytes) else units
+        if units not in AmberOutput._UNITFACTORS:
+            raise AmberError("{0} unit not yet implemented".format(units))
+        if out is None:
+            out = np.empty(np.shape(data), dtype=np.asarray(data).dtype.newbyteorder("="))
+        return np.multiply(data, AmberOutput._UNITFACTORS[units], out=out)
 
     # ================================================================================
 
-    def optimizationPlot(self, pdfFileName=None):
-        """ print graph that shows the the energy over the optimization steps
+    def optimizationPlot(self, pdfFileName=None, maxPoints=2000):
+        """ print graph that shows the the energy over the optimization steps. When the graph is written
+        to a pdf file, the figure is created without pyplot, so that it is not kept in the state of pyplot
+        and the method can be used also in processes without a display.
 
         :param pdfFileName: name of the output pdf file
+        :param maxPoints: maximum number of points of the line of the graph (None to plot all the steps)
         """
 
         if self.type == "opt":
+            AmberOutput._renderPlot(self.type, self.records, pdfFileName, maxPoints)
+        else:
+            print("WARNING! the calculation is not an optimization run, skipping analysis... ")
 
-            # plot data with matplotlib
-            import matplotlib.pyplot as plt
+    # ================================================================================
 
-            # extract results in a format that can be plot
-            lists = sorted(self.energy.items())
-            x, y = zip(*lists)
+    def dynamicsPlot(self, pdfFileName=None, maxPoints=2000):
+        """ print graph that shows some variables over the times of the dynamics. The running averages are
+        computed on all the steps of the dynamics, then each line is downsampled to maxPoints points with
+        _downsample. When the graph is written to a pdf file, the figure is created without pyplot, as in
+        optimizationPlot.
 
-            # plot data with matplotlib
-            plt.plot(x, y, label="optimization energy", c="#e6194B", ls="-", lw=2, marker="o")
-            plt.ylabel("energy / Hartree"), plt.xlabel("optimization step")
+        :param pdfFileName: name of the output pdf file
+        :param maxPoints: maximum number of points of each line of the graph (None to plot all the steps)
+        """
 
-            # write to PDF file or show to screen
-            if pdfFileName:
-                plt.savefig(pdfFileName, bbox_inches='tight')
-            else:
-                plt.show()
+        if self.type == "MD":
+            AmberOutput._renderPlot(self.type, self.records, pdfFileName, maxPoints)
+        else:
+            print("WARNING! the calculation is not a dynamics simulation, skipping analysis... ")
+
+    # ================================================================================
+
+    @staticmethod
+    def plotOutputs(outputs, pdfFileNames, nProcesses=None, maxPoints=2000):
+        """ Write the plots of many calculations to pdf files, rendering them in parallel on a pool of
+        processes: the plot of dynamicsPlot for MD runs and the plot of optimizationPlot for optimizations.
+        The calculations can be given as AmberOutput instances, in which case only their records are sent to
+        the processes, or as directories, that are then read by the processes themselves. The figures are
+        created without pyplot, so no interactive backend is needed and no figure is left open.
+        A failure in the plot of one calculation does not stop the others: the corresponding item of
+        the list of results is the AmberError instance that describes the failure.
+
+        :rtype: list
+        :param outputs: list of AmberOutput instances or of directories of the calculations
+        :param pdfFileNames: list with the names of the output pdf files, one for each calculation
+        :param nProcesses: number of parallel processes (None to use the number of processors of the machine)
+        :param maxPoints: maximum number of points of each line of the graphs (None to plot all the steps)
+        :return: list with the name of the pdf file or an AmberError instance for each calculation
+        """
+        import concurrent.futures  # launch parallel tasks on a pool of processes
+
+        outputs, pdfFileNames = list(outputs), list(pdfFileNames)
+        if len(outputs) != len(pdfFileNames):
+            raise AmberError("AmberOutput.plotOutputs: {0} calculations and {1} pdf files are given".format(
+                len(outputs), len(pdfFileNames)))
 
+        # the AmberOutput instances are replaced by their records, that are cheap to send to the processes
+        tasks = []
+        for output, pdfFileName in zip(outputs, pdfFileNames):
+            source = output if isinstance(output, str) else (output.type, output.records)
+            tasks.append((source, pdfFileName, maxPoints))
+
+        # render the plots, serially when a single process is requested
+        if nProcesses == 1:
+            return [AmberOutput._plotItem(task) for task in tasks]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=nProcesses) as executor:
+            return list(executor.map(AmberOutput._plotItem, tasks))
+
+    # ================================================================================
+
+    @staticmethod
+    def _plotItem(task):
+        """ Write the plot of one of the calculations of plotOutputs, and return the error as an AmberError
+        instance instead of raising it
+
+        :param task: tuple (source, pdfFileName, maxPoints), where source is the directory of the calculation
+                     or the tuple (type, records) of the calculation
+        :return: name of the pdf file, or AmberError instance when the plot failed
+        """
+        source, pdfFileName, maxPoints = task
+        try:
+            if isinstance(source, str):
+                output = AmberOutput(source)
+                source = (output.type, output.records)
+            runType, records = source
+            if runType not in ("opt", "MD"):
+                raise AmberError("AmberOutput.plotOutputs: no plot is defined for a {0} run".format(runType))
+            AmberOutput._renderPlot(runType, records, pdfFileName, maxPoints)
+            return pdfFileName
+        except AmberError as error:
+            return error
+        except Exception as error:  # any other failure is reported in the same way
+            return AmberError("AmberOutput.plotOutputs: {0} in {1}: {2}".format(
+                type(error).__name__, pdfFileName, error))
+
+    # ================================================================================
+
+    @staticmethod
+    def _renderPlot(runType, records, pdfFileName, maxPoints):
+        """ Draw the graph of an optimization or of a dynamics, and write it to a pdf file or show it to screen.
+        Only the figures that are shown to screen are created with pyplot: the figures that are written to
+        file are instances of matplotlib.figure.Figure, that are released with the last reference to them.
+
+        :param runType: type of the calculation, "opt" or "MD"
+        :param records: array with the records of the calculation
+        :param pdfFileName: name of the output pdf file (None to show the graph to screen)
+        :param maxPoints: maximum number of points of each line of the graph
+        """
+
+        figureSize = (8, 10) if runType == "MD" else None
+        if pdfFileName:
+            from matplotlib.figure import Figure  # figure that is not registered in the state of pyplot
+            figure = Figure(figsize=figureSize, dpi=100, facecolor='w', edgecolor='k')
         else:
-            print("WARNING! the calculation is not an optimization run, skipping analysis... ")
+            import matplotlib.pyplot as plt  # interactive plots
+            figure = plt.figure(num=None, figsize=figureSize, dpi=100, facecolor='w', edgecolor='k')
+
+        if runType == "opt":
+            AmberOutput._optimizationGraph(figure, records, maxPoints)
+        else:
+            AmberOutput._dynamicsGraph(figure, records, maxPoints)
+
+        # write to PDF file or show to screen
+        if pdfFileName:
+            figure.savefig(pdfFileName, bbox_inches='tight')
+        else:
+            plt.show()
 
     # ================================================================================
 
-    def dynamicsPlot(self, pdfFileName=None):
-        """ print graph that shows some variables over the times of the dynamics
+    @staticmethod
+    def _optimizationGraph(figure, records, maxPoints):
+        """ Draw the energy over the steps of an optimization on a matplotlib figure
 
-        :param pdfFileName: name of the output pdf file
+        :param figure: matplotlib figure
+        :param records: array with the records of the optimization
+        :param maxPoints: maximum number of points of the line of the graph
         """
 
-        if self.type == "MD":
+        # extract results in a format that can be plot
+        x, y = records["NSTEP"], records["ENERGY"] / constants.Hatree2kcalmol
 
-            # plot data with matplotlib
-            import matplotlib.pyplot as plt
-            # create a figure
-            fig = plt.figure(num=None, figsize=(8, 10), dpi=100, facecolor='w', edgecolor='k')
+        graph = figure.add_subplot(1, 1, 1)
+        graph.plot(*AmberOutput._downsample(x, y, maxPoints), label="optimization energy", c="#e6194B",
+                   ls="-", lw=2, marker="o")
+        graph.set_ylabel("energy / Hartree"), graph.set_xlabel("optimization step")
 
-            # define the plots that are needed
-            if self.volume is None and self.pressure is None:
-                nrgraphs = 2
-            else:
-                nrgraphs = 3
-            graphA = fig.add_subplot(str(nrgraphs) + "1" + str(nrgraphs))  # this will be the graph with the energy
-            graphB = fig.add_subplot(str(nrgraphs) + "1" + str(nrgraphs - 1),
-                                     sharex=graphA)  # this will be the temperature
-            graphC1, graphC2 = None, None
-            if self.volume is not None or self.pressure is not None:
-                graphC1 = fig.add_subplot("311", sharex=graphA)
-                graphC2 = graphC1.twinx()
-
-            # plot energy
-            x, y = zip(*sorted(self.energy.items()))
-            ln1 = graphA.plot(np.array(x) / constants.ps2au, y, label="total energy", c="#4363d8", ls="-", lw=2)
-
-            # plot temperature and average
-            x, y = zip(*sorted(self.temperature.items()))
-            y2 = [sum(y[0:i + 1]) / float(i + 1) for i in range(len(y))]
-            ln2 = graphB.plot(np.array(x) / constants.ps2au, y, label="inst. temperature", c="#e6194B", ls="--", lw=1)
-            ln3 = graphB.plot(np.array(x) / constants.ps2au, y2, label="avg.  temperature", c="#e6194B", ls="-", lw=2)
-
-            # plot pressure and average
-            if self.pressure is not None:
-                x, y = zip(*sorted(self.pressure.items()))
-                y2 = [sum(y[0:i + 1]) / float(i + 1) for i in range(len(y))]
-                ln4 = graphC1.plot(np.array(x) / constants.ps2au, y, label="inst. pressure", c="#3cb44b", ls="--", lw=1)
-                ln5 = graphC1.plot(np.array(x) / constants.ps2au, y2, label="avg.  pressure", c="#3cb44b", ls="-", lw=2)
-            else:
-                ln4, ln5 = [], []
-            # plot volume
-            if self.volume is not None:
-                x, y = zip(*sorted(self.volume.items()))
-                ln6 = graphC2.plot(np.array(x) / constants.ps2au, np.array(y) * constants.Bohr2Ang ** 3,
-                                   label="volume", c="#ffe119", ls="-", lw=2)
-            else:
-                ln6 = []
-
-            # define labels
-            graphA.set_ylabel("E / Hartree"), graphA.set_xlabel("t / ps")
-            graphB.set_ylabel("T / K")
-            if graphC1: graphC1.set_ylabel("p / bar")
-            if graphC2: graphC2.set_ylabel("V / $\AA^3$")
-
-            # create legends
-            graphA.legend(ln1, [line.get_label() for line in ln1])
-            graphB.legend(ln2 + ln3, [line.get_label() for line in ln2 + ln3])
-            if graphC1: graphC1.legend(ln4 + ln5 + ln6, [line.get_label() for line in ln4 + ln5 + ln6])
-
-            # write to PDF file or show to screen
-            if pdfFileName:
-                plt.savefig(pdfFileName, bbox_inches='tight')
-            else:
-                plt.show()
+    # ================================================================================
 
+    @staticmethod
+    def _dynamicsGraph(figure, records, maxPoints):
+        """ Draw energy, temperature, pressure and volume over the time of a dynamics on a matplotlib figure
+
+        :param figure: matplotlib figure
+        :param records: array with the records of the dynamics
+        :param maxPoints: maximum number of points of each line of the graph
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        # the records are ordered by time, the time is in ps
+        records = records[np.argsort(records["TIME"], kind="stable")]
+        x = records["TIME"]
+
+        def plot(graph, y, **kwargs):
+            return graph.plot(*AmberOutput._downsample(x, y, maxPoints), **kwargs)
+
+        def runningAverage(y):
+            return np.cumsum(y) / np.arange(1, len(y) + 1)
+
+        # define the plots that are needed
+        pressureName = AmberOutput._recordColumn("MD", records, "pressure")
+        volumeName = AmberOutput._recordColumn("MD", records, "volume")
+        nrgraphs = 2 if volumeName is None and pressureName is None else 3
+        graphA = figure.add_subplot(nrgraphs, 1, nrgraphs)  # this will be the graph with the energy
+        graphB = figure.add_subplot(nrgraphs, 1, nrgraphs - 1, sharex=graphA)  # this will be the temperature
+        graphC1, graphC2 = None, None
+        if nrgraphs == 3:
+            graphC1 = figure.add_subplot(nrgraphs, 1, 1, sharex=graphA)
+            graphC2 = graphC1.twinx()
+
+        # plot energy
+        ln1 = plot(graphA, records["Etot"] / constants.Hatree2kcalmol, label="total energy", c="#4363d8",
+                   ls="-", lw=2)
+
+        # plot temperature and average
+        y = records["TEMP"]
+        ln2 = plot(graphB, y, label="inst. temperature", c="#e6194B", ls="--", lw=1)
+        ln3 = plot(graphB, runningAverage(y), label="avg.  temperature", c="#e6194B", ls="-", lw=2)
+
+        # plot pressure and average
+        if pressureName is not None:
+            y = records[pressureName]
+            ln4 = plot(graphC1, y, label="inst. pressure", c="#3cb44b", ls="--", lw=1)
+            ln5 = plot(graphC1, runningAverage(y), label="avg.  pressure", c="#3cb44b", ls="-", lw=2)
         else:
-            print("WARNING! the calculation is not a dynamics simulation, skipping analysis... ")
+            ln4, ln5 = [], []
+        # plot volume
+        if volumeName is not None:
+            ln6 = plot(graphC2, records[volumeName], label="volume", c="#ffe119", ls="-", lw=2)
+        else:
+            ln6 = []
+
+        # define labels
+        graphA.set_ylabel("E / Hartree"), graphA.set_xlabel("t / ps")
+        graphB.set_ylabel("T / K")
+        if graphC1: graphC1.set_ylabel("p / bar")
+        if graphC2: graphC2.set_ylabel(r"V / $\AA^3$")
+
+        # create legends
+        graphA.legend(ln1, [line.get_label() for line in ln1])
+        graphB.legend(ln2 + ln3, [line.get_label() for line in ln2 + ln3])
+        if graphC1: graphC1.legend(ln4 + ln5 + ln6, [line.get_label() for line in ln4 + ln5 + ln6])
+
+    # ================================================================================
+
+    @staticmethod
+    def _downsample(x, y, maxPoints):
+        """ Reduce a line to at most maxPoints points, preserving its shape: the inner points of the line are
+        divided in buckets of consecutive points, and of each bucket only the points with the minimum and
+        the maximum value are kept, together with the first and the last point of the line. In this way the
+        peaks and the envelope of a noisy series are drawn as with all the points.
+
+        :param x: array with the abscissas of the points, in increasing order
+        :param y: array with the values of the points
+        :param maxPoints: maximum number of points of the line (None to keep all the points)
+        :return: tuple (x, y) of arrays with the points that are kept
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        x, y = np.asarray(x), np.asarray(y)
+        if maxPoints is None or len(y) <= max(maxPoints, 4):
+            return x, y
+
+        # buckets of consecutive inner points, two points are kept for each bucket
+        inner = y[1:-1]
+        edges = np.unique(np.linspace(0, len(inner), max(1, (maxPoints - 2) // 2) + 1).astype(int))
+        bucket = np.repeat(np.arange(len(edges) - 1), np.diff(edges))
+
+        def firstOfBuckets(mask):  # first point of each bucket where mask is true
+            positions = np.flatnonzero(mask)
+            return positions[np.concatenate(([True], bucket[positions[1:]] != bucket[positions[:-1]]))]
+
+        # NaNs are ignored in the search of the extremes, a bucket that is all NaN keeps its first point
+        low, high = np.where(np.isnan(inner), np.inf, inner), np.where(np.isnan(inner), -np.inf, inner)
+        minima = firstOfBuckets(low == np.minimum.reduceat(low, edges[:-1])[bucket])
+        maxima = firstOfBuckets(high == np.maximum.reduceat(high, edges[:-1])[bucket])
+        keep = np.unique(np.concatenate(([0], minima + 1, maxima + 1, [len(y) - 1])))
+        return x[keep], y[keep]
+
+
+#####################################################################################################
+
+class AmberSegmentedOutput(AmberOutput):
+    """The AmberSegmentedOutput class collects the results of a molecular dynamics that has been run in
+    segments with AmberCalculator.runSegmented, and gives a view of the segments as a single AmberOutput.
+    The time series of the segments are stitched together on a continuous time axis, and the snapshots
+    are numbered continuously along the whole dynamics. The output files of each segment are parsed
+    separately, by an AmberOutput instance of its own."""
+
+    def __init__(self, outDir, segments, storeFiles=False):
+        """ Constructor of the AmberSegmentedOutput instance. Needs as arguments the path of the directory where
+        the segments are stored and the list of the AmberOutput instances of the segments, in the order of
+        the dynamics. The logical variable storeFiles defines whether the whole directory of the segments
+        is removed or not when cleaning the AmberSegmentedOutput instance.
+
+        :param outDir:  path of the directory where the segments of the calculation are stored
+        :param segments: list of AmberOutput instances with the results of the segments
+        :param storeFiles: Amber files are removed or not when closing the AmberSegmentedOutput instance
+        """
+
+        # initialize storeFiles to True, in this way when the constructor dyes unexpectedly we can save the files
+        self.storeFiles = True
+
+        # store the path of the directory where the segments are, and the list of the segments
+        self.outDir = outDir
+        self.segments = segments
+        # the NetCDF files are opened by the AmberOutput instances of the segments
+        self._netcdfFiles = {}
+        self._archive = None
+        self._lean, self._topology = False, None
+        self._closed = False
+        _CLEANUP.track(self)
+        # access to the gradient stored in the mdcrd files of the segments
+        self._gradient = None
+        # number of frames stored in the mdcrd of each segment, read only when snapshots are requested
+        self._segmentFrames = None
+
+        # setup the dictionary with the data, values that are not defined for the whole run are set to None
+        self.dataDict = {
+            "type": "MD",  # a segmented calculation is always a MD run
+            "topology": segments[0].topology,  # topology file of the system, the same for all the segments
+            "logtext": None,  # each segment has its own log file
+            "mdcrdstart": segments[0].mdcrdstart,  # nr of the first step that should be found in the mdcrd file
+            "mdcrdfile": None,  # each segment has its own mdcrd file
+            "restrtfile": segments[-1].restrtfile,  # final restart file, the one of the last segment
+            "records": None,  # records of the steps of all the segments, with a continuous time
+            "runinfo": None,  # each segment has its own record of the run
+            "timings": None,  # each segment has its own timings
+        }
+
+        # stitch together the records of the segments
+        self.dataDict["records"] = AmberSegmentedOutput._stitchRecords([segment.records for segment in segments])
+
+        # store the value of storeFiles
+        self.storeFiles = storeFiles
+
+    # ================================================================================
+
+    def close(self):
+        """ Close the files of the segments and, unless storeFiles is True, remove the directory of
+        the segments (see AmberOutput.close) """
+
+        for segment in self.segments:
+            segment.close()
+        super().close()
+
+    # ================================================================================
+
+    @staticmethod
+    def _stitchRecords(recordsList):
+        """ Concatenate the records of consecutive runs on a continuous time axis: the clock of AMBER starts again
+        from zero in each run, since the time is not written in the crd, so the time of a run is shifted when it
+        does not follow the time of the previous runs. Runs without time (optimizations) are not shifted.
+
+        :param recordsList: list of structured arrays with the records of the runs
+        :return: structured array with all the records
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        timeShift, stitched = 0.0, []
+        for records in recordsList:
+            if len(records) > 0 and "TIME" in records.dtype.names and not np.all(np.isnan(records["TIME"])):
+                records = records.copy()
+                if np.nanmin(records["TIME"]) <= timeShift: records["TIME"] += timeShift
+                timeShift = np.nanmax(records["TIME"])
+            stitched.append(records)
+        return AmberSegmentedOutput._concatenateRecords(stitched)
+
+    @staticmethod
+    def _concatenateRecords(recordsList):
+        """ Concatenate the structured arrays with the records of the segments. The columns are the union
+        of the columns of the segments, and a term that is missing in a segment is NaN.
+
+        :param recordsList: list of structured arrays with the records of the segments
+        :return: structured array with all the records
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        names = list(dict.fromkeys(name for records in recordsList for name in records.dtype.names))
+        records = np.zeros(sum(len(r) for r in recordsList),
+                           dtype=[(name, np.int64 if name == "NSTEP" else np.float64) for name in names])
+        for name in names:
+            if name != "NSTEP": records[name] = np.nan
+        start = 0
+        for segmentRecords in recordsList:
+            for name in segmentRecords.dtype.names:
+                records[name][start:start + len(segmentRecords)] = segmentRecords[name]
+            start += len(segmentRecords)
+        return records
+
+    # ================================================================================
+
+    def _frameCounts(self):
+        """ Return the list with the number of frames of the mdcrd files of the segments, that are read
+        only the first time that this is needed """
+
+        if self._segmentFrames is None:
+            self._segmentFrames = [segment._netcdf(segment.mdcrdfile).numrecs for segment in self.segments]
+        return self._segmentFrames
+
+    # ================================================================================
+
+    def _locateSnapshot(self, nrSnap):
+        """ Find the segment that contains the snapshot with global index nrSnap, and the index
+        of the snapshot within the mdcrd file of that segment
+
+        :param nrSnap: global index of the requested snapshot
+        :return: the AmberOutput of the segment and the index of the snapshot in the segment
+        """
+
+        # negative indices count backwards from the last snapshot of the last segment
+        if nrSnap < 0: nrSnap += sum(self._frameCounts())
+        for segment, nrFrames in zip(self.segments, self._frameCounts()):
+            if 0 <= nrSnap < nrFrames:
+                return segment, nrSnap
+            nrSnap -= nrFrames
+
+        raise AmberError("requested snapshot is not present in Amber results")
+
+    # ================================================================================
+
+    def snapshot(self, nrSnap=-1):
+        """Extract one of the snapshots of the segmented dynamics, using the nrSnap integer index
+        that counts the snapshots stored in the mdcrd files of all the segments. When nrSnap is
+        equal to -1, the restart file of the last segment is read and the final results are returned.
+
+         :param nrSnap: requested snapshot to extract
+         :return: AmberSnapshot object with the requested snapshot"""
+
+        if nrSnap == -1:
+            return self.segments[-1].snapshot(-1)
+        else:
+            segment, nrSegmentSnap = self._locateSnapshot(nrSnap)
+            return segment.snapshot(nrSegmentSnap)
+
+    # ================================================================================
+
+    def snapshots(self, selection=slice(None)):
+        """Extract many snapshots of the segmented dynamics, with a selection (integer, slice or list/array
+        of integers) of the indices that count the snapshots stored in the mdcrd files of all the segments.
+        The snapshots of each segment are read in a single pass, and all the snapshots are returned stacked
+        in an AmberTrajectory instance.
+
+         :param selection: requested snapshots
+         :return: AmberTrajectory object with the requested snapshots"""
+        import numpy as np  # numpy: arrays and math utilities
+
+        # read the consecutive frames that belong to the same segment together
+        trajectories = [segment.snapshots(frames) for segment, frames in self._framesBySegment(selection)]
+        if not trajectories:
+            return self.segments[0].snapshots([])
+
+        trajectory = AmberTrajectory.concatenate(trajectories)
+        trajectory.frames = np.atleast_1d(np.arange(sum(self._frameCounts()))[selection])
+        return trajectory
+
+    # ================================================================================
+
+    def _framesBySegment(self, selection=slice(None)):
+        """ Locate a selection of global indices of the snapshots in the mdcrd files of the segments: return
+        a list of (AmberOutput, frames) tuples, one for each run of consecutive frames of the selection that
+        belong to the same segment, with the indices of the frames within the mdcrd file of the segment """
+        import numpy as np  # numpy: arrays and math utilities
+
+        # global indices of the frames, and the segment that contains each frame
+        offsets = np.cumsum([0] + self._frameCounts())
+        frames = np.atleast_1d(np.arange(offsets[-1])[selection])
+        segmentIndices = np.searchsorted(offsets, frames, side="right") - 1
+
+        pieces = []
+        for run in np.split(np.arange(len(frames)), np.flatnonzero(np.diff(segmentIndices)) + 1):
+            if len(run) == 0: continue
+            nrSegment = segmentIndices[run[0]]
+            pieces.append((self.segments[nrSegment], frames[run] - offsets[nrSegment]))
+        return pieces
+
+    # ================================================================================
+
+    @property
+    def gradient(self):
+        """Give access to the gradient of the energy stored in the mdcrd output files of the segments,
+        with an AmberGradient instance in which the frames of the segments are concatenated along the
+        whole dynamics. If the force is not present in the calculation, return None. """
+
+        if self._gradient is None:
+            gradients = [segment.gradient for segment in self.segments]
+            if any(g is None for g in gradients):
+                return None
+            self._gradient = AmberGradient([forces for g in gradients for forces in g._forces])
+        return self._gradient
+
+
+#####################################################################################################
+
+class AmberOutputCollection:
+    """The AmberOutputCollection class collects the results of a chain of Amber calculations (e.g. the minimization
+    and the MD stages of an equilibration protocol), each one stored in its own AmberOutput, and joins the terms
+    printed at each step in a single array of records, with a continuous time axis along the MD stages.
+    The time series of the records can be analysed with vectorized statistical tools: running averages, block
+    averages, autocorrelation times and the automatic detection of the equilibration (the initial part of the
+    series that should be discarded). The series are named after the columns of the records (e.g. 'EPtot', 'TEMP',
+    'Density') or with the aliases energy, temperature, pressure and volume, and they are in the units of the
+    AMBER output (kcal/mol, K, bar, Ang^3, ps)."""
+
+    # aliases of the columns of the records of a MD run
+    _ALIASES = {"energy": "Etot", "temperature": "TEMP", "pressure": "PRESS", "volume": "VOLUME"}
+    # maximum number of elements of the arrays of the autocorrelation functions computed together
+    _FFTBLOCK = 2 ** 22
+
+    def __init__(self, outputs):
+        """Define an instance of AmberOutputCollection from the outputs of the stages, in the order in which
+        they have been run.
+
+        :param outputs: list of AmberOutput (or AmberSegmentedOutput) instances
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        self.outputs = list(outputs)
+        if not self.outputs:
+            raise AmberError("AmberOutputCollection: at least one AmberOutput is needed")
+
+        # records of all the stages with a continuous time, and the index of the stage of each record
+        records = AmberSegmentedOutput._stitchRecords([output.records for output in self.outputs])
+        self.stages = np.repeat(np.arange(len(self.outputs)), [len(output.records) for output in self.outputs])
+        self.records = records
+
+    # =============================================================================================================
+
+    def __len__(self):
+        """Number of stages of the collection"""
+        return len(self.outputs)
+
+    def __getitem__(self, item):
+        """Return the AmberOutput of a stage"""
+        return self.outputs[item]
+
+    def __iter__(self):
+        return iter(self.outputs)
+
+    def __repr__(self):
+        return "AmberOutputCollection({0} stages: {1}, {2} records)".format(
+            len(self), ", ".join(output.type for output in self.outputs), len(self.records))
+
+    # =============================================================================================================
+
+    def series(self, name, stages=None):
+        """Time series of a term of the records, for the steps in which the term and the time are defined
+        (i.e. the steps of the MD stages)
+
+        :param name: name of the column of the records (e.g. 'EPtot') or alias (energy, temperature, ...)
+        :param stages: list with the indices of the stages, None for all the stages
+        :return: array with the times (ps), array with the values
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        column = AmberOutputCollection._ALIASES.get(name, name)
+        if column not in self.records.dtype.names:
+            raise AmberError("AmberOutputCollection: {0} is not printed in the records".format(name))
+        if "TIME" not in self.records.dtype.names:
+            return np.zeros(0), np.zeros(0)
+        selected = ~np.isnan(self.records["TIME"]) & ~np.isnan(self.records[column])
+        if stages is not None:
+            selected &= np.isin(self.stages, stages)
+        return self.records["TIME"][selected], self.records[column][selected]
+
+    def runningAverage(self, name, window=None, stages=None):
+        """Running average of a time series, over the whole previous series or over a moving window
+
+        :param name: name of the series (see the series method)
+        :param window: number of steps of the moving window, None for the cumulative average
+        :param stages: list with the indices of the stages, None for all the stages
+        :return: array with the times (ps) at the end of the windows, array with the averages
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        time, values = self.series(name, stages)
+        sums = np.cumsum(np.append(0., values))
+        if window is None:
+            return time, sums[1:] / np.arange(1, len(values) + 1)
+        if window < 1 or window > len(values):
+            raise AmberError("AmberOutputCollection: the window should be between 1 and {0} steps".format(
+                len(values)))
+        return time[window - 1:], (sums[window:] - sums[:-window]) / window
+
+    def blockAverage(self, name, nBlocks=5, start=0, stages=None):
+        """Average of a time series, with the error estimated from the averages of nBlocks blocks of consecutive
+        steps (a few steps at the end of the series are discarded to have blocks of equal length)
+
+        :param name: name of the series (see the series method)
+        :param nBlocks: number of blocks
+        :param start: index of the first step of the series that is used (e.g. the end of the equilibration)
+        :param stages: list with the indices of the stages, None for all the stages
+        :return: average, standard error of the average
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        values = self.series(name, stages)[1][start:]
+        blockSize = len(values) // nBlocks
+        if nBlocks < 2 or blockSize < 1:
+            raise AmberError("AmberOutputCollection: {0} steps cannot be divided in {1} blocks".format(
+                len(values), nBlocks))
+        blocks = values[:nBlocks * blockSize].reshape(nBlocks, blockSize).mean(axis=1)
+        return float(values.mean()), float(blocks.std(ddof=1) / np.sqrt(nBlocks))
+
+    def autocorrelationTime(self, name, start=0, stages=None):
+        """Integrated autocorrelation time of a time series, (g - 1) / 2 times the time between two steps,
+        where g is the statistical inefficiency (the number of steps that give one independent sample)
+
+        :param name: name of the series (see the series method)
+        :param start: index of the first step of the series that is used (e.g. the end of the equilibration)
+        :param stages: list with the indices of the stages, None for all the stages
+        :return: autocorrelation time (ps)
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        time, values = self.series(name, stages)
+        time, values = time[start:], values[start:]
+        if len(values) < 2:
+            raise AmberError("AmberOutputCollection: at least two steps are needed for the autocorrelation")
+        inefficiency = AmberOutputCollection._statisticalInefficiency(values, np.zeros(1, dtype=np.int64))[0]
+        return float((inefficiency - 1.) / 2. * np.median(np.diff(time)))
+
+    def equilibration(self, name, nCandidates=100, stages=None):
+        """Detect the end of the equilibration of a time series, as the origin that maximizes the number of
+        independent samples of the rest of the series (the number of steps divided by the statistical
+        inefficiency). The statistical inefficiencies of the candidate origins are computed together.
+
+        :param name: name of the series (see the series method)
+        :param nCandidates: number of candidate origins, equally spaced along the series
+        :param stages: list with the indices of the stages, None for all the stages
+        :return: dictionary with the time (ps) and the index of the origin, the statistical inefficiency and
+                 the number of independent samples of the equilibrated series
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        time, values = self.series(name, stages)
+        if len(values) < 3:
+            raise AmberError("AmberOutputCollection: at least three steps are needed to detect the equilibration")
+        origins = np.unique(np.linspace(0, len(values) - 2, min(nCandidates, len(values) - 1)).astype(np.int64))
+        inefficiencies = AmberOutputCollection._statisticalInefficiency(values, origins)
+        samples = (len(values) - origins) / inefficiencies
+        best = int(np.argmax(samples))
+        return {"time": float(time[origins[best]]), "index": int(origins[best]),
+                "inefficiency": float(inefficiencies[best]), "samples": float(samples[best])}
+
+    def summary(self, names=("energy", "temperature", "pressure", "volume"), nBlocks=5):
+        """Statistics of many time series, for the screening of the results: for each series, the end of
+        the equilibration, and the average, the error and the autocorrelation time of the equilibrated part.
+        Series that are not printed in the records, or that are too short, are skipped.
+
+        :param names: names of the series (see the series method)
+        :param nBlocks: number of blocks of the estimate of the error of the averages
+        :return: dictionary {name: dictionary with equilibration, average, error and autocorrelation time}
+        """
+
+        summary = {}
+        for name in names:
+            try:
+                equilibration = self.equilibration(name)
+                average, error = self.blockAverage(name, nBlocks=nBlocks, start=equilibration["index"])
+                tau = self.autocorrelationTime(name, start=equilibration["index"])
+            except AmberError:
+                continue
+            summary[name] = {"equilibration": equilibration["time"], "average": average, "error": error,
+                             "autocorrelation": tau}
+        return summary
+
+    # =============================================================================================================
+
+    @staticmethod
+    def _statisticalInefficiency(values, origins):
+        """Statistical inefficiency g = 1 + 2 sum_t (1 - t/N) C(t) of the series values[origin:], for each origin.
+        The normalized autocorrelation functions C(t) are computed with FFT, for many origins in each call, and
+        the sum is truncated at the first time in which C(t) is not positive. A constant series has g = 1.
+
+        :param values: array with the time series
+        :param origins: array with the indices of the first step of the series
+        :return: array with the statistical inefficiencies of the series that start from the origins
+        """
+        import numpy as np  # numpy: arrays and math utilities
+
+        values, origins = np.asarray(values, dtype=np.float64), np.asarray(origins, dtype=np.int64)
+        size, fftSize = len(values), 1 << int(2 * len(values) - 1).bit_length()
+        lags = np.arange(size)
+        rows = max(1, AmberOutputCollection._FFTBLOCK // fftSize)
+        inefficiencies = np.ones(len(origins))
+
+        for start in range(0, len(origins), rows):
+            # the series of each origin is shifted to the beginning of its row, padded with zeros
+            first = origins[start:start + rows]
+            lengths = size - first
+            positions = first[:, None] + lags[None, :]
+            inside = positions < size
+            series = np.where(inside, values[np.minimum(positions, size - 1)], 0.)
+            series -= np.where(inside, (series.sum(axis=1) / lengths)[:, None], 0.)
+
+            # autocorrelation functions, normalized with the number of pairs of each lag and with the variance
+            transform = np.fft.rfft(series, n=fftSize, axis=1)
+            correlation = np.fft.irfft(transform * transform.conj(), n=fftSize, axis=1)[:, :size]
+            correlation /= np.maximum(lengths[:, None] - lags[None, :], 1)
+            variance = correlation[:, 0].copy()
+            constant = variance <= 0.
+            correlation[:, 1:] /= np.where(constant, 1., variance)[:, None]
+
+            # sum up to the first non-positive value of the autocorrelation function
+            positive = np.cumprod(correlation[:, 1:] > 0., axis=1).astype(bool) & inside[:, 1:]
+            weights = 1. - lags[None, 1:] / lengths[:, None]
+            g = 1. + 2. * np.sum(np.where(positive, weights * correlation[:, 1:], 0.), axis=1)
+            inefficiencies[start:start + rows] = np.where(constant, 1., np.maximum(g, 1.))
+
+        return inefficiencies
 
 
 # #####################################################################################################
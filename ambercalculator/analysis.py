@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#    COBRAMM
+#    Copyright (c) 2019 ALMA MATER STUDIORUM - Università di Bologna
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#####################################################################################################
+
+# Analysis of the trajectories of AMBER calculations: RMSD, RMSF, radius of gyration, radial distribution
+# functions, mean square displacement and occupancy of the solvation shell.
+# The frames of the mdcrd files are read in chunks of a fixed number of frames, and only the coordinates of
+# the atoms that are needed by the analysis are copied from the memory-mapped file. Each chunk is processed
+# by a vectorized kernel (a function of this module), that returns either the values of the frames of the
+# chunk or partial sums: the results of the chunks are then reduced, concatenating or adding them.
+# The chunks are independent, and they can be processed in parallel on a pool of processes: in this case
+# each process opens the mdcrd file by itself, and only the small results of the kernels are sent back.
+# The memory is therefore set by the size of the chunks and by the number of processes, and it does not
+# depend on the length of the trajectory.
+
+import itertools  # functions creating iterators for efficient looping
+import math  # import mathematical functions
+import numbers  # abstract base classes of the numeric types
+
+import numpy as np  # numpy: arrays and math utilities
+
+from ambercalculator.ambercalculator import AmberCalculator, AmberError, AmberOutput, AmberSelection, \
+    AmberSnapshot, AmberTopology
+
+# maximum number of atom pairs (times the periodic images) of the distance matrices computed at once
+_PAIRBLOCK = 2 ** 18
+
+
+#####################################################################################################
+
+class AmberAnalysis:
+    """ The AmberAnalysis class computes structural and dynamical properties over the frames stored in the
+    mdcrd files of an AmberOutput (or AmberSegmentedOutput). The frames are selected as in AmberOutput.snapshots
+    (frame indices for a MD run, step numbers for an optimization), and the atoms with an AmberSelection, with
+    an Amber mask of atoms ('@1-10' or '1-10') or residues (':1-3'), or with an array of indices starting from 0.
+    The masses and the residues of the atoms are read from the AmberTopology of the system. Coordinates and
+    distances are in Angstrom. The memory used by an analysis is approximately
+    chunkSize * (number of selected atoms) * 24 bytes for each process. """
+
+    def __init__(self, output, topology=None, chunkSize=64, nProcesses=1):
+        """ Constructor of the AmberAnalysis instance
+
+        :param output: AmberOutput (or AmberSegmentedOutput) with the results of the calculation
+        :param topology: AmberTopology of the system, when None the topology of the calculation is used
+        :param chunkSize: number of frames that are read and processed together
+        :param nProcesses: number of parallel processes (None to use the number of processors of the machine)
+        """
+
+        if chunkSize < 1:
+            raise AmberError("AmberAnalysis: the size of the chunks should be a positive number of frames")
+        self.output = output
+        self.topology = AmberTopology(output.topology) if topology is None else topology
+        self.chunkSize = int(chunkSize)
+        self.nProcesses = nProcesses
+
+        # per-atom metadata from the topology: masses and residue index (starting from 0) of each atom
+        masses, residuePointers = self.topology.section("MASS"), self.topology.section("RESIDUE_POINTER")
+        if masses is None or residuePointers is None:
+            raise AmberError("AmberAnalysis: MASS and RESIDUE_POINTER sections of the topology are needed")
+        self.masses = np.asarray(masses, dtype=np.float64)
+        self.residues = np.repeat(np.arange(len(residuePointers)),
+                                  np.diff(np.append(residuePointers, len(self.masses) + 1)))
+
+    # =============================================================================================================
+
+    def atoms(self, selection=None):
+        """ Convert a selection of atoms to the sorted array of their indices (starting from 0)
+
+        :param selection: AmberSelection of atoms, Amber mask of atoms ('@1-10', '1-10') or residues (':1-3'),
+                          array of indices starting from 0, or None to select all the atoms
+        :return: array with the indices of the atoms
+        """
+
+        if selection is None:
+            indices = np.arange(len(self.masses))
+        elif isinstance(selection, AmberSelection):
+            indices = selection.indices
+        elif isinstance(selection, str) and selection.strip(" \'\"").startswith(":"):
+            indices = np.flatnonzero(AmberSelection.frommask(selection).contains(self.residues + 1))
+        elif isinstance(selection, str):
+            indices = AmberSelection.frommask(selection).indices
+        else:
+            indices = np.unique(np.asarray(selection, dtype=np.int64))
+        if len(indices) == 0:
+            raise AmberError("AmberAnalysis: the selection of atoms is empty")
+        if indices[0] < 0 or indices[-1] >= len(self.masses):
+            raise AmberError("AmberAnalysis: the selection of atoms exceeds the {0} atoms of the topology".format(
+                len(self.masses)))
+        return indices
+
+    # =============================================================================================================
+
+    def _tasks(self, kernel, frames, atoms, parameters):
+        """ Split the selected frames in chunks of at most chunkSize frames, that do not cross the boundaries of
+        the mdcrd files, and define the task that processes each chunk with the kernel """
+
+        tasks = []
+        for segment, segmentFrames in self.output._framesBySegment(frames):
+            # the mdcrd of an optimization has no unit cell, that is constant and stored in the restrt
+            unitcell = segment.snapshot(-1).unitcell if segment.type == "opt" else None
+            for start in range(0, len(segmentFrames), self.chunkSize):
+                tasks.append((kernel, segment.mdcrdfile, segmentFrames[start:start + self.chunkSize], atoms,
+                              None if unitcell is None else np.asarray(unitcell, dtype=np.float64), parameters))
+        if not tasks:
+            raise AmberError("AmberAnalysis: the selection of frames is empty")
+        return tasks
+
+    def _map(self, kernel, frames, atoms, parameters):
+        """ Process the chunks of the selected frames with the kernel, serially or on a pool of processes,
+        and return an iterator over the results of the chunks, in the order of the frames """
+        import concurrent.futures  # launch parallel tasks on a pool of processes
+
+        tasks = self._tasks(kernel, frames, atoms, parameters)
+        if self.nProcesses == 1 or len(tasks) == 1:
+            yield from map(_processChunk, tasks)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.nProcesses) as executor:
+                yield from executor.map(_processChunk, tasks)
+
+    def _series(self, kernel, frames, atoms, parameters):
+        """ Values of the frames computed by the kernel, concatenated along the selected frames """
+        return np.concatenate(list(self._map(kernel, frames, atoms, parameters)))
+
+    def _sum(self, kernel, frames, atoms, parameters):
+        """ Sum of the partial sums computed by the kernel (tuples of arrays) over the chunks of frames """
+        total = None
+        for result in self._map(kernel, frames, atoms, parameters):
+            total = result if total is None else tuple(t + r for t, r in zip(total, result))
+        return total
+
+    # =============================================================================================================
+
+    def _reference(self, reference, frames, atoms):
+        """ Coordinates of the atoms in the reference structure: an AmberSnapshot, the snapshot with the given
+        index (see AmberOutput.snapshots) or, when reference is None, the first selected frame """
+
+        if isinstance(reference, AmberSnapshot):
+            return np.asarray(reference.coords, dtype=np.float64).T[atoms]
+        if reference is not None and not isinstance(reference, numbers.Integral):
+            raise AmberError("AmberAnalysis: the reference should be an AmberSnapshot or the index of a frame")
+        segment, segmentFrames = self.output._framesBySegment(frames if reference is None else [reference])[0]
+        with AmberOutput._openNetCDF(segment.mdcrdfile) as ncFile:
+            return _readChunk(ncFile, segmentFrames[:1], atoms, None)[0][0]
+
+    def _weights(self, atoms, massWeighted):
+        """ Normalized weights of the atoms, proportional to the masses of the topology or uniform """
+        weights = self.masses[atoms] if massWeighted else np.ones(len(atoms))
+        return weights / weights.sum()
+
+    # =============================================================================================================
+
+    def rmsd(self, selection=None, frames=slice(None), reference=None, fit=True, massWeighted=False):
+        """ Root mean square deviation of the selected atoms from a reference structure, for each selected frame.
+        With fit, the translation and the rotation that minimize the deviation are removed (Kabsch algorithm).
+
+        :param selection: atoms of the analysis (see the atoms method), None for all the atoms
+        :param frames: selection of the frames (see AmberOutput.snapshots)
+        :param reference: AmberSnapshot or index of the reference frame, None for the first selected frame
+        :param fit: superimpose each frame on the reference before computing the deviation
+        :param massWeighted: weight the atoms with their masses
+        :return: array with the RMSD (Ang) of the selected frames
+        """
+
+        atoms = self.atoms(selection)
+        weights = self._weights(atoms, massWeighted)
+        parameters = {"reference": self._reference(reference, frames, atoms), "weights": weights, "fit": fit}
+        return self._series(_rmsdKernel, frames, atoms, parameters)
+
+    def rmsf(self, selection=None, frames=slice(None), reference=None, fit=True, massWeighted=False):
+        """ Root mean square fluctuation of the selected atoms around their average position over the selected
+        frames. With fit, each frame is first superimposed on the reference structure.
+
+        :param selection: atoms of the analysis (see the atoms method), None for all the atoms
+        :param frames: selection of the frames (see AmberOutput.snapshots)
+        :param reference: AmberSnapshot or index of the frame used for the fit, None for the first selected frame
+        :param fit: superimpose each frame on the reference before computing the fluctuations
+        :param massWeighted: weight the atoms with their masses in the fit
+        :return: array with the RMSF (Ang) of the selected atoms
+        """
+
+        atoms = self.atoms(selection)
+        weights = self._weights(atoms, massWeighted)
+        parameters = {"reference": self._reference(reference, frames, atoms) if fit else None, "weights": weights}
+        count, total, squares = self._sum(_fluctuationKernel, frames, atoms, parameters)
+        average = total / count
+        return np.sqrt(np.maximum(squares / count - np.sum(average ** 2, axis=1), 0.))
+
+    def radiusOfGyration(self, selection=None, frames=slice(None), massWeighted=True):
+        """ Radius of gyration of the selected atoms, for each selected frame
+
+        :param selection: atoms of the analysis (see the atoms method), None for all the atoms
+        :param frames: selection of the frames (see AmberOutput.snapshots)
+        :param massWeighted: weight the atoms with their masses
+        :return: array with the radius of gyration (Ang) of the selected frames
+        """
+
+        atoms = self.atoms(selection)
+        return self._series(_gyrationKernel, frames, atoms, {"weights": self._weights(atoms, massWeighted)})
+
+    def msd(self, selection=None, frames=slice(None), reference=None):
+        """ Mean square displacement of the selected atoms from their positions in the reference frame, for
+        each selected frame. The coordinates should not be wrapped in the unit cell (iwrap = 0, the default
+        of AMBER). Each chunk is processed independently, so the displacements are taken from a single origin.
+
+        :param selection: atoms of the analysis (see the atoms method), None for all the atoms
+        :param frames: selection of the frames (see AmberOutput.snapshots)
+        :param reference: AmberSnapshot or index of the origin frame, None for the first selected frame
+        :return: array with the MSD (Ang^2) of the selected frames
+        """
+
+        atoms = self.atoms(selection)
+        parameters = {"reference": self._reference(reference, frames, atoms)}
+        return self._series(_displacementKernel, frames, atoms, parameters)
+
+    # =============================================================================================================
+
+    def rdf(self, selection1, selection2=None, frames=slice(None), rmax=10.0, nbins=100):
+        """ Radial distribution function g(r) of the atoms of selection2 around the atoms of selection1,
+        with the minimum image convention of the unit cell. The same atom is never paired with itself.
+        The largest distance rmax should not exceed half the smallest width of the unit cell.
+
+        :param selection1: atoms at the center of the distribution (see the atoms method)
+        :param selection2: atoms that are distributed around selection1, None to use selection1
+        :param frames: selection of the frames (see AmberOutput.snapshots)
+        :param rmax: largest distance (Ang) of the distribution
+        :param nbins: number of bins of the histogram of the distances
+        :return: array with the centers of the bins (Ang), and array with the values of g(r)
+        """
+
+        atoms1 = self.atoms(selection1)
+        atoms2 = atoms1 if selection2 is None else self.atoms(selection2)
+        atoms = np.union1d(atoms1, atoms2)
+        edges = np.linspace(0., rmax, nbins + 1)
+        parameters = {"first": np.searchsorted(atoms, atoms1), "second": np.searchsorted(atoms, atoms2),
+                      "edges": edges}
+        count, volume, histogram = self._sum(_rdfKernel, frames, atoms, parameters)
+
+        # normalization with the number of distinct pairs and the ideal gas density in the average volume
+        pairs = len(atoms1) * len(atoms2) - len(np.intersect1d(atoms1, atoms2))
+        shells = 4. / 3. * math.pi * (edges[1:] ** 3 - edges[:-1] ** 3)
+        return 0.5 * (edges[1:] + edges[:-1]), histogram / (count * shells * pairs / (volume / count))
+
+    def shellOccupancy(self, solute, solvent, frames=slice(None), cutoff=3.5):
+        """ Number of solvent residues in the solvation shell of the solute, for each selected frame: a residue
+        is in the shell when at least one of its selected atoms is within cutoff from one of the solute atoms.
+        The distances follow the minimum image convention of the unit cell, when it is present.
+
+        :param solute: atoms of the solute (see the atoms method)
+        :param solvent: atoms of the solvent (see the atoms method), e.g. ':2-1000' or the oxygen atoms
+        :param frames: selection of the frames (see AmberOutput.snapshots)
+        :param cutoff: radius (Ang) of the solvation shell
+        :return: array with the number of solvent residues in the shell of the selected frames
+        """
+
+        soluteAtoms, solventAtoms = self.atoms(solute), self.atoms(solvent)
+        atoms = np.union1d(soluteAtoms, solventAtoms)
+        residues = np.unique(self.residues[solventAtoms], return_inverse=True)[1]
+        parameters = {"solute": np.searchsorted(atoms, soluteAtoms), "solvent": np.searchsorted(atoms, solventAtoms),
+                      "residues": residues, "cutoff": cutoff}
+        return self._series(_shellKernel, frames, atoms, parameters)
+
+    # =============================================================================================================
+
+    def __repr__(self):
+        return "AmberAnalysis({0} atoms, chunks of {1} frames, {2} processes)".format(
+            len(self.masses), self.chunkSize, self.nProcesses)
+
+
+#####################################################################################################
+
+# Functions that read and process a chunk of frames: they are defined at module level, so that they can
+# be sent to the processes of the pool
+
+def _processChunk(task):
+    """ Read the coordinates (and the unit cells) of a chunk of frames from the mdcrd file, and process
+    them with the kernel of the analysis
+
+    :param task: tuple with the kernel, the name of the mdcrd file, the indices of the frames, the indices
+                 of the atoms, the unit cell of the calculation (when it is not in the mdcrd) and the
+                 dictionary with the parameters of the kernel
+    :return: result of the kernel
+    """
+
+    kernel, fileName, frames, atoms, unitcell, parameters = task
+    with AmberOutput._openNetCDF(fileName) as ncFile:
+        coords, cells = _readChunk(ncFile, frames, atoms, unitcell)
+    return kernel(coords, cells, **parameters)
+
+
+def _readChunk(ncFile, frames, atoms, unitcell):
+    """ Read the coordinates (Ang) of the atoms with the given indices, and the unit cells (Ang + rad), for
+    a chunk of frames of a mdcrd file: only the selected atoms are copied from the file
+
+    :return: array of the coordinates with shape (frames, atoms, 3), array of the unit cells with shape
+             (frames, 6) or None when the calculation is not periodic
+    """
+
+    variables = ncFile.variables
+    if variables["coordinates"].shape[1] <= atoms[-1]:
+        raise AmberError("AmberAnalysis: {0} has {1} atoms, less than the topology".format(
+            ncFile.fileName, variables["coordinates"].shape[1]))
+
+    # equally spaced frames are read through a strided view of the file, the others one at a time
+    data = variables["coordinates"].data
+    steps = np.diff(frames)
+    if len(steps) == 0 or (steps[0] > 0 and np.all(steps == steps[0])):
+        frames = slice(int(frames[0]), int(frames[-1]) + 1, int(steps[0]) if len(steps) > 0 else 1)
+        selected = data[frames][:, atoms]
+    else:
+        selected = np.empty((len(frames), len(atoms)) + data.shape[2:], dtype=data.dtype)
+        for i, nrFrame in enumerate(frames):
+            selected[i] = data[nrFrame, atoms]
+    coords = AmberOutput._toAtomicUnits(selected, variables["coordinates"].units,
+                                        out=np.empty(selected.shape, dtype=np.float64))
+
+    if "cell_lengths" in variables and "cell_angles" in variables:
+        cells = np.concatenate([AmberOutput._toAtomicUnits(variables[name].data[frames], variables[name].units)
+                                for name in ("cell_lengths", "cell_angles")], axis=1)
+    elif unitcell is not None:
+        cells = np.tile(unitcell, (len(coords), 1))
+    else:
+        cells = None
+    return coords, cells
+
+
+# ================================================================================
+
+def _center(coords, weights):
+    """ Subtract the weighted centroid from the coordinates of each frame """
+    return coords - np.einsum("fni,n->fi", coords, weights)[:, None, :]
+
+
+def _superposition(centered, reference, weights):
+    """ Rotation matrices (acting on row vectors) that superimpose the centered coordinates of each frame on the
+    centered reference, and the singular values of the correlation matrices with the sign of the determinant """
+
+    correlation = np.einsum("fni,n,nj->fij", centered, weights, reference)
+    u, s, vt = np.linalg.svd(correlation)
+    sign = np.sign(np.linalg.det(u) * np.linalg.det(vt))
+    s[:, 2] *= sign
+    u[:, :, 2] *= sign[:, None]
+    return np.matmul(u, vt), s
+
+
+def _rmsdKernel(coords, cells, reference, weights, fit):
+    """ RMSD of each frame from the reference, with the optimal superposition when fit is True """
+
+    if not fit:
+        return np.sqrt(np.einsum("fni,n->f", (coords - reference) ** 2, weights))
+    centered = _center(coords, weights)
+    reference = reference - np.dot(weights, reference)
+    s = _superposition(centered, reference, weights)[1]
+    deviation = np.einsum("fni,fni,n->f", centered, centered, weights) + \
+        np.einsum("ni,ni,n", reference, reference, weights) - 2. * s.sum(axis=1)
+    return np.sqrt(np.maximum(deviation, 0.))
+
+
+def _fluctuationKernel(coords, cells, reference, weights):
+    """ Number of frames, sum of the positions and sum of the square positions of the atoms, after the
+    superposition on the reference when it is given """
+
+    if reference is not None:
+        coords = _center(coords, weights)
+        rotation = _superposition(coords, reference - np.dot(weights, reference), weights)[0]
+        coords = np.matmul(coords, rotation)
+    return len(coords), coords.sum(axis=0), np.einsum("fni,fni->n", coords, coords)
+
+
+def _gyrationKernel(coords, cells, weights):
+    """ Radius of gyration of each frame """
+    centered = _center(coords, weights)
+    return np.sqrt(np.einsum("fni,fni,n->f", centered, centered, weights))
+
+
+def _displacementKernel(coords, cells, reference):
+    """ Mean square displacement of the atoms of each frame from the reference """
+    return np.einsum("fni,fni->f", coords - reference, coords - reference) / coords.shape[1]
+
+
+# ================================================================================
+
+def _images(cell, cutoff):
+    """ Lattice vectors, inverse lattice and shifts of the neighbouring images that should be checked to find the
+    minimum image of the distances up to cutoff, in the unit cell cell (Ang + rad), and volume of the cell. After
+    the distance vectors are wrapped with the fractional coordinates, the neighbouring images are needed only for
+    a non-orthogonal cell. Return None when cell is None (the calculation is not periodic). """
+
+    if cell is None:
+        return None
+    lattice = AmberCalculator._latticeVectors(cell)
+    volume = abs(np.linalg.det(lattice))
+    widths = volume / np.linalg.norm(np.cross(lattice[[1, 2, 0]], lattice[[2, 0, 1]]), axis=1)
+    if cutoff > 0.5 * widths.min():
+        raise AmberError("AmberAnalysis: the distance {0} exceeds half the width of the unit cell {1:.3f}".format(
+            cutoff, 0.5 * widths.min()))
+    if np.allclose(cell[3:], 0.5 * math.pi):
+        shifts = np.zeros((1, 3))
+    else:
+        shifts = np.dot(np.array(list(itertools.product((-1, 0, 1), repeat=3))), lattice)
+    return lattice, np.linalg.inv(lattice), shifts, volume
+
+
+def _distanceBlocks(first, second, images):
+    """ Iterate over the blocks of the square distances between the atoms of first and second (arrays of
+    coordinates of a frame), with the minimum image convention when images (see _images) is not None. The blocks
+    are the rows start:start+n of the distance matrix, and they are yielded as (start, square distances) tuples. """
+
+    lattice, inverse, shifts = images[0:3] if images is not None else (None, None, np.zeros((1, 3)))
+    rows = max(1, _PAIRBLOCK // (len(second) * len(shifts)))
+    for start in range(0, len(first), rows):
+        vectors = first[start:start + rows, None, :] - second[None, :, :]
+        if lattice is not None:
+            vectors -= np.dot(np.round(np.dot(vectors, inverse)), lattice)
+        squares = np.einsum("abi,abi->ab", vectors, vectors)
+        for shift in shifts:
+            if shift.any():
+                shifted = vectors + shift
+                np.minimum(squares, np.einsum("abi,abi->ab", shifted, shifted), out=squares)
+        yield start, squares
+
+
+def _rdfKernel(coords, cells, first, second, edges):
+    """ Number of frames, sum of the volumes and histogram of the distances between the atoms of first and
+    second (positions of the atoms in the chunk), excluding the distance of an atom from itself """
+
+    if cells is None:
+        raise AmberError("AmberAnalysis: the radial distribution function requires a periodic calculation")
+    histogram, volume = np.zeros(len(edges) - 1), 0.
+    for frame, cell in zip(coords, cells):
+        images = _images(cell, edges[-1])
+        volume += images[3]
+        for start, squares in _distanceBlocks(frame[first], frame[second], images):
+            distances = np.sqrt(squares[first[start:start + len(squares), None] != second[None, :]])
+            histogram += np.histogram(distances, bins=edges)[0]
+    return len(coords), volume, histogram
+
+
+def _shellKernel(coords, cells, solute, solvent, residues, cutoff):
+    """ Number of solvent residues with at least one atom within cutoff from the solute, for each frame """
+
+    counts = np.zeros(len(coords), dtype=np.int64)
+    for nrFrame, frame in enumerate(coords):
+        inShell = np.zeros(len(solvent), dtype=bool)
+        images = _images(None if cells is None else cells[nrFrame], cutoff)
+        for start, squares in _distanceBlocks(frame[solvent], frame[solute], images):
+            inShell[start:start + len(squares)] = np.any(squares <= cutoff ** 2, axis=1)
+        counts[nrFrame] = len(np.unique(residues[inShell]))
+    return counts
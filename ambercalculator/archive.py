@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#    COBRAMM
+#    Copyright (c) 2019 ALMA MATER STUDIORUM - Università di Bologna
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#####################################################################################################
+
+# Compact archive of the directory of an AMBER calculation, that can be opened by AmberOutput in place of
+# the directory. The trajectory (mdcrd) is stored in blocks of frames: the coordinates, and optionally the
+# velocities and the forces, are quantized to integers with a fixed precision (lossy), then each block is
+# stored as the differences between consecutive frames, with the bytes of the integers shuffled in planes,
+# and compressed with zlib. The time and the unit cells are stored without loss. The other files of the
+# calculation (log file, topology, restrt, ...) are stored compressed and without loss.
+# The file starts with a magic string and ends with the index (compressed json) and a footer with the
+# position of the index: a frame is read decompressing only the block that contains it.
+#
+# Layout of the file:   MAGIC | blocks of frames | other files | index | offset and size of the index | MAGIC
+
+import collections  # container datatypes
+import io  # streams of bytes
+import json  # read and write json files
+import operator  # standard operators as functions
+import os  # filesystem utilities
+import struct  # interpret bytes as packed binary data
+import zlib  # compression compatible with gzip
+
+import numpy as np  # numpy: arrays and math utilities
+
+from ambercalculator.ambercalculator import AmberCalculator, AmberError
+from ambercalculator.netcdf3 import NetCDF3File, NetCDF3Variable
+
+# string at the beginning and at the end of an archive, with the version of the format
+MAGIC = b"AMBERARC\x00\x01"
+# format of the footer: offset and size of the index
+_FOOTER = struct.Struct("<QQ")
+# record variables of the trajectory that are stored without loss
+_LOSSLESS = ["time", "cell_lengths", "cell_angles"]
+
+
+#####################################################################################################
+
+def isarchive(fileName):
+    """ Check whether fileName is an archive of an AMBER calculation, reading the magic string
+
+    :param fileName: path of the file
+    :return: True when the file is an archive
+    """
+    try:
+        with open(fileName, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except IOError:
+        return False
+
+
+#####################################################################################################
+
+class AmberArchive:
+    """ An archive of an AMBER calculation opened for reading. The files of the calculation are read with the read
+    method, and the NetCDF files with the netcdf method, that returns objects with the same interface of
+    NetCDF3File: the data of the variables of the trajectory are decoded one block of frames at a time,
+    when they are accessed. The most recently decoded blocks are kept in a small cache. """
+
+    # number of blocks of each variable that are kept in the cache
+    _CACHESIZE = 2
+
+    def __init__(self, fileName):
+        """ Constructor of the AmberArchive instance: the index of the archive is read
+
+        :param fileName: path of the archive
+        """
+
+        self.fileName = fileName
+        self._file = open(fileName, "rb")
+        self._cache = collections.OrderedDict()
+        try:
+            magic = self._file.read(len(MAGIC))
+            self._file.seek(-_FOOTER.size - len(MAGIC), os.SEEK_END)
+            footer = self._file.read()
+            if magic != MAGIC or footer[_FOOTER.size:] != MAGIC:
+                raise ValueError
+            offset, size = _FOOTER.unpack(footer[:_FOOTER.size])
+            self.index = json.loads(self._readBytes(offset, size).decode())
+        except (OSError, ValueError, zlib.error):
+            self._file.close()
+            raise AmberError("{0} is not a valid archive of an AMBER calculation".format(fileName))
+
+    # ================================================================================
+
+    def close(self):
+        """ Close the archive """
+        self._file.close()
+        self._cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        if hasattr(self, "_file"): self._file.close()
+
+    # ================================================================================
+
+    @property
+    def files(self):
+        """ Names of the files of the calculation that are stored in the archive """
+        return list(self.index["files"]) + [AmberCalculator.MDCRDNAME] * (self.index["trajectory"] is not None)
+
+    def _readBytes(self, offset, size):
+        """ Read and decompress size bytes at offset """
+        self._file.seek(offset)
+        return zlib.decompress(self._file.read(size))
+
+    def read(self, name):
+        """ Read the content of a file of the calculation (except the trajectory)
+
+        :param name: name of the file in the directory of the calculation (e.g. AmberCalculator.OUTNAME)
+        :return: bytes with the content of the file
+        """
+        if name not in self.index["files"]:
+            raise AmberError("{0} is not stored in the archive {1}".format(name, self.fileName))
+        return self._readBytes(*self.index["files"][name])
+
+    def open(self, name):
+        """ Open a file of the calculation (except the trajectory) as a binary stream
+
+        :param name: name of the file in the directory of the calculation (e.g. AmberCalculator.OUTNAME)
+        :return: binary file object
+        """
+        return io.BytesIO(self.read(name))
+
+    def netcdf(self, name):
+        """ Open a NetCDF file of the calculation: the trajectory is read from the blocks of frames,
+        the other files (e.g. the restrt) are read with NetCDF3File from their content
+
+        :param name: name of the file in the directory of the calculation
+        :return: object with the interface of NetCDF3File
+        """
+        path = os.path.join(self.fileName, name)
+        if name == AmberCalculator.MDCRDNAME and self.index["trajectory"] is not None:
+            return _ArchiveTrajectory(self, path)
+        return NetCDF3File(path, buffer=self.read(name))
+
+    # ================================================================================
+
+    def _block(self, name, nrBlock):
+        """ Decode the block nrBlock of the variable name of the trajectory
+
+        :return: array with the frames of the block, in the type of the original NetCDF variable
+        """
+
+        key = (name, nrBlock)
+        if key not in self._cache:
+            trajectory = self.index["trajectory"]
+            variable = trajectory["variables"][name]
+            nrFrames = min(trajectory["blockSize"], trajectory["numrecs"] - nrBlock * trajectory["blockSize"])
+            data = self._readBytes(*trajectory["blocks"][nrBlock][name])
+            if variable["precision"] is None:
+                block = np.frombuffer(data, dtype=variable["dtype"]).reshape([nrFrames] + variable["shape"])
+            else:
+                block = (_decode(data, [nrFrames] + variable["shape"]) * variable["precision"]).astype(
+                    variable["dtype"])
+            block.flags.writeable = False
+            self._cache[key] = block
+            if len(self._cache) > AmberArchive._CACHESIZE * len(trajectory["variables"]):
+                self._cache.popitem(last=False)
+        self._cache.move_to_end(key)
+        return self._cache[key]
+
+    # ================================================================================
+
+    @staticmethod
+    def write(output, fileName, precision=1.e-3, velocities=None, forces=None, blockSize=100, level=6):
+        """ Write the archive of the directory of a calculation. The coordinates of the trajectory are quantized
+        with the given precision (in Angstrom, the maximum error is half the precision); the velocities and the
+        forces are stored only when their precision (in the units of the mdcrd file) is given. The archive is
+        written to a temporary file that replaces fileName at the end, and the memory needed is set by the
+        number of frames of a block.
+
+        :param output: AmberOutput with the results of the calculation
+        :param fileName: path of the archive
+        :param precision: precision of the coordinates (Angstrom)
+        :param velocities: precision of the velocities, None to skip the velocities
+        :param forces: precision of the forces, None to skip the forces
+        :param blockSize: number of frames of a block, that is the unit of compression of the trajectory
+        :param level: level of compression of zlib, from 1 (fastest) to 9 (smallest)
+        """
+
+        if not os.path.isdir(output.outDir):
+            raise AmberError("AmberArchive: only a single calculation stored in a directory can be archived")
+        precisions = {"coordinates": precision, "velocities": velocities, "forces": forces}
+        if any(p is not None and p <= 0 for p in precisions.values()) or blockSize < 1:
+            raise AmberError("AmberArchive: the precisions and the size of the blocks should be positive")
+
+        tmpName = fileName + ".{0}".format(os.getpid())
+        index = {"trajectory": None, "files": {}}
+        with open(tmpName, "wb") as f:
+            try:
+                f.write(MAGIC)
+
+                def store(data):
+                    start = f.tell()
+                    f.write(zlib.compress(data, level))
+                    return [start, f.tell() - start]
+
+                # the trajectory, one block of frames at a time
+                if os.path.isfile(output.mdcrdfile):
+                    mdcrd = output._netcdf(output.mdcrdfile)
+                    names = [n for n in list(precisions) + _LOSSLESS if n in mdcrd.variables
+                             and mdcrd.variables[n].dimensions
+                             and mdcrd.dimensions[mdcrd.variables[n].dimensions[0]] is None
+                             and (n in _LOSSLESS or precisions[n] is not None)]
+                    trajectory = {"numrecs": mdcrd.numrecs, "blockSize": blockSize, "attributes": mdcrd.attributes,
+                                  "variables": {}, "blocks": []}
+                    for name in names:
+                        variable = mdcrd.variables[name]
+                        trajectory["variables"][name] = {
+                            "dimensions": variable.dimensions, "attributes": variable.attributes,
+                            "shape": list(variable.shape[1:]), "dtype": variable.data.dtype.newbyteorder("<").str,
+                            "precision": None if name in _LOSSLESS else precisions[name]}
+                    for start in range(0, mdcrd.numrecs, blockSize):
+                        block = {}
+                        for name in names:
+                            data = mdcrd.variables[name].data[start:start + blockSize]
+                            if name in _LOSSLESS:
+                                block[name] = store(data.astype(trajectory["variables"][name]["dtype"]).tobytes())
+                            else:
+                                block[name] = store(_encode(data, precisions[name], name))
+                        trajectory["blocks"].append(block)
+                    index["trajectory"] = json.loads(json.dumps(trajectory, default=_jsonValue))
+
+                # all the other files of the calculation, without loss
+                for name in sorted(os.listdir(output.outDir)):
+                    path = os.path.join(output.outDir, name)
+                    if name != AmberCalculator.MDCRDNAME and os.path.isfile(path):
+                        with open(path, "rb") as source:
+                            index["files"][name] = store(source.read())
+
+                offset, size = store(json.dumps(index).encode())
+                f.write(_FOOTER.pack(offset, size) + MAGIC)
+            except BaseException:
+                f.close()
+                os.remove(tmpName)
+                raise
+        os.replace(tmpName, fileName)
+
+    # ================================================================================
+
+    def __repr__(self):
+        trajectory = self.index["trajectory"]
+        return "AmberArchive({0!r}, {1} frames, files: {2})".format(
+            os.path.basename(self.fileName), 0 if trajectory is None else trajectory["numrecs"], ", ".join(self.files))
+
+
+#####################################################################################################
+
+class _ArchiveTrajectory:
+    """ The trajectory stored in an archive, with the interface of NetCDF3File: the data of the variables
+    are _ArchiveData instances, that decode the blocks of frames of the archive when they are indexed """
+
+    def __init__(self, archive, fileName):
+        trajectory = archive.index["trajectory"]
+        self.fileName = fileName
+        self.numrecs = trajectory["numrecs"]
+        self.attributes = trajectory["attributes"]
+        self.variables = {name: NetCDF3Variable(name, tuple(v["dimensions"]), v["attributes"],
+                                                _ArchiveData(archive, name))
+                          for name, v in trajectory["variables"].items()}
+        self._archive = archive
+
+    def close(self):
+        """ Close the archive """
+        self.variables = {}
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _ArchiveData:
+    """ Array-like access to a variable of the trajectory stored in an archive: indexing with an integer,
+    a slice, an index array or a tuple (in which the first element selects the frames) returns a NumPy array """
+
+    def __init__(self, archive, name):
+        trajectory = archive.index["trajectory"]
+        self._archive = archive
+        self._name = name
+        self._blockSize = trajectory["blockSize"]
+        self.shape = (trajectory["numrecs"],) + tuple(trajectory["variables"][name]["shape"])
+        self.dtype = np.dtype(trajectory["variables"][name]["dtype"])
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, item):
+        if isinstance(item, tuple):
+            frames = self[item[0]]
+            return frames[item[1:]] if np.ndim(item[0]) == 0 and not isinstance(item[0], slice) \
+                else frames[(slice(None),) + item[1:]]
+        if np.ndim(item) == 0 and not isinstance(item, slice):
+            nrFrame = operator.index(item) + (len(self) if item < 0 else 0)
+            if not 0 <= nrFrame < len(self):
+                raise IndexError("frame {0} is out of range for a trajectory of {1} frames".format(item, len(self)))
+            return self._archive._block(self._name, nrFrame // self._blockSize)[nrFrame % self._blockSize].copy()
+
+        # the frames are copied from the blocks that contain them, decoding each block once
+        if isinstance(item, slice):
+            frames = np.arange(*item.indices(len(self)))
+        else:
+            frames = np.atleast_1d(np.arange(len(self))[item])
+        data = np.empty((len(frames),) + self.shape[1:], dtype=self.dtype)
+        blocks = frames // self._blockSize
+        for nrBlock in np.unique(blocks):
+            selected = blocks == nrBlock
+            data[selected] = self._archive._block(self._name, nrBlock)[frames[selected] % self._blockSize]
+        return data
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:]
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+
+#####################################################################################################
+
+def _encode(data, precision, name):
+    """ Quantize a block of frames to 32-bit integers, take the differences between consecutive frames, and
+    shuffle the bytes of the integers in four planes (lower bytes first) that are compressed better by zlib """
+
+    quantized = np.rint(np.asarray(data, dtype=np.float64) / precision)
+    if quantized.size and np.abs(quantized).max() >= 2 ** 31:
+        raise AmberError("AmberArchive: the precision {0} is too small for the values of {1}".format(precision, name))
+    quantized = quantized.astype("<i4")
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1,) + quantized.shape[1:], dtype="<i4"))
+    return np.ascontiguousarray(deltas.view(np.uint8).reshape(-1, 4).T).tobytes()
+
+
+def _decode(data, shape):
+    """ Inverse of _encode: integers of the quantized frames with the given shape """
+    deltas = np.ascontiguousarray(np.frombuffer(data, dtype=np.uint8).reshape(4, -1).T).view("<i4").reshape(shape)
+    return np.cumsum(deltas, axis=0, dtype=np.int32)
+
+
+def _jsonValue(value):
+    """ Convert the NumPy values of the attributes of the NetCDF files to values that can be stored in json """
+    if isinstance(value, np.ndarray) or isinstance(value, np.generic):
+        return value.tolist()
+    if isinstance(value, bytes):
+        return value.decode()
+    raise TypeError("{0} cannot be stored in json".format(type(value).__name__))
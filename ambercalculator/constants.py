@@ -123,3 +123,19 @@ for k, v in _bonds.items():
     sngBond[k] = v
     if (k[1], k[0]) not in sngBond:
         sngBond[(k[1], k[0])] = v
+
+# ATOMIC DATA
+
+# Atomic symbols of the elements, ordered by atomic number (the first element is a placeholder for Z = 0)
+atomicSymbols = ["", "H", "He",
+                 "Li", "Be", "B", "C", "N", "O", "F", "Ne",
+                 "Na", "Mg", "Al", "Si", "P", "S", "Cl", "Ar",
+                 "K", "Ca", "Sc", "Ti", "V", "Cr", "Mn", "Fe", "Co", "Ni", "Cu", "Zn",
+                 "Ga", "Ge", "As", "Se", "Br", "Kr",
+                 "Rb", "Sr", "Y", "Zr", "Nb", "Mo", "Tc", "Ru", "Rh", "Pd", "Ag", "Cd",
+                 "In", "Sn", "Sb", "Te", "I", "Xe",
+                 "Cs", "Ba", "La", "Ce", "Pr", "Nd", "Pm", "Sm", "Eu", "Gd", "Tb", "Dy", "Ho", "Er", "Tm", "Yb", "Lu",
+                 "Hf", "Ta", "W", "Re", "Os", "Ir", "Pt", "Au", "Hg",
+                 "Tl", "Pb", "Bi", "Po", "At", "Rn",
+                 "Fr", "Ra", "Ac", "Th", "Pa", "U", "Np", "Pu", "Am", "Cm", "Bk", "Cf", "Es", "Fm", "Md", "No", "Lr",
+                 "Rf", "Db", "Sg", "Bh", "Hs", "Mt", "Ds", "Rg", "Cn", "Nh", "Fl", "Mc", "Lv", "Ts", "Og"]
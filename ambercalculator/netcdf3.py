@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#    COBRAMM
+#    Copyright (c) 2019 ALMA MATER STUDIORUM - Università di Bologna
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#####################################################################################################
+
+# Reader of the NetCDF3 files (classic and 64-bit offset formats) that AMBER writes for the trajectories
+# (mdcrd) and for the restart files (restrt), following the AMBER NetCDF convention.
+# The file is memory-mapped, and the data of each variable is a read-only NumPy view on the file:
+# the record variables (e.g. the coordinates of the frames of a trajectory) are strided views, in which
+# the frames are read from the disk only when they are accessed. The header is read once, when the
+# file is opened.
+
+import os  # filesystem utilities
+import struct  # interpret bytes as packed binary data
+
+import numpy as np  # numpy: arrays and math utilities
+
+from ambercalculator.ambercalculator import AmberError
+
+# tags of the lists of the header
+_NC_DIMENSION, _NC_VARIABLE, _NC_ATTRIBUTE = 10, 11, 12
+# types of the NetCDF3 format, with the corresponding big-endian NumPy types
+_NC_TYPES = {1: np.dtype(">i1"), 2: np.dtype("S1"), 3: np.dtype(">i2"), 4: np.dtype(">i4"),
+             5: np.dtype(">f4"), 6: np.dtype(">f8")}
+# value of the number of records of a file that is being written in streaming mode
+_STREAMING = 0xFFFFFFFF
+
+
+#####################################################################################################
+
+class NetCDF3Variable:
+    """ A variable of a NetCDF3 file: the data is a read-only view on the memory-mapped file """
+
+    def __init__(self, name, dimensions, attributes, data):
+        """ Constructor of the NetCDF3Variable instance
+
+        :param name: name of the variable
+        :param dimensions: tuple with the names of the dimensions of the variable
+        :param attributes: dictionary with the attributes of the variable
+        :param data: NumPy array (a view on the file) with the data of the variable
+        """
+        self.name = name
+        self.dimensions = dimensions
+        self.attributes = attributes
+        self.data = data
+
+    # ================================================================================
+
+    @property
+    def units(self):
+        """ Units of the variable, None when the variable has no units attribute """
+        return self.attributes.get("units")
+
+    @property
+    def shape(self):
+        """ Shape of the data of the variable """
+        return self.data.shape
+
+    def __getitem__(self, item):
+        return self.data[item]
+
+    def __len__(self):
+        return len(self.data)
+
+
+#####################################################################################################
+
+class NetCDF3File:
+    """ A NetCDF3 file opened for reading, with the header and the views of the variables.
+    It can be used as a context manager, that closes the file at the end of the context. """
+
+    def __init__(self, fileName, buffer=None):
+        """ Constructor of the NetCDF3File instance: the file is memory-mapped and the header is read.
+        The content of the file can be given instead as a bytes object, e.g. when it is read from an archive.
+
+        :param fileName: path of the NetCDF3 file
+        :param buffer: bytes with the content of the file, None to read the file fileName
+        """
+
+        self.fileName = fileName
+        self.dimensions = {}  # dictionary {name: length}, the length of the record dimension is None
+        self.attributes = {}  # global attributes
+        self.variables = {}  # dictionary {name: NetCDF3Variable}
+        self.numrecs = 0  # number of records in the file
+
+        try:
+            if buffer is not None:
+                self._mmap = np.frombuffer(buffer, dtype=np.uint8)
+            else:
+                self._mmap = np.memmap(fileName, dtype=np.uint8, mode="r")
+        except ValueError:  # an empty file cannot be mapped
+            raise AmberError("{0} is not a NetCDF3 file".format(fileName))
+        if len(self._mmap) < 8:
+            raise AmberError("{0} is not a NetCDF3 file".format(fileName))
+        self._position = 0
+        self._readHeader()
+
+    # ================================================================================
+
+    def close(self):
+        """ Close the file, the views on the data of the variables should not be used after closing """
+        self.variables = {}
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # ================================================================================
+
+    def _read(self, fmt):
+        """ Read big-endian values with the struct format fmt at the current position of the header """
+        size = struct.calcsize(">" + fmt)
+        values = struct.unpack(">" + fmt, self._mmap[self._position:self._position + size].tobytes())
+        self._position += size
+        return values if len(values) > 1 else values[0]
+
+    def _readName(self):
+        """ Read a name of the header: the length, the characters and the padding to 4 bytes """
+        length = self._read("i")
+        name = self._mmap[self._position:self._position + length].tobytes().decode()
+        self._position += length + (-length % 4)
+        return name
+
+    def _readAttributes(self):
+        """ Read a list of attributes of the header, text attributes are converted to str """
+        attributes = {}
+        tag, nelems = self._read("ii")
+        if tag not in (0, _NC_ATTRIBUTE):
+            raise AmberError("{0} is not a valid NetCDF3 file".format(self.fileName))
+        for i in range(nelems):
+            name = self._readName()
+            ncType, length = self._read("ii")
+            size = length * _NC_TYPES[ncType].itemsize
+            values = self._mmap[self._position:self._position + size].tobytes()
+            self._position += size + (-size % 4)
+            if ncType == 2:
+                attributes[name] = values.decode().rstrip("\x00")
+            else:
+                values = np.frombuffer(values, dtype=_NC_TYPES[ncType])
+                attributes[name] = values[0] if length == 1 else values
+        return attributes
+
+    # ================================================================================
+
+    def _readHeader(self):
+        """ Read the header of the file and create the views of the variables """
+
+        magic = self._mmap[0:4].tobytes()
+        if magic[0:3] != b"CDF" or magic[3] not in (1, 2):
+            raise AmberError("{0} is not a NetCDF3 file (classic or 64-bit offset format)".format(self.fileName))
+        offsetFormat = "i" if magic[3] == 1 else "q"
+        self._position = 4
+        numrecs = self._read("I")
+
+        # dimensions, the record dimension has length 0
+        dimensionNames = []
+        tag, nelems = self._read("ii")
+        for i in range(nelems):
+            name = self._readName()
+            length = self._read("i")
+            self.dimensions[name] = length if length > 0 else None
+            dimensionNames.append(name)
+
+        # global attributes
+        self.attributes = self._readAttributes()
+
+        # variables: name, dimensions, attributes, type, size and offset of the data
+        headers = []
+        tag, nelems = self._read("ii")
+        for i in range(nelems):
+            name = self._readName()
+            nrDimensions = self._read("i")
+            dimensions = tuple(dimensionNames[self._read("i")] for j in range(nrDimensions))
+            attributes = self._readAttributes()
+            ncType, vsize = self._read("ii")
+            begin = self._read(offsetFormat)
+            headers.append((name, dimensions, attributes, _NC_TYPES[ncType], vsize, begin))
+
+        # the records contain one slab of each record variable, the size of the slab is padded to 4 bytes
+        # unless there is only one record variable
+        recordHeaders = [h for h in headers if h[1] and self.dimensions[h[1][0]] is None]
+        if len(recordHeaders) == 1:
+            h = recordHeaders[0]
+            recordSize = h[3].itemsize * int(np.prod([self.dimensions[d] for d in h[1][1:]], dtype=np.int64))
+        else:
+            recordSize = sum(h[4] for h in recordHeaders)
+        if numrecs == _STREAMING and recordHeaders:
+            numrecs = (len(self._mmap) - min(h[5] for h in recordHeaders)) // recordSize
+        elif numrecs == _STREAMING:
+            numrecs = 0
+        self.numrecs = numrecs
+
+        for name, dimensions, attributes, dtype, vsize, begin in headers:
+            isRecord = dimensions and self.dimensions[dimensions[0]] is None
+            shape = tuple(numrecs if isRecord and i == 0 else self.dimensions[d] for i, d in enumerate(dimensions))
+            # C-contiguous strides, except for the records that are separated by the size of a record
+            strides, size = [], dtype.itemsize
+            for length in reversed(shape[1:]):
+                strides.insert(0, size)
+                size *= length
+            if isRecord:
+                strides.insert(0, recordSize)
+                size = (numrecs - 1) * recordSize + size if numrecs > 0 else 0
+            elif shape:
+                strides.insert(0, size)
+                size *= shape[0]
+            if begin + size > len(self._mmap):
+                raise AmberError("data of the variable {0} exceeds the size of {1}".format(name, self.fileName))
+            data = np.ndarray(shape=shape, dtype=dtype, buffer=self._mmap, offset=begin, strides=tuple(strides))
+            self.variables[name] = NetCDF3Variable(name, dimensions, attributes, data)
+
+    # ================================================================================
+
+    def __repr__(self):
+        return "NetCDF3File({0!r}, {1} records, variables: {2})".format(
+            os.path.basename(self.fileName), self.numrecs, ", ".join(self.variables))
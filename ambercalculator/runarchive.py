@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#    COBRAMM
+#    Copyright (c) 2019 ALMA MATER STUDIORUM - Università di Bologna
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#####################################################################################################
+
+# Access to AMBER calculations that are stored in tar (plain or compressed with gzip, bzip2, xz) or zip archives,
+# without extracting them. A calculation is identified by a path that goes through the archive file, e.g.
+# runs.tar.gz/equilibration/run01 for the directory equilibration/run01 stored in runs.tar.gz, or runs.tar.gz
+# for a calculation stored at the root of the archive (or for the only calculation stored in the archive).
+# The text files (log file, topology) are read as streams. The NetCDF files are memory-mapped in place when they
+# are stored without compression (plain tar, zip without compression); otherwise they are extracted to a temporary
+# file that is unlinked as soon as it is mapped, so that the disk space is freed when the map is released.
+# The maps are shared by all the readers of the same file in the process.
+
+import os  # filesystem utilities
+import shutil  # filesystem utilities
+import struct  # interpret bytes as packed binary data
+import tarfile  # read tar archives
+import tempfile  # temporary files
+import weakref  # weak references to the memory maps
+import zipfile  # read zip archives
+
+import numpy as np  # numpy: arrays and math utilities
+
+from ambercalculator.ambercalculator import AmberCalculator, AmberError
+from ambercalculator.archive import AmberArchive, isarchive
+from ambercalculator.netcdf3 import NetCDF3File
+
+# memory maps of the NetCDF files of the archives: (archive, modification time, path in the archive) -> map
+_MAPS = weakref.WeakValueDictionary()
+# local header of a member of a zip file: signature, versions, flags, ..., length of the name and of the extra field
+_ZIPHEADER = struct.Struct("<4s22xHH")
+
+
+#####################################################################################################
+
+def splitpath(path):
+    """ Split a path that goes through an archive in the path of the archive file and the path inside the archive
+
+    :param path: path of a directory or of a file, possibly inside an archive
+    :return: tuple (archive file, path inside the archive), or (None, path) when no part of path is a file
+    """
+    fileName, inner = os.path.normpath(path), []
+    while fileName and not os.path.exists(fileName):
+        fileName, name = os.path.split(fileName)
+        inner.insert(0, name)
+    if not fileName or not os.path.isfile(fileName):
+        return None, path
+    return fileName, "/".join(inner)
+
+
+def openarchive(path):
+    """ Open the archive that contains the calculation path: an archive written by AmberArchive.write,
+    or a tar or zip archive with the files of the calculation
+
+    :param path: path of the archive, or of a directory inside a tar or zip archive
+    :return: AmberArchive or AmberRunArchive instance, None when path is not inside a file
+    """
+    fileName, directory = splitpath(path)
+    if fileName is None:
+        return None
+    if isarchive(fileName):
+        if directory:
+            raise AmberError("{0} is a single calculation, {1} cannot be found in it".format(fileName, directory))
+        return AmberArchive(fileName)
+    return AmberRunArchive(fileName, directory)
+
+
+def opennetcdf(fileName):
+    """ Open a NetCDF file stored in an archive, reusing the memory map of the file when it is already open
+
+    :param fileName: path of the NetCDF file, through the archive (e.g. runs.tgz/run01/mdcrd)
+    :return: NetCDF3File instance, or an object with the same interface for the trajectory of an AmberArchive
+    """
+    archiveFile, inner = splitpath(fileName)
+    if archiveFile is not None:
+        data = _MAPS.get(_mapKey(archiveFile, inner))
+        if data is not None:
+            return NetCDF3File(fileName, buffer=data)
+    archive = openarchive(os.path.dirname(fileName))
+    if archive is None:
+        raise AmberError("NetCDF file {0} not found".format(fileName))
+    return archive.netcdf(os.path.basename(fileName))
+
+
+def _mapKey(archiveFile, inner):
+    """ Key of the memory map of a file of an archive in _MAPS """
+    return os.path.realpath(archiveFile), os.path.getmtime(archiveFile), inner.strip("/")
+
+
+#####################################################################################################
+
+class AmberRunArchive:
+    """ An AMBER calculation stored in a tar or zip archive, opened for reading. It has the same interface of
+    AmberArchive: the files of the calculation are read with read (or as streams with open), and the NetCDF files
+    with netcdf, that returns NetCDF3File instances on a memory map of the file. """
+
+    def __init__(self, fileName, directory=""):
+        """ Constructor of the AmberRunArchive instance: the list of the members of the archive is read
+        (for a compressed tar archive, this requires to decompress the whole archive once)
+
+        :param fileName: path of the archive
+        :param directory: directory of the calculation inside the archive ("" for the root of the archive)
+        """
+
+        self.fileName = fileName
+        self.directory = directory.strip("/")
+        self._zip, self._tar, self._compressed = None, None, False
+        try:
+            if zipfile.is_zipfile(fileName):
+                self._zip = zipfile.ZipFile(fileName)
+                members = {_memberName(info.filename): info for info in self._zip.infolist() if not info.is_dir()}
+            else:
+                try:
+                    self._tar = tarfile.open(fileName, "r:")
+                except tarfile.ReadError:
+                    self._tar, self._compressed = tarfile.open(fileName, "r:*"), True
+                members = {_memberName(info.name): info for info in self._tar.getmembers() if info.isfile()}
+        except (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile):
+            self.close()
+            raise AmberError("{0} is not a tar or zip archive".format(fileName))
+
+        # the calculation is in the directory, or in the only directory below it that contains a log file
+        logDirs = {os.path.dirname(name) for name in members if os.path.basename(name) == AmberCalculator.OUTNAME}
+        subDirs = [d for d in logDirs if not self.directory or d.startswith(self.directory + "/")]
+        if self.directory not in logDirs and len(subDirs) == 1:
+            self._root = subDirs[0]
+        else:
+            self._root = self.directory
+        self._members = {os.path.basename(name): info for name, info in members.items()
+                         if os.path.dirname(name) == self._root}
+        if not self._members:
+            self.close()
+            raise AmberError("no calculation in the directory '{0}' of {1}".format(self.directory, fileName))
+
+    # ================================================================================
+
+    def close(self):
+        """ Close the archive """
+        if self._zip is not None: self._zip.close()
+        if self._tar is not None: self._tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        if hasattr(self, "_tar"): self.close()
+
+    # ================================================================================
+
+    @property
+    def files(self):
+        """ Names of the files of the calculation that are stored in the archive """
+        return sorted(self._members)
+
+    def _member(self, name):
+        """ Information on the member of the archive for a file of the calculation """
+        if name not in self._members:
+            raise AmberError("{0} is not stored in {1}".format(name, os.path.join(self.fileName, self._root)))
+        return self._members[name]
+
+    def open(self, name):
+        """ Open a file of the calculation as a stream, that is decompressed while it is read
+
+        :param name: name of the file in the directory of the calculation (e.g. AmberCalculator.OUTNAME)
+        :return: binary file object
+        """
+        return self._stream(self._member(name))
+
+    def _stream(self, member):
+        """ Binary file object that reads a member of the archive """
+        return self._zip.open(member) if self._zip is not None else self._tar.extractfile(member)
+
+    def read(self, name):
+        """ Read the content of a file of the calculation
+
+        :param name: name of the file in the directory of the calculation (e.g. AmberCalculator.OUTNAME)
+        :return: bytes with the content of the file
+        """
+        with self.open(name) as f:
+            return f.read()
+
+    def netcdf(self, name):
+        """ Open a NetCDF file of the calculation, on a memory map of the archive when the file is stored without
+        compression, or of a copy of the file that is extracted to a temporary file otherwise
+
+        :param name: name of the file in the directory of the calculation
+        :return: NetCDF3File instance
+        """
+        inner = "/".join(n for n in (self.directory, name) if n)
+        key = _mapKey(self.fileName, inner)
+        data = _MAPS.get(key)
+        if data is None:
+            data = self._map(self._member(name))
+            _MAPS[key] = data
+        return NetCDF3File(os.path.join(self.fileName, inner), buffer=data)
+
+    def _map(self, member):
+        """ Memory map of the content of a member of the archive """
+
+        # a member without compression is mapped in place
+        offset, size = None, None
+        if self._zip is not None and member.compress_type == zipfile.ZIP_STORED and not member.flag_bits & 0x1:
+            with open(self.fileName, "rb") as f:
+                f.seek(member.header_offset)
+                signature, nameLength, extraLength = _ZIPHEADER.unpack(f.read(_ZIPHEADER.size))
+            if signature == b"PK\x03\x04":
+                offset, size = member.header_offset + _ZIPHEADER.size + nameLength + extraLength, member.file_size
+        elif self._tar is not None and not self._compressed and not member.issparse():
+            offset, size = member.offset_data, member.size
+        if size == 0:
+            return np.zeros(0, dtype=np.uint8)
+        if offset is not None:
+            return np.memmap(self.fileName, dtype=np.uint8, mode="r", offset=offset, shape=(size,))
+
+        # otherwise the member is extracted to a temporary file, that is removed once it is mapped
+        with tempfile.NamedTemporaryFile(prefix="ambercalculator", delete=False) as target:
+            with self._stream(member) as source:
+                shutil.copyfileobj(source, target, 1 << 22)
+        try:
+            if os.path.getsize(target.name) == 0:
+                return np.zeros(0, dtype=np.uint8)
+            return np.memmap(target.name, dtype=np.uint8, mode="r")
+        finally:
+            os.remove(target.name)
+
+    # ================================================================================
+
+    def __repr__(self):
+        return "AmberRunArchive({0!r}, {1!r}, files: {2})".format(
+            os.path.basename(self.fileName), self._root, ", ".join(self.files))
+
+
+#####################################################################################################
+
+def _memberName(name):
+    """ Normalized path of a member of an archive, without the leading ./ and / """
+    name = os.path.normpath(name).lstrip("/")
+    return "" if name == "." else name
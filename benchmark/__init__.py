@@ -0,0 +1 @@
+# Performance benchmarks of ambercalculator, run with: python -m benchmark
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#    COBRAMM
+#    Copyright (c) 2019 ALMA MATER STUDIORUM - Università di Bologna
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#####################################################################################################
+
+# Command line interface of the benchmark suite. Examples:
+#
+#   python -m benchmark                                   run all the benchmarks, compare with the baseline
+#   python -m benchmark --sizes 1000 10000                run only the smaller systems
+#   python -m benchmark --only AmberTopology.charges      run only one benchmark
+#   python -m benchmark --update-baseline                 store the results as the new baseline
+#
+# The exit status is 1 when a regression with respect to the baseline is found.
+
+import sys  # system-specific parameters and functions
+import json  # read and write json files
+import argparse  # parser for command-line options
+
+from benchmark import suite
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark",
+                                     description="Benchmarks of the parsers and serializers of ambercalculator")
+    parser.add_argument("--sizes", type=int, nargs="+", default=suite.DEFAULTSIZES,
+                        help="number of atoms of the synthetic systems (default: %(default)s)")
+    parser.add_argument("--only", nargs="+", choices=list(suite.BENCHMARKS.keys()), metavar="NAME",
+                        help="run only the given benchmarks, among: " + ", ".join(suite.BENCHMARKS.keys()))
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions of each measure (default: %(default)s)")
+    parser.add_argument("--baseline", default=suite.BASELINEFILE, help="json file with the baseline timings")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--output", help="write the results to a json file")
+    args = parser.parse_args(argv)
+
+    results = suite.run(args.sizes, args.only, args.repeat)
+
+    # print the empirical scaling of the timings with the system size
+    print("\nScaling exponents (1.0 = linear in the number of atoms):")
+    for name, exponents in suite.scaling(results).items():
+        print("{0:34s} {1}".format(name, "  ".join("{0:>9s}: {1:5.2f}".format(s, e) for s, e in exponents.items())))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": suite.environment(), "results": results}, f, indent=2, sort_keys=True)
+
+    baseline = suite.loadbaseline(args.baseline)
+    if args.update_baseline:
+        suite.savebaseline(results, args.baseline, baseline)
+        print("\nBaseline written to {0}".format(args.baseline))
+        return 0
+
+    if baseline is None:
+        print("\nWARNING! baseline file {0} not found, the results have not been checked".format(args.baseline))
+        return 0
+
+    regressions = suite.compare(results, baseline)
+    if regressions:
+        print("\nRegressions with respect to the baseline:")
+        for name, size, timing, reference, threshold in regressions:
+            print("{0:34s} {1:>9d} atoms {2:12.6f} s  (baseline {3:.6f} s, threshold x{4})".format(
+                name, size, timing, reference, threshold))
+        return 1
+    else:
+        print("\nNo regression with respect to the baseline")
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
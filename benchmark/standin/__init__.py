@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#    COBRAMM
+#    Copyright (c) 2019 ALMA MATER STUDIORUM - Università di Bologna
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#####################################################################################################
+
+# Stand-in executables of the AMBER suite, that can be used to run AmberCalculator on a machine without
+# AMBER. The directory of this package can be used as $AMBERHOME (it contains update_amber) and its bin
+# subdirectory has to be put in the $PATH. The environment can be set up in the shell with
+#
+#   eval "$(python -m benchmark.standin)"
+#
+# or in python with the activate context manager. See programs.py for the variables that control
+# the behaviour of the stand-ins (run time, size of the output files, failures).
+
+import os  # filesystem utilities
+import contextlib  # utilities for with-statement contexts
+
+# directory that is used as $AMBERHOME
+STANDINHOME = os.path.dirname(os.path.realpath(__file__))
+
+# names of the environment variables that correspond to the options of the stand-ins
+_OPTIONS = {"runtime": "AMBERSTANDIN_RUNTIME", "busy": "AMBERSTANDIN_BUSY", "records": "AMBERSTANDIN_RECORDS",
+            "frames": "AMBERSTANDIN_FRAMES", "fail": "AMBERSTANDIN_FAIL", "version": "AMBERSTANDIN_VERSION",
+            "log": "AMBERSTANDIN_LOG", "cache": "AMBERCALCULATOR_CACHE"}
+
+
+#####################################################################################################
+
+def environment(base=None, **options):
+    """ Return the environment variables that activate the stand-ins
+
+    :param base: dictionary with the environment to modify, when None os.environ is used
+    :param options: values of the options of the stand-ins: runtime, busy, records, frames, fail (list or
+                    comma-separated string of programs), version, log, and cache (the cache directory of
+                    ambercalculator, to keep the records of the stand-ins separated from the real AMBER)
+    :return: dictionary with the new environment
+    """
+
+    env = dict(os.environ if base is None else base)
+    env["AMBERHOME"] = STANDINHOME
+    env["PATH"] = os.path.join(STANDINHOME, "bin") + os.pathsep + env.get("PATH", "")
+    env["PARA_EXE"] = os.path.join(STANDINHOME, "bin", "mpirun") + " -np"
+
+    for key, value in options.items():
+        if key not in _OPTIONS:
+            raise ValueError("unknown option of the stand-ins: {0}".format(key))
+        if value is None:
+            env.pop(_OPTIONS[key], None)
+        elif isinstance(value, (list, tuple)):
+            env[_OPTIONS[key]] = ",".join(value)
+        elif isinstance(value, bool):
+            env[_OPTIONS[key]] = "1" if value else "0"
+        else:
+            env[_OPTIONS[key]] = str(value)
+
+    return env
+
+
+# ================================================================================
+
+@contextlib.contextmanager
+def activate(**options):
+    """ Context manager that activates the stand-ins in the current process: the environment is modified
+    and the environment data cached by AmberCalculator is reset, when the context is closed the original
+    environment is restored.
+
+    :param options: options of the stand-ins, see the environment function
+    """
+    from ambercalculator import AmberCalculator
+
+    oldEnviron = dict(os.environ)
+    os.environ.update(environment(**options))
+    for key, value in options.items():
+        if value is None: os.environ.pop(_OPTIONS[key], None)
+    _resetCalculator(AmberCalculator)
+    try:
+        yield STANDINHOME
+    finally:
+        os.environ.clear()
+        os.environ.update(oldEnviron)
+        _resetCalculator(AmberCalculator)
+
+
+# ================================================================================
+
+def _resetCalculator(calculator):
+    """ Forget the AMBER environment data stored in the class variables of AmberCalculator """
+    calculator._amberCheck = False
+    calculator.amberVersion = None
+    calculator._executables.clear()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#    COBRAMM
+#    Copyright (c) 2019 ALMA MATER STUDIORUM - Università di Bologna
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#####################################################################################################
+
+# Print the shell commands that activate the stand-ins, to be used as:
+#
+#   eval "$(python -m benchmark.standin --runtime 2.0)"
+
+import sys  # system-specific parameters and functions
+import shlex  # simple lexical analysis for unix shell-like languages
+import argparse  # parser for command-line options
+
+from benchmark import standin
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark.standin",
+                                     description="Print the shell commands that activate the AMBER stand-ins")
+    parser.add_argument("--runtime", type=float, help="time (in s) spent by each stand-in program")
+    parser.add_argument("--busy", action="store_true", default=None, help="spend the time in a busy loop")
+    parser.add_argument("--records", type=int, help="number of printed steps of the sander log")
+    parser.add_argument("--frames", type=int, help="number of frames of the mdcrd file")
+    parser.add_argument("--fail", nargs="+", help="programs that terminate with an error")
+    parser.add_argument("--version", help="AMBER version reported by update_amber")
+    parser.add_argument("--log", help="file where the stand-ins log their calls")
+    parser.add_argument("--cache", help="cache directory of ambercalculator")
+    args = parser.parse_args(argv)
+
+    options = {key: value for key, value in vars(args).items() if value is not None}
+    env = standin.environment(base={"PATH": "$PATH"}, **options)
+    for key in sorted(env):
+        value = shlex.quote(env[key]) if key != "PATH" else '"{0}"'.format(env[key])
+        print("export {0}={1}".format(key, value))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#    COBRAMM
+#    Copyright (c) 2019 ALMA MATER STUDIORUM - Università di Bologna
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#####################################################################################################
+
+# Implementation of the stand-in programs of the AMBER suite (and of openbabel and mpirun).
+# The stand-ins accept the same command line arguments that ambercalculator uses, read the same input
+# files and write output files with the same format of the real programs, with synthetic data.
+# Their behaviour is controlled by the environment variables:
+#
+#   AMBERSTANDIN_RUNTIME            time (in s) spent by each program before writing its output (default 0)
+#   AMBERSTANDIN_RUNTIME_<PROGRAM>  time spent by a specific program, e.g. AMBERSTANDIN_RUNTIME_ANTECHAMBER
+#   AMBERSTANDIN_BUSY               when 1, the time is spent in a busy loop instead of sleeping
+#   AMBERSTANDIN_RECORDS            number of printed steps of the sander log (default: defined by the input)
+#   AMBERSTANDIN_FRAMES             number of frames of the mdcrd file (default: defined by the input)
+#   AMBERSTANDIN_FAIL               comma-separated list of programs that terminate with error
+#   AMBERSTANDIN_VERSION            AMBER version reported by update_amber (default 19.0)
+#   AMBERSTANDIN_LOG                file where each program appends a line with its name and arguments
+
+import os  # filesystem utilities
+import re  # process regular expressions
+import sys  # system-specific parameters and functions
+import math  # import mathematical functions
+import time  # provides various time-related functions
+import zlib  # compression and checksum functions
+
+# element symbols of the first atomic numbers, used to label the atoms in the PDB files
+_ELEMENTS = ["X", "H", "He", "Li", "Be", "B", "C", "N", "O", "F", "Ne", "Na", "Mg", "Al", "Si", "P", "S", "Cl", "Ar",
+             "K", "Ca"]
+# covalent radii (in Angstrom) used by the obabel stand-in to define the connectivity
+_COVALENTRADII = {"H": 0.31, "C": 0.76, "N": 0.71, "O": 0.66, "F": 0.57, "P": 1.07, "S": 1.05, "Cl": 1.02,
+                  "Br": 1.20, "I": 1.39}
+
+
+#####################################################################################################
+
+def main(program, argv):
+    """ Run the stand-in of a program, with the given command line arguments
+
+    :param program: name of the program, as it is called by ambercalculator (e.g. "sander.MPI")
+    :param argv: list of command line arguments
+    :return: exit status of the program
+    """
+
+    if os.environ.get("AMBERSTANDIN_LOG"):
+        with open(os.environ["AMBERSTANDIN_LOG"], "a") as f:
+            f.write("{0} {1} {2}\n".format(program, os.getcwd(), " ".join(argv)))
+
+    handlers = {"sander": _sander, "sander.MPI": _sander, "pmemd.cuda": _sander, "mpirun": _mpirun,
+                "cpptraj": _cpptraj, "tleap": _tleap, "antechamber": _antechamber, "parmchk": _parmchk,
+                "parmchk2": _parmchk, "obabel": _obabel, "ambpdb": _ambpdb, "ambmask": _ambmask,
+                "update_amber": _updateamber}
+    if program not in handlers:
+        sys.stderr.write("{0}: there is no stand-in for this program\n".format(program))
+        return 1
+
+    # the program fails when requested, except for sander that writes first an incomplete log file
+    if _fails(program) and handlers[program] is not _sander:
+        sys.stderr.write("{0}: error termination requested with AMBERSTANDIN_FAIL\n".format(program))
+        return 1
+
+    return handlers[program](program, argv)
+
+
+# ================================================================================
+
+def _fails(program):
+    """ True when the program has been requested to fail with the variable AMBERSTANDIN_FAIL """
+    return program in [p.strip() for p in os.environ.get("AMBERSTANDIN_FAIL", "").split(",")]
+
+
+# ================================================================================
+
+def _spendtime(program):
+    """ Spend the time defined by AMBERSTANDIN_RUNTIME_<PROGRAM> or AMBERSTANDIN_RUNTIME, sleeping or
+    in a busy loop when AMBERSTANDIN_BUSY is 1 """
+
+    key = "AMBERSTANDIN_RUNTIME_" + re.sub("[^A-Z0-9]", "_", program.upper())
+    runTime = float(os.environ.get(key, os.environ.get("AMBERSTANDIN_RUNTIME", 0.0)))
+    if runTime <= 0.0:
+        return
+    if os.environ.get("AMBERSTANDIN_BUSY", "0") == "1":
+        end = time.perf_counter() + runTime
+        while time.perf_counter() < end:
+            pass
+    else:
+        time.sleep(runTime)
+
+
+# ================================================================================
+
+def _options(argv, flags, switches=()):
+    """ Parse the command line arguments of the AMBER programs, in the form -flag value
+
+    :param argv: list of command line arguments
+    :param flags: dictionary {flag: default value} of the flags that take a value
+    :param switches: list of the flags that do not take a value
+    :return: dictionary {flag: value}
+    """
+
+    values = dict(flags)
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg in switches:
+            values[arg] = True
+        elif arg in flags and args:
+            values[arg] = args.pop(0)
+        else:
+            raise ValueError("unexpected command line argument {0}".format(arg))
+    return values
+
+
+# ================================================================================
+
+def _section(topotext, flag):
+    """ Extract the fields of a section of the topology file, using the width defined by the %FORMAT line
+
+    :param topotext: text of the topology file
+    :param flag: name of the section
+    :return: list of strings with the fields of the section, None if the section is not present
+    """
+
+    match = re.search("^%FLAG {0} *\n%FORMAT\\([0-9]+[aAiIeE]([0-9]+)[^)]*\\) *\n(.*?)(?=^%FLAG|\\Z)".format(flag),
+                      topotext, re.MULTILINE | re.DOTALL)
+    if not match:
+        return None
+    width = int(match.group(1))
+    fields = []
+    for line in match.group(2).splitlines():
+        fields += [line[i:i + width].strip() for i in range(0, len(line), width) if line[i:i + width].strip()]
+    return fields
+
+
+# ================================================================================
+
+def _readfile(fileName, program):
+    """ Read a text file, returns None and prints an error message when the file does not exist """
+    if fileName is None:
+        sys.stderr.write("{0}: missing name of the input file\n".format(program))
+        return None
+    try:
+        with open(fileName, "r") as f:
+            return f.read()
+    except IOError:
+        sys.stderr.write("{0}: cannot open file {1}\n".format(program, fileName))
+        return None
+
+
+#####################################################################################################
+
+def _sander(program, argv):
+    """ Stand-in of sander, sander.MPI and pmemd.cuda: read input, topology and coordinates, spend the
+    run time and write log file, mdcrd and restrt files with synthetic data """
+    from ambercalculator import AmberInput, AmberSnapshot
+    from benchmark import synthetic
+    import numpy as np
+
+    start = time.perf_counter()
+    files = _options(argv, {"-i": "mdin", "-o": "mdout", "-p": "prmtop", "-c": "inpcrd", "-r": "restrt",
+                            "-x": "mdcrd", "-inf": "mdinfo", "-ref": "refc"}, switches=["-O"])
+
+    # read the input files
+    texts = [_readfile(files[flag], program) for flag in ["-i", "-p", "-c"]]
+    if None in texts:
+        return 1
+    inputData = AmberInput.readinput(texts[0])
+    natoms = int(_section(texts[1], "POINTERS")[0])
+    snapshot = AmberSnapshot.readcrd(texts[2])
+
+    # default values of the keywords that are used here
+    for key, value in {"imin": "0", "ntpr": "50", "ntwx": "0", "nstlim": "1", "maxcyc": "1", "dt": "0.001",
+                       "ntb": "1", "ntwv": "0", "ntwf": "0"}.items():
+        try:
+            inputData[key]
+        except KeyError:
+            inputData[key] = value
+    minimize = int(inputData["imin"]) == 1
+    periodic = snapshot.unitcell is not None and int(inputData["ntb"]) != 0
+    nrSteps = int(inputData["maxcyc"] if minimize else inputData["nstlim"])
+    ntwx = int(inputData["ntwx"])
+    ntasks = int(os.environ.get("AMBERSTANDIN_NTASKS", "1")) if program == "sander.MPI" else 1
+    seed = zlib.crc32(texts[2].encode()) % (2 ** 31)
+
+    # check the consistency of topology and coordinates, as sander does
+    if snapshot.coords is None or len(snapshot.coords[0]) != natoms:
+        with open(files["-o"], "w") as f:
+            f.write("\n   ERROR: natom mismatch in coordinate file and topology file\n")
+        sys.stderr.write("{0}: natom mismatch in coordinate file and topology file\n".format(program))
+        return 1
+
+    _spendtime(program)
+
+    # when the calculation fails, write the log file only up to the beginning of the results section
+    records = os.environ.get("AMBERSTANDIN_RECORDS")
+    logText = synthetic.logtext(natoms, inputData, int(records) if records else None, seed,
+                                box=snapshot.unitcell[0:3] if periodic else None, periodic=periodic, ntasks=ntasks,
+                                walltime=time.perf_counter() - start)
+    if _fails(program):
+        with open(files["-o"], "w") as f:
+            f.write(logText[:logText.find("   4.  RESULTS")])
+        sys.stderr.write("{0}: error termination requested with AMBERSTANDIN_FAIL\n".format(program))
+        return 1
+
+    # write the trajectory
+    if ntwx > 0:
+        frames = os.environ.get("AMBERSTANDIN_FRAMES")
+        nrFrames = int(frames) if frames else max(1, nrSteps // ntwx)
+        synthetic.writetrajectory(files["-x"], natoms, nrFrames, velocity=not minimize and int(inputData["ntwv"]) == -1,
+                                  forces=not minimize and int(inputData["ntwf"]) == -1, seed=seed,
+                                  initial=snapshot if periodic else AmberSnapshot(snapshot.coords),
+                                  timeStep=0.0 if minimize else float(inputData["dt"]) * ntwx)
+
+    # write the restart file, with the final coordinates and (for MD) the velocities
+    rng = np.random.RandomState(seed)
+    coords = np.array(snapshot.coords) + rng.normal(scale=0.05, size=np.shape(snapshot.coords))
+    velocity = None if minimize else rng.normal(scale=5.e-7, size=np.shape(snapshot.coords))
+    synthetic.writerestart(files["-r"], natoms, final=AmberSnapshot(coords, snapshot.unitcell if periodic else None,
+                                                                    velocity),
+                           time=0.0 if minimize else nrSteps * float(inputData["dt"]))
+
+    # finally write the log file: it is written as last file, as sander does with the TIMINGS section
+    with open(files["-o"], "w") as f:
+        f.write(logText)
+    return 0
+
+
+# ================================================================================
+
+def _mpirun(program, argv):
+    """ Stand-in of mpirun: run the command with a single process, passing the number of tasks
+    to the stand-in of sander.MPI through the environment variable AMBERSTANDIN_NTASKS """
+    import subprocess
+
+    args = list(argv)
+    ntasks = "1"
+    while args and args[0].startswith("-"):
+        flag = args.pop(0)
+        if flag in ["-np", "-n"] and args:
+            ntasks = args.pop(0)
+    if not args:
+        sys.stderr.write("mpirun: no executable has been given\n")
+        return 1
+    env = dict(os.environ, AMBERSTANDIN_NTASKS=ntasks)
+    return subprocess.run(args, env=env).returncode
+
+
+# ================================================================================
+
+def _updateamber(program, argv):
+    """ Stand-in of update_amber: print the version of AMBER """
+    version = os.environ.get("AMBERSTANDIN_VERSION", "19.0")
+    print("Version is reported as <version>.<patches applied>\n")
+    print("\tAmberTools version {0}".format(version))
+    print("\tAmber version {0}".format(version))
+    return 0
+
+
+#####################################################################################################
+
+def _cpptraj(program, argv):
+    """ Stand-in of cpptraj: process the script, copying the input coordinates to the output trajectory.
+    Imaging, centering and stripping are not performed: strip commands always write the message of
+    cpptraj for a mask that does not select any atom """
+    from ambercalculator import AmberSnapshot
+
+    options = _options(argv, {"-i": None, "-p": None})
+    script = _readfile(options["-i"], program) if options["-i"] else sys.stdin.read()
+    if script is None:
+        return 1
+
+    print("\nCPPTRAJ: Trajectory Analysis. V18.01 (stand-in)\n")
+    parm, snapshot = options["-p"], None
+    for line in script.splitlines():
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == "parm":
+            parm = words[1]
+            print("  [parm {0}]".format(parm))
+        elif words[0] == "trajin":
+            text = _readfile(words[1], program)
+            if text is None:
+                return 1
+            snapshot = AmberSnapshot.readcrd(text)
+            print("  [trajin {0}]".format(words[1]))
+        elif words[0] == "strip":
+            print("  [{0}]".format(line.strip()))
+            print("Warning: No atoms to strip. Skipping 'strip' for topology '{0}'".format(os.path.basename(parm)))
+        elif words[0] == "trajout" and snapshot is not None:
+            with open(words[1], "w") as f:
+                f.write(snapshot.crdtext)
+            print("  [trajout {0}]".format(words[1]))
+        elif words[0] in ["go", "run"]:
+            _spendtime(program)
+    return 0
+
+
+# ================================================================================
+
+def _tleap(program, argv):
+    """ Stand-in of tleap: process the leap script, and for a solvateOct command write a topology and
+    a coordinate file of a truncated octahedron of water. The solute is represented by water molecules,
+    so that the number of atoms of the system is comparable with the real one. The units that are not
+    loaded in the script (the solvent boxes) are saved as a cubic box of water """
+    from benchmark import synthetic
+
+    options = _options(argv, {"-f": None}, switches=["-s"])
+    script = _readfile(options["-f"], program)
+    if script is None:
+        return 1
+
+    print("-I: Adding {0}/dat/leap/prep to search path.".format(os.environ.get("AMBERHOME", "")))
+    molecules, natoms = {}, {}
+    for line in script.splitlines():
+        words = line.replace("=", " = ").split()
+        if len(words) >= 4 and words[1] == "=" and words[2] == "loadmol2":
+            text = _readfile(words[3], program)
+            if text is None:
+                print("Could not open file {0}: not found".format(words[3]))
+                continue
+            atoms = text.split("@<TRIPOS>ATOM")[1].split("@<TRIPOS>")[0].split("\n")
+            molecules[words[0]] = [[float(x) for x in a.split()[2:5]] for a in atoms if a.strip()]
+            natoms[words[0]] = len(molecules[words[0]])
+            print("Loading Mol2 file: ./{0}\nReading MOLECULE named {1}".format(words[3], words[0]))
+        elif words and words[0] == "solvateOct" and words[1] in molecules:
+            coords = molecules[words[1]]
+            extent = max(max(c[i] for c in coords) - min(c[i] for c in coords) for i in range(3))
+            side = extent + 2. * float(words[3])
+            nrWaters = int(synthetic.WATERDENSITY * 0.77 * side ** 3)
+            natoms[words[1]] = len(coords) + 3 * nrWaters
+            print("  Solute vdw bounding box:              {0:.3f} {0:.3f} {0:.3f}".format(extent))
+            print("  Added {0} residues.".format(nrWaters))
+        elif words and words[0] == "saveAmberParm":
+            # units that are not defined in the script are solvent boxes, saved as a box of 216 waters
+            natoms.setdefault(words[1], 648)
+            _spendtime(program)
+            with open(words[2], "w") as f:
+                f.write(synthetic.topology(natoms[words[1]]).topotext)
+            with open(words[3], "w") as f:
+                f.write(synthetic.snapshot(natoms[words[1]], velocity=False).crdtext)
+            print("Writing parm file {0}".format(words[2]))
+        elif words and words[0] == "quit":
+            break
+    print("\tQuit")
+    return 0
+
+
+# ================================================================================
+
+def _readpdb(text):
+    """ Read the atoms of a PDB file, returns lists of atom names, residue names, coordinates, elements and
+    the dictionary of the bonds defined in the CONECT records """
+
+    names, residues, coords, elements, bonds = [], [], [], [], {}
+    for line in text.splitlines():
+        if line.startswith("ATOM") or line.startswith("HETATM"):
+            names.append(line[12:16].strip())
+            residues.append(line[17:20].strip())
+            coords.append([float(line[30:38]), float(line[38:46]), float(line[46:54])])
+            elements.append(line[76:78].strip() or re.sub("[^A-Za-z]", "", line[12:16])[:1])
+        elif line.startswith("CONECT"):
+            fields = [int(line[i:i + 5]) for i in range(6, len(line.rstrip()), 5)]
+            bonds.setdefault(fields[0], set()).update(fields[1:])
+    return names, residues, coords, elements, bonds
+
+
+# ================================================================================
+
+def _antechamber(program, argv):
+    """ Stand-in of antechamber: convert a PDB file to a mol2 file, with GAFF-like atom types and
+    charges that add up to the net charge of the molecule """
+
+    options = _options(argv, {"-i": None, "-fi": "pdb", "-o": None, "-fo": "mol2", "-c": None, "-at": "gaff",
+                              "-nc": "0", "-rn": None, "-s": "2", "-pf": "n"})
+    text = _readfile(options["-i"], program)
+    if text is None:
+        return 1
+    names, residues, coords, elements, bonds = _readpdb(text)
+    _spendtime(program)
+
+    bondList = sorted(set(tuple(sorted((i, j))) for i, js in bonds.items() for j in js))
+    charge = float(options["-nc"]) / max(1, len(names))
+    lines = ["@<TRIPOS>MOLECULE", residues[0] if residues else "MOL",
+             "{0:5d}{1:6d}{2:6d}{3:6d}{4:6d}".format(len(names), len(bondList), 1, 0, 0),
+             "SMALL", "bcc", "", "", "@<TRIPOS>ATOM"]
+    for i, (name, res, c, el) in enumerate(zip(names, residues, coords, elements)):
+        lines.append("{0:7d} {1:<4s} {2:14.4f}{3:11.4f}{4:11.4f} {5:<6s}{6:5d} {7:<4s} {8:13.6f}".format(
+            i + 1, name, c[0], c[1], c[2], el.lower() + ("3" if el.lower() == "c" else ""), 1, res, charge))
+    lines.append("@<TRIPOS>BOND")
+    for i, (a, b) in enumerate(bondList):
+        lines.append("{0:6d}{1:5d}{2:5d} 1".format(i + 1, a, b))
+    lines += ["@<TRIPOS>SUBSTRUCTURE", "     1 {0:<4s}        1 TEMP              0 ****  ****    0 ROOT".format(
+        residues[0] if residues else "MOL"), ""]
+    with open(options["-o"], "w") as f:
+        f.write("\n".join(lines))
+    print("\nWelcome to antechamber 17.3: molecular input file processor.\n")
+    return 0
+
+
+# ================================================================================
+
+def _parmchk(program, argv):
+    """ Stand-in of parmchk/parmchk2: write an empty frcmod file (no missing parameter) """
+
+    options = _options(argv, {"-i": None, "-f": "mol2", "-o": None, "-a": "N", "-s": "gaff"})
+    if _readfile(options["-i"], program) is None:
+        return 1
+    _spendtime(program)
+    with open(options["-o"], "w") as f:
+        f.write("Remark line goes here\nMASS\n\nBOND\n\nANGLE\n\nDIHE\n\nIMPROPER\n\nNONBON\n\n\n")
+    return 0
+
+
+# ================================================================================
+
+def _obabel(program, argv):
+    """ Stand-in of openbabel: convert a xyz file to a PDB file, defining the connectivity from the
+    distances between the atoms and their covalent radii """
+
+    inputFile = [a for a in argv if not a.startswith("-")][0]
+    outputFile = [a[2:] for a in argv if a.startswith("-O")][0]
+    text = _readfile(inputFile, program)
+    if text is None:
+        return 1
+    lines = text.splitlines()
+    atoms = [line.split() for line in lines[2:2 + int(lines[0])]]
+    elements = [a[0].capitalize() for a in atoms]
+    coords = [[float(x) for x in a[1:4]] for a in atoms]
+    _spendtime(program)
+
+    pdb = ["COMPND    {0}".format(os.path.splitext(os.path.basename(inputFile))[0]),
+           "AUTHOR    GENERATED BY OPEN BABEL 2.4.1 (stand-in)"]
+    for i, (el, c) in enumerate(zip(elements, coords)):
+        pdb.append("HETATM{0:5d}  {1:<3s} UNL     1    {2:8.3f}{3:8.3f}{4:8.3f}  1.00  0.00          {5:>2s}".format(
+            i + 1, el, c[0], c[1], c[2], el))
+    for i, (el1, c1) in enumerate(zip(elements, coords)):
+        bonded = [j + 1 for j, (el2, c2) in enumerate(zip(elements, coords)) if i != j and
+                  math.sqrt(sum((x - y) ** 2 for x, y in zip(c1, c2))) <
+                  1.15 * (_COVALENTRADII.get(el1, 1.5) + _COVALENTRADII.get(el2, 1.5))]
+        if bonded:
+            pdb.append("CONECT{0:5d}".format(i + 1) + "".join("{0:5d}".format(j) for j in bonded))
+    pdb += ["MASTER        0    0    0    0    0    0    0    0{0:5d}    0{0:5d}    0".format(len(elements)), "END"]
+    with open(outputFile, "w") as f:
+        f.write("\n".join(pdb) + "\n")
+    print("1 molecule converted")
+    return 0
+
+
+# ================================================================================
+
+def _pdbatoms(topotext, crdtext):
+    """ Generate the ATOM records of the PDB representation of a topology and of a snapshot, as ambpdb does """
+    from ambercalculator import AmberSnapshot
+
+    names = _section(topotext, "ATOM_NAME")
+    labels = _section(topotext, "RESIDUE_LABEL")
+    pointers = [int(n) for n in _section(topotext, "RESIDUE_POINTER")] + [len(names) + 1]
+    numbers = _section(topotext, "ATOMIC_NUMBER")
+    coords = AmberSnapshot.readcrd(crdtext).coords
+
+    records = []
+    for ires, label in enumerate(labels):
+        for iat in range(pointers[ires] - 1, pointers[ires + 1] - 1):
+            number = int(numbers[iat]) if numbers else 0
+            element = _ELEMENTS[number] if 0 < number < len(_ELEMENTS) else names[iat][:1]
+            records.append((iat + 1, "ATOM  {0:5d} {1:<4s} {2:<3s} {3:5d}    {4:8.3f}{5:8.3f}{6:8.3f}  1.00  0.00"
+                                     "          {7:>2s}".format(iat + 1, names[iat], label, ires + 1, coords[0][iat],
+                                                                coords[1][iat], coords[2][iat], element), ires + 1))
+    return records
+
+
+# ================================================================================
+
+def _ambpdb(program, argv):
+    """ Stand-in of ambpdb: write to standard output the PDB file of the topology and coordinates """
+
+    options = _options(argv, {"-p": "prmtop", "-c": "inpcrd"})
+    texts = [_readfile(options[flag], program) for flag in ["-p", "-c"]]
+    if None in texts:
+        return 1
+    _spendtime(program)
+    for n, record, ires in _pdbatoms(*texts):
+        print(record)
+    print("END")
+    return 0
+
+
+# ================================================================================
+
+def _ambmask(program, argv):
+    """ Stand-in of ambmask: print the atoms selected by a mask. Only simple masks are understood:
+    residue lists (":1-3,5"), atom lists ("@1-10,12") and all the atoms ("*") """
+
+    options = _options(argv, {"-p": "prmtop", "-c": "inpcrd", "-out": "short", "-find": "*"})
+    texts = [_readfile(options[flag], program) for flag in ["-p", "-c"]]
+    if None in texts:
+        return 1
+    mask = options["-find"].strip("'\" ")
+
+    match = re.match("^([:@])([0-9,\\-]+)$", mask)
+    if mask != "*" and not match:
+        print("ERROR: mask {0} is not understood by the ambmask stand-in".format(mask))
+        return 0
+    selected = set()
+    if match:
+        for interval in match.group(2).split(","):
+            begin, end = (interval.split("-") + [interval])[0:2] if "-" in interval else (interval, interval)
+            selected.update(range(int(begin), int(end) + 1))
+
+    _spendtime(program)
+    for n, record, ires in _pdbatoms(*texts):
+        if mask == "*" or (match.group(1) == ":" and ires in selected) or (match.group(1) == "@" and n in selected):
+            print(record)
+    return 0
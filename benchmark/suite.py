@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#    COBRAMM
+#    Copyright (c) 2019 ALMA MATER STUDIORUM - Università di Bologna
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#####################################################################################################
+
+# Definition of the benchmarks of the parsers and serializers of ambercalculator, of the functions
+# that run them for a list of system sizes, and of the comparison of the results with a baseline.
+#
+# Each benchmark is a function that takes the size of the system (nr of atoms) and a working directory,
+# prepares the synthetic data that is needed and returns the function that is timed.
+
+import os  # filesystem utilities
+import gc  # garbage collector interface
+import json  # read and write json files
+import math  # import mathematical functions
+import time  # provides various time-related functions
+import platform  # access to underlying platform’s identifying data
+import tempfile  # generate temporary files and directories
+
+import numpy as np  # numpy: arrays and math utilities
+
+from ambercalculator import AmberCalculator, AmberSnapshot, AmberInput, AmberOutput, AmberOutputCollection, \
+    AmberSelection
+from benchmark import synthetic, standin
+
+# default sizes (nr of atoms) of the synthetic systems
+DEFAULTSIZES = [1000, 10000, 100000, 1000000]
+
+# default path of the file with the baseline timings
+BASELINEFILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "baseline.json")
+
+# a benchmark is a regression when its timing is larger than THRESHOLD times the baseline ...
+THRESHOLD = 1.5
+# ... and when the difference with the baseline is larger than MINDIFFERENCE seconds
+MINDIFFERENCE = 1.e-3
+
+# minimum total time (in seconds) of a timing measure: fast functions are called many times in a loop
+_MINMEASURETIME = 0.05
+
+
+#####################################################################################################
+
+def _readcrd(size, workDir):
+    """ AmberSnapshot.readcrd: parse the text of a crd file with coordinates, velocities and unit cell """
+    crdText = synthetic.snapshot(size).crdtext
+    return lambda: AmberSnapshot.readcrd(crdText)
+
+
+def _crdtext(size, workDir):
+    """ AmberSnapshot.crdtext: write the text of a crd file with coordinates, velocities and unit cell """
+    snapshot = synthetic.snapshot(size)
+    return lambda: snapshot.crdtext
+
+
+def _charges(size, workDir):
+    """ AmberTopology.charges: extract the list of the charges from the topology """
+    topology = synthetic.topology(size)
+    return lambda: topology.charges
+
+
+def _atoms(size, workDir):
+    """ AmberTopology.atoms: extract the list of the atom types from the topology """
+    topology = synthetic.topology(size)
+    return lambda: topology.atoms
+
+
+def _atomsandresidues(size, workDir):
+    """ AmberTopology.atomsandresidues: extract atomic symbols, coordinates and residues of the atoms """
+    topology, snapshot = synthetic.topology(size), synthetic.snapshot(size)
+    return lambda: topology.atomsandresidues(snapshot)
+
+
+def _substitutecharges(size, workDir):
+    """ AmberTopology.substitutecharges: write a new topology with modified charges """
+    topology = synthetic.topology(size)
+    newcharges = [0.9 * q for q in topology.charges]
+    return lambda: topology.substitutecharges(newcharges)
+
+
+def _selection(size, workDir):
+    """ AmberSelection: build two random selections of about half of the atoms from arrays of indices,
+    combine them with union, intersection and difference and convert the result to an array of indices """
+    rng = np.random.RandomState(0)
+    indices1, indices2 = np.flatnonzero(rng.rand(size) < 0.5), np.flatnonzero(rng.rand(size) < 0.5)
+
+    def function():
+        selection1, selection2 = AmberSelection.fromindices(indices1), AmberSelection.fromindices(indices2)
+        return ((selection1 | selection2) - (selection1 & selection2)).indices
+    return function
+
+
+def _readinput(size, workDir):
+    """ AmberInput.readinput: input files do not scale with the system, so one input file is parsed
+    for every 1000 atoms of the system, to measure the throughput of the parser """
+    inputTexts = [synthetic.inputfile(minimize=False, nrSteps=1000 + i).inputtext for i in range(max(1, size // 1000))]
+    return lambda: [AmberInput.readinput(text) for text in inputTexts]
+
+
+def _parselog(size, workDir):
+    """ AmberOutput._parseAmberLog: parse a sander log file with one printed step every 10 atoms,
+    reading the file line by line from the disk """
+    inputData = synthetic.inputfile(minimize=False, nrSteps=size, nprntsteps=1)
+    logFile = os.path.join(workDir, "log{0}.out".format(size))
+    with open(logFile, "w") as f:
+        f.write(synthetic.logtext(1000, inputData, nrRecords=max(1, size // 10)))
+
+    def function():
+        with open(logFile) as f:
+            return AmberOutput._parseAmberLog(f)
+    return function
+
+
+def _collection(size, workDir):
+    """ AmberOutputCollection.summary: equilibration, averages and autocorrelation times of energy, temperature,
+    pressure and volume for a chain of two MD runs, with one printed step every 100 atoms in each run """
+    inputData = synthetic.inputfile(minimize=False, nrSteps=size, nprntsteps=1)
+    outputs = []
+    for n in range(2):
+        calcDir = os.path.join(workDir, "collection{0}_{1}".format(size, n))
+        synthetic.writecalculation(calcDir, 1000, inputData, nrRecords=max(10, size // 100), nrFrames=1, seed=n)
+        outputs.append(AmberOutput(calcDir, storeFiles=True))
+    collection = AmberOutputCollection(outputs)
+    return lambda: collection.summary()
+
+
+def _dynamicsplot(size, workDir):
+    """ AmberOutput.dynamicsPlot: write to pdf the plot of energy, temperature, pressure and volume of a MD run
+    with one printed step every 10 atoms, downsampling the lines to 2000 points """
+    inputData = synthetic.inputfile(minimize=False, nrSteps=size, nprntsteps=1)
+    calcDir = os.path.join(workDir, "plot{0}".format(size))
+    synthetic.writecalculation(calcDir, 1000, inputData, nrRecords=max(10, size // 10), nrFrames=1)
+    output = AmberOutput(calcDir, storeFiles=True)
+    return lambda: output.dynamicsPlot(pdfFileName=os.path.join(calcDir, "dynamics.pdf"))
+
+
+def _snapshot(size, workDir):
+    """ AmberOutput.snapshot: read an intermediate frame of a NetCDF trajectory, the number of frames
+    is scaled with the size of the system to keep the size of the trajectory roughly constant """
+    nrFrames = max(10, min(1000, 1000000 // size))
+    inputData = synthetic.inputfile(minimize=False, nrSteps=nrFrames * 10, nprntsteps=10)
+    calcDir = os.path.join(workDir, "snapshot{0}".format(size))
+    synthetic.writecalculation(calcDir, size, inputData)
+    output = AmberOutput(calcDir, storeFiles=True)
+    return lambda: output.snapshot(nrFrames // 2)
+
+
+def _snapshots(size, workDir):
+    """ AmberOutput.snapshots: read every second frame of a NetCDF trajectory in a single AmberTrajectory,
+    with the same trajectories of the AmberOutput.snapshot benchmark """
+    nrFrames = max(10, min(1000, 1000000 // size))
+    inputData = synthetic.inputfile(minimize=False, nrSteps=nrFrames * 10, nprntsteps=10)
+    calcDir = os.path.join(workDir, "snapshots{0}".format(size))
+    synthetic.writecalculation(calcDir, size, inputData)
+    output = AmberOutput(calcDir, storeFiles=True)
+    return lambda: output[::2]
+
+
+def _archive(size, workDir):
+    """ AmberArchive: read an intermediate frame from the archive of the trajectories of the AmberOutput.snapshot
+    benchmark, with the coordinates quantized at 0.001 Ang in blocks of 100 frames (a single block is decoded) """
+    nrFrames = max(10, min(1000, 1000000 // size))
+    inputData = synthetic.inputfile(minimize=False, nrSteps=nrFrames * 10, nprntsteps=10)
+    calcDir = os.path.join(workDir, "archive{0}".format(size))
+    synthetic.writecalculation(calcDir, size, inputData)
+    AmberOutput(calcDir, storeFiles=True).writeArchive(calcDir + ".arc")
+
+    def function():
+        output = AmberOutput(calcDir + ".arc")
+        return output.snapshot(nrFrames // 2)
+    return function
+
+
+def _analysis(size, workDir):
+    """ AmberAnalysis.rmsd: RMSD with the superposition of each frame on the first one, streaming the frames of the
+    trajectories of the AmberOutput.snapshot benchmark in chunks of 64 frames """
+    nrFrames = max(10, min(1000, 1000000 // size))
+    inputData = synthetic.inputfile(minimize=False, nrSteps=nrFrames * 10, nprntsteps=10)
+    calcDir = os.path.join(workDir, "analysis{0}".format(size))
+    synthetic.writecalculation(calcDir, size, inputData)
+    analysis = AmberOutput(calcDir, storeFiles=True).analysis(chunkSize=64)
+    return lambda: analysis.rmsd()
+
+
+def _run(size, workDir):
+    """ AmberCalculator.run: complete pipeline of a MD run of 100 steps with 10 frames, with the stand-in sander
+    (writing of the input files, launch of the program, parsing of the results and cleanup) """
+    inputData = synthetic.inputfile(minimize=False, nrSteps=100, nprntsteps=10)
+    topology, snapshot = synthetic.topology(size), synthetic.snapshot(size)
+    calcDir = os.path.join(workDir, "run{0}".format(size))
+
+    def function():
+        with standin.activate(cache=os.path.join(workDir, "cache")):
+            AmberCalculator.run(inputData, topology, snapshot, calcDir=calcDir, overwrite=True)
+    return function
+
+
+def _solvate(size, workDir):
+    """ AmberCalculator.solvate: solvate a small molecule in a truncated octahedron of water with (approximately)
+    size atoms, replicating a pre-equilibrated box of 216 water molecules """
+    solute, box = (synthetic.topology(30), synthetic.snapshot(30)), (synthetic.topology(648), synthetic.snapshot(648))
+    # the truncated octahedron of edge a has volume 4 a^3 / (3 sqrt(3)), and a is about twice the solvation layer
+    edge = (size / (3. * synthetic.WATERDENSITY) * 3. * math.sqrt(3.) / 4.) ** (1. / 3.)
+    return lambda: AmberCalculator.solvate(*solute, *box, 0.5 * edge)
+
+
+# dictionary of the available benchmarks, in the order in which they are run
+BENCHMARKS = {
+    "AmberSnapshot.readcrd": _readcrd,
+    "AmberSnapshot.crdtext": _crdtext,
+    "AmberTopology.charges": _charges,
+    "AmberTopology.atoms": _atoms,
+    "AmberTopology.atomsandresidues": _atomsandresidues,
+    "AmberTopology.substitutecharges": _substitutecharges,
+    "AmberSelection": _selection,
+    "AmberInput.readinput": _readinput,
+    "AmberOutput._parseAmberLog": _parselog,
+    "AmberOutputCollection.summary": _collection,
+    "AmberOutput.dynamicsPlot": _dynamicsplot,
+    "AmberOutput.snapshot": _snapshot,
+    "AmberOutput.snapshots": _snapshots,
+    "AmberAnalysis.rmsd": _analysis,
+    "AmberArchive": _archive,
+    "AmberCalculator.run": _run,
+    "AmberCalculator.solvate": _solvate,
+}
+
+
+#####################################################################################################
+
+def measure(function, repeat=3):
+    """ Measure the time needed to execute a function with no arguments. When the function is fast, it is
+    called repeatedly in a loop that lasts at least _MINMEASURETIME seconds. The measure is repeated and
+    the best timing is returned, as in the timeit module.
+
+    :param function: function that is timed
+    :param repeat: number of times the measure is repeated
+    :return: best time (in seconds) for a single call of the function
+    """
+
+    # determine the number of calls that are needed for a measure that lasts at least _MINMEASURETIME
+    number = 1
+    while True:
+        elapsed = _timeloop(function, number)
+        if elapsed >= _MINMEASURETIME or number >= 1000:
+            break
+        number *= 10
+
+    # now repeat the measure and take the best result
+    timings = [elapsed] + [_timeloop(function, number) for _ in range(repeat - 1)]
+    return min(timings) / number
+
+
+def _timeloop(function, number):
+    """ Time number calls of function, with the garbage collector disabled """
+
+    gcEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        return time.perf_counter() - start
+    finally:
+        if gcEnabled: gc.enable()
+
+
+# ================================================================================
+
+def run(sizes=None, names=None, repeat=3, verbose=True):
+    """ Run the benchmarks for the given system sizes.
+
+    :param sizes: list of sizes (nr of atoms) of the synthetic systems, when None DEFAULTSIZES are used
+    :param names: list of the names of the benchmarks to run, when None all the benchmarks are run
+    :param repeat: number of times each measure is repeated
+    :param verbose: print the timings while the benchmarks are run
+    :return: dictionary with the results {name: {size: {"time": seconds, "peritem": seconds per atom}}}
+    """
+
+    if sizes is None: sizes = DEFAULTSIZES
+    if names is None: names = list(BENCHMARKS.keys())
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        raise ValueError("unknown benchmark(s): {0}".format(", ".join(unknown)))
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="ambercalculator-benchmark-") as workDir:
+        for name in names:
+            results[name] = {}
+            for size in sizes:
+                function = BENCHMARKS[name](size, workDir)
+                timing = measure(function, repeat)
+                results[name][str(size)] = {"time": timing, "peritem": timing / size}
+                del function
+                if verbose:
+                    print("{0:34s} {1:>9d} atoms {2:12.6f} s".format(name, size, timing), flush=True)
+
+    return results
+
+
+# ================================================================================
+
+def environment():
+    """ Description of the machine and of the software used to run the benchmarks """
+    import numpy
+    import scipy
+
+    return {"python": platform.python_version(), "numpy": numpy.__version__, "scipy": scipy.__version__,
+            "machine": platform.machine(), "processor": platform.processor(), "system": platform.system()}
+
+
+# ================================================================================
+
+def scaling(results):
+    """ Compute the empirical scaling exponents of the benchmarks: for each pair of consecutive sizes,
+    the exponent is log(t2/t1) / log(n2/n1), and it is equal to 1 for a linear algorithm.
+
+    :param results: dictionary with the results of the benchmarks, in the format of the run function
+    :return: dictionary {name: {size: exponent}}, where size is the larger of the two sizes
+    """
+
+    exponents = {}
+    for name, timings in results.items():
+        sizes = sorted(int(s) for s in timings.keys())
+        exponents[name] = {}
+        for small, large in zip(sizes[:-1], sizes[1:]):
+            ratio = timings[str(large)]["time"] / timings[str(small)]["time"]
+            exponents[name][str(large)] = math.log(ratio) / math.log(large / small)
+    return exponents
+
+
+# ================================================================================
+
+def loadbaseline(fileName=BASELINEFILE):
+    """ Read the baseline timings from a json file, returns None when the file does not exist """
+
+    if not os.path.isfile(fileName):
+        return None
+    with open(fileName, "r") as f:
+        return json.load(f)
+
+
+# ================================================================================
+
+def savebaseline(results, fileName=BASELINEFILE, baseline=None):
+    """ Write the results of the benchmarks as new baseline in a json file. When an old baseline is given,
+    the results of the benchmarks and sizes that have not been run are kept from the old baseline, together
+    with the thresholds.
+
+    :param results: dictionary with the results of the benchmarks, in the format of the run function
+    :param fileName: name of the json file
+    :param baseline: old baseline, that is updated with the new results
+    """
+
+    if baseline is None:
+        baseline = {"threshold": THRESHOLD, "mindifference": MINDIFFERENCE, "results": {}}
+    baseline["environment"] = environment()
+    for name, timings in results.items():
+        baseline["results"].setdefault(name, {}).update(timings)
+
+    # write first to a temporary file and then replace the old baseline
+    with open(fileName + ".tmp", "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(fileName + ".tmp", fileName)
+
+
+# ================================================================================
+
+def compare(results, baseline):
+    """ Compare the results of the benchmarks with the baseline. A benchmark is flagged as a regression
+    when its timing is larger than the baseline timing times the threshold, and when the absolute difference
+    with the baseline is larger than the minimum difference. The threshold can be defined for the whole
+    baseline or for a single benchmark and size, with the "threshold" key.
+
+    :param results: dictionary with the results of the benchmarks, in the format of the run function
+    :param baseline: dictionary of the baseline, read with loadbaseline
+    :return: list of tuples (name, size, time, baseline time, threshold) of the regressions
+    """
+
+    regressions = []
+    for name, timings in results.items():
+        for size, result in timings.items():
+            try:
+                reference = baseline["results"][name][size]
+            except KeyError:
+                continue  # the benchmark is not present in the baseline
+            threshold = reference.get("threshold", baseline.get("threshold", THRESHOLD))
+            mindifference = baseline.get("mindifference", MINDIFFERENCE)
+            if result["time"] > threshold * reference["time"] and \
+                    result["time"] - reference["time"] > mindifference:
+                regressions.append((name, int(size), result["time"], reference["time"], threshold))
+
+    return regressions
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#    COBRAMM
+#    Copyright (c) 2019 ALMA MATER STUDIORUM - Università di Bologna
+
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#####################################################################################################
+
+# Generators of synthetic AMBER data of arbitrary size: topology, coordinates, input files,
+# sander log files and NetCDF trajectories. The molecular system is always a box of TIP3P water
+# molecules, that is simple enough to be generated for any number of atoms and realistic enough
+# to be processed by all the classes of ambercalculator.
+
+import os  # filesystem utilities
+import math  # import mathematical functions
+
+import numpy as np  # numpy: arrays and math utilities
+from scipy.io import netcdf_file  # write NetCDF file using scipy
+
+from ambercalculator import AmberCalculator, AmberSnapshot, AmberTopology, AmberInput
+import ambercalculator.constants as constants  # physical and mathematical constants
+
+# number density of liquid water, in molecules / Angstrom^3
+WATERDENSITY = 0.0334
+
+# geometry of the TIP3P water molecule: O-H distance (Ang) and H-O-H angle (deg)
+_TIP3P_ROH = 0.9572
+_TIP3P_HOH = 104.52
+
+# TIP3P parameters: charges, masses, atomic numbers, LJ parameters (R*/2 in Ang, epsilon in kcal/mol)
+_TIP3P_CHARGES = [-0.834, 0.417, 0.417]
+_TIP3P_MASSES = [16.00, 1.008, 1.008]
+_TIP3P_NUMBERS = [8, 1, 1]
+_TIP3P_RSTAR = 1.7683
+_TIP3P_EPS = 0.1520
+
+# time of the TIMINGS section of a sander log, rescaled to the number of steps of the synthetic run
+_SANDER_TIMINGS = [(4, "Read coords time", 0.00, "Total"),
+                   (16, "Build the list", 0.04, "List "),
+                   (13, "List time", 0.04, "Nonbo"),
+                   (16, "Direct Ewald time", 6.00, "Ewald"),
+                   (19, "FFT time", 0.53, "Recip"),
+                   (16, "Recip Ewald time", 1.05, "Ewald"),
+                   (13, "Ewald time", 7.12, "Nonbo"),
+                   (10, "Nonbond force", 7.16, "Force"),
+                   (10, "Bond/Angle/Dihedral", 0.07, "Force"),
+                   (7, "Force time", 7.24, "Runmd"),
+                   (7, "Shake time", 0.03, "Runmd"),
+                   (7, "Verlet update time", 0.36, "Runmd"),
+                   (4, "Runmd Time", 7.64, "Total"),
+                   (4, "Other", 0.20, "Total"),
+                   (1, "Total time", 7.85, "ALL  ")]
+
+
+#####################################################################################################
+
+def nrWaters(natoms):
+    """ Number of water molecules of a synthetic system with (approximately) natoms atoms """
+    return max(1, natoms // 3)
+
+
+# ================================================================================
+
+def boxSize(natoms):
+    """ Size (in Angstrom) of the cubic box of a synthetic system with natoms atoms """
+    return (nrWaters(natoms) / WATERDENSITY) ** (1. / 3.)
+
+
+# ================================================================================
+
+def _section(flag, fmt, values):
+    """ Write a section of an AMBER topology file, with the given Fortran format
+
+    :param flag: name of the section
+    :param fmt: Fortran format of the section, one of 20a4, 10I8, 5E16.8, 3I8, 1I8 and 1a80
+    :param values: list or array of values of the section
+    :return: text of the section
+    """
+
+    perLine = {"20a4": 20, "10I8": 10, "5E16.8": 5, "3I8": 3, "1I8": 1, "1a80": 1}[fmt]
+    fieldFormat = {"20a4": "{0:4s}", "10I8": "{0:8d}", "5E16.8": "{0:16.8E}", "3I8": "{0:8d}", "1I8": "{0:8d}",
+                   "1a80": "{0:80s}"}[fmt]
+
+    fields = [fieldFormat.format(v) for v in values]
+    lines = ["".join(fields[i:i + perLine]) for i in range(0, len(fields), perLine)] or [""]
+    return "%FLAG {0:74s}\n%FORMAT({1}){2}\n{3}\n".format(flag, fmt, " " * (71 - len(fmt)), "\n".join(lines))
+
+
+# ================================================================================
+
+def topology(natoms):
+    """ Create the topology of a periodic box of TIP3P water molecules with (approximately) natoms atoms
+
+    :param natoms: number of atoms of the system
+    :return: AmberTopology instance
+    """
+
+    nres = nrWaters(natoms)
+    nat = 3 * nres
+    rmin = 2.0 * _TIP3P_RSTAR
+
+    # data that is repeated for each water molecule
+    first = np.arange(nres) * 3
+    bonds = np.column_stack((first * 3, first * 3 + 3, np.full(nres, 1),
+                             first * 3, first * 3 + 6, np.full(nres, 1),
+                             first * 3 + 3, first * 3 + 6, np.full(nres, 2))).reshape(-1)
+    excluded = np.column_stack((first + 2, first + 3, first + 3, np.zeros(nres, dtype=int))).reshape(-1)
+
+    pointers = [nat, 2, 3 * nres, 0, 0, 0, 0, 0, 0, 0,
+                4 * nres, nres, 0, 0, 0, 2, 0, 0, 2, 1,
+                0, 0, 0, 0, 0, 0, 0, 1, 3, 0,
+                0]
+
+    text = "%VERSION  VERSION_STAMP = V0001.000  DATE = 01/01/19  00:00:00{0:16s}\n".format("")
+    text += _section("TITLE", "20a4", ["synt", "heti", "c wa", "ter "])
+    text += _section("POINTERS", "10I8", pointers)
+    text += _section("ATOM_NAME", "20a4", ["O", "H1", "H2"] * nres)
+    text += _section("CHARGE", "5E16.8", [q / constants.MDcharge2au for q in _TIP3P_CHARGES] * nres)
+    text += _section("ATOMIC_NUMBER", "10I8", _TIP3P_NUMBERS * nres)
+    text += _section("MASS", "5E16.8", _TIP3P_MASSES * nres)
+    text += _section("ATOM_TYPE_INDEX", "10I8", [1, 2, 2] * nres)
+    text += _section("NUMBER_EXCLUDED_ATOMS", "10I8", [2, 1, 1] * nres)
+    text += _section("NONBONDED_PARM_INDEX", "10I8", [1, 2, 2, 3])
+    text += _section("RESIDUE_LABEL", "20a4", ["WAT"] * nres)
+    text += _section("RESIDUE_POINTER", "10I8", list(first + 1))
+    text += _section("BOND_FORCE_CONSTANT", "5E16.8", [553.0, 553.0])
+    text += _section("BOND_EQUIL_VALUE", "5E16.8", [_TIP3P_ROH, 1.5136])
+    for flag in ["ANGLE_FORCE_CONSTANT", "ANGLE_EQUIL_VALUE", "DIHEDRAL_FORCE_CONSTANT", "DIHEDRAL_PERIODICITY",
+                 "DIHEDRAL_PHASE", "SCEE_SCALE_FACTOR", "SCNB_SCALE_FACTOR"]:
+        text += _section(flag, "5E16.8", [])
+    text += _section("SOLTY", "5E16.8", [0.0, 0.0])
+    text += _section("LENNARD_JONES_ACOEF", "5E16.8", [_TIP3P_EPS * rmin ** 12, 0.0, 0.0])
+    text += _section("LENNARD_JONES_BCOEF", "5E16.8", [2.0 * _TIP3P_EPS * rmin ** 6, 0.0, 0.0])
+    text += _section("BONDS_INC_HYDROGEN", "10I8", list(bonds))
+    for flag in ["BONDS_WITHOUT_HYDROGEN", "ANGLES_INC_HYDROGEN", "ANGLES_WITHOUT_HYDROGEN",
+                 "DIHEDRALS_INC_HYDROGEN", "DIHEDRALS_WITHOUT_HYDROGEN"]:
+        text += _section(flag, "10I8", [])
+    text += _section("EXCLUDED_ATOMS_LIST", "10I8", list(excluded))
+    text += _section("HBOND_ACOEF", "5E16.8", [0.0])
+    text += _section("HBOND_BCOEF", "5E16.8", [0.0])
+    text += _section("HBCUT", "5E16.8", [0.0])
+    text += _section("AMBER_ATOM_TYPE", "20a4", ["OW", "HW", "HW"] * nres)
+    text += _section("TREE_CHAIN_CLASSIFICATION", "20a4", ["BLA"] * nat)
+    text += _section("JOIN_ARRAY", "10I8", [0] * nat)
+    text += _section("IROTAT", "10I8", [0] * nat)
+    text += _section("SOLVENT_POINTERS", "3I8", [0, nres, 1])
+    text += _section("ATOMS_PER_MOLECULE", "10I8", [3] * nres)
+    text += _section("BOX_DIMENSIONS", "5E16.8", [90.0] + [boxSize(natoms)] * 3)
+    text += _section("RADIUS_SET", "1a80", ["modified Bondi radii (mbondi)"])
+    text += _section("RADII", "5E16.8", [1.5, 0.8, 0.8] * nres)
+    text += _section("SCREEN", "5E16.8", [0.85, 0.85, 0.85] * nres)
+    text += _section("IPOL", "1I8", [0])
+
+    return AmberTopology(text)
+
+
+# ================================================================================
+
+def coordinates(natoms, seed=0):
+    """ Create the coordinates (in Angstrom) of a box of TIP3P water molecules with (approximately)
+    natoms atoms, arranged on a slightly distorted cubic lattice
+
+    :param natoms: number of atoms of the system
+    :param seed: seed of the random number generator
+    :return: array of shape (natoms, 3) with the coordinates
+    """
+
+    rng = np.random.RandomState(seed)
+    nres = nrWaters(natoms)
+    side = boxSize(natoms)
+
+    # position of the oxygen atoms on a cubic lattice, with some noise
+    nside = int(math.ceil(nres ** (1. / 3.)))
+    lattice = np.stack(np.meshgrid(*[np.arange(nside)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)[:nres]
+    oxygens = (lattice + 0.5) * side / nside + rng.uniform(-0.2, 0.2, (nres, 3))
+
+    # hydrogen atoms in the plane of a random orientation
+    theta = _TIP3P_HOH / 2. * constants.Deg2Rad
+    axis1 = rng.normal(size=(nres, 3))
+    axis1 /= np.linalg.norm(axis1, axis=1)[:, None]
+    axis2 = np.cross(axis1, rng.normal(size=(nres, 3)))
+    axis2 /= np.linalg.norm(axis2, axis=1)[:, None]
+    hydrogen1 = oxygens + _TIP3P_ROH * (math.cos(theta) * axis1 + math.sin(theta) * axis2)
+    hydrogen2 = oxygens + _TIP3P_ROH * (math.cos(theta) * axis1 - math.sin(theta) * axis2)
+
+    return np.stack((oxygens, hydrogen1, hydrogen2), axis=1).reshape(-1, 3)
+
+
+# ================================================================================
+
+def snapshot(natoms, velocity=True, seed=0):
+    """ Create an AmberSnapshot for a periodic box of TIP3P water molecules with (approximately) natoms atoms
+
+    :param natoms: number of atoms of the system
+    :param velocity: include random velocities in the snapshot
+    :param seed: seed of the random number generator
+    :return: AmberSnapshot instance
+    """
+
+    coords = coordinates(natoms, seed)
+    side = boxSize(natoms)
+    unitcell = np.array([side, side, side] + [90.0 * constants.Deg2Rad] * 3)
+    if velocity:
+        vels = np.random.RandomState(seed + 1).normal(scale=5.e-7, size=coords.shape)
+        return AmberSnapshot(coords.T, unitcell, vels.T)
+    else:
+        return AmberSnapshot(coords.T, unitcell, None)
+
+
+# ================================================================================
+
+def inputfile(minimize=False, nrSteps=1000, nprntsteps=10):
+    """ Create an AmberInput for a periodic calculation of a synthetic system
+
+    :param minimize: True if this is a minimization run, False for a MD run
+    :param nrSteps: total number of steps
+    :param nprntsteps: print energy and write coordinates every nprntsteps steps
+    :return: AmberInput instance
+    """
+    return AmberInput(minimize=minimize, nrSteps=nrSteps, nprntsteps=nprntsteps, temperature=300., pressure=1.,
+                      cutoff=9.0, freezeH=True, usePBC=True)
+
+
+# ================================================================================
+
+def logtext(natoms, inputData, nrRecords=None, seed=0, box=None, periodic=True, ntasks=1, walltime=None):
+    """ Create the text of a sander log file, for a calculation of a system with natoms atoms.
+    The values of the energy terms are random, but the format of the text is the same of sander.
+
+    :param natoms: number of atoms of the system
+    :param inputData: AmberInput instance with the input of the calculation
+    :param nrRecords: number of printed steps, when None it is determined by the input (nstlim or maxcyc / ntpr)
+    :param seed: seed of the random number generator
+    :param box: lengths (in Angstrom) of the sides of the box, when None the box of the synthetic system is used
+    :param periodic: when False, write the log of a calculation without periodic boundary conditions
+    :param ntasks: number of MPI tasks of the calculation
+    :param walltime: total time of the calculation (in s), written in the TIMINGS section
+    :return: text of the log file
+    """
+
+    rng = np.random.RandomState(seed)
+    if box is None: box = [boxSize(natoms)] * 3
+    minimize = int(inputData["imin"]) == 1
+    ntpr = int(inputData["ntpr"])
+    nrSteps = int(inputData["maxcyc"] if minimize else inputData["nstlim"])
+    if nrRecords is None: nrRecords = max(1, nrSteps // ntpr)
+    dt = float(inputData["dt"]) if not minimize else 0.0
+
+    text = ["\n          -------------------------------------------------------\n"
+            "          Amber 18 SANDER                              2018\n"
+            "          -------------------------------------------------------\n\n"
+            "| Run on 01/01/2019 at 00:00:00\n\n"]
+    if ntasks > 1:
+        text.append("|  Running AMBER/MPI version on {0:4d} MPI tasks\n\n".format(ntasks))
+    text += ["Here is the input file:\n\n", inputData.inputtext,
+             "\n--------------------------------------------------------------------------------\n"
+             "   1.  RESOURCE   USE: \n"
+             "--------------------------------------------------------------------------------\n\n",
+             " NATOM  = {0:7d} NTYPES =       2 NBONH  = {1:7d} MBONA  =       0\n".format(natoms, natoms),
+             "\n--------------------------------------------------------------------------------\n"
+             "   2.  CONTROL  DATA  FOR  THE  RUN\n"
+             "--------------------------------------------------------------------------------\n\n"
+             "General flags:\n"
+             "     imin    = {0:7d}, nmropt  =       0\n\n".format(1 if minimize else 0),
+             "Nature and format of output:\n"
+             "     ntxo    =       2, ntpr    = {0:7d}, ntrx    =       1, ntwr    = {1:7d}\n"
+             "     iwrap   =       0, ntwx    = {2:7d}, ntwv    =      -1, ntwe    =       0\n\n".format(
+                 ntpr, nrSteps, int(inputData["ntwx"]))]
+    if periodic:
+        text.append("Ewald parameters:\n"
+                    "     Box X = {0:9.3f}   Box Y = {1:9.3f}   Box Z = {2:9.3f}\n"
+                    "     Alpha =   90.000   Beta  =   90.000   Gamma =   90.000\n\n".format(*box))
+    text.append("--------------------------------------------------------------------------------\n"
+                "   4.  RESULTS\n"
+                "--------------------------------------------------------------------------------\n\n")
+
+    # per-step records with random values around realistic averages
+    energy = -9.5 * natoms + rng.normal(scale=1.0, size=nrRecords).cumsum()
+    if minimize:
+        for i in range(nrRecords):
+            step = 1 if i == 0 else i * ntpr
+            text.append(_minimizationRecord(step, energy[i]))
+        text.append("  Maximum number of minimization cycles reached.\n\n\n"
+                    "                    FINAL RESULTS\n\n\n\n")
+        text.append(_minimizationRecord(step, energy[-1]))
+    else:
+        temperature = 300. + rng.normal(scale=3.0, size=nrRecords)
+        pressure = rng.normal(scale=100.0, size=nrRecords) if periodic else np.zeros(nrRecords)
+        volume = box[0] * box[1] * box[2] * (1.0 + rng.normal(scale=0.001, size=nrRecords)) if periodic else None
+        for i in range(nrRecords):
+            text.append(_dynamicsRecord((i + 1) * ntpr, (i + 1) * ntpr * dt, temperature[i], pressure[i], energy[i],
+                                        volume[i] if periodic else None, natoms))
+        text.append("\n      A V E R A G E S   O V E R {0:7d} S T E P S\n\n".format(nrRecords))
+        text.append(_dynamicsRecord(nrRecords * ntpr, nrRecords * ntpr * dt, temperature.mean(), pressure.mean(),
+                                    energy.mean(), volume.mean() if periodic else None, natoms))
+        text.append("\n      R M S  F L U C T U A T I O N S\n\n")
+        text.append(_dynamicsRecord(nrRecords * ntpr, nrRecords * ntpr * dt, temperature.std(), pressure.std(),
+                                    energy.std(), volume.std() if periodic else None, natoms))
+
+    text.append(timingstext(nrRecords * ntpr, walltime))
+    return "".join(text)
+
+
+# ================================================================================
+
+def _minimizationRecord(step, energy):
+    """ Text of the record of an optimization step in the sander log file """
+    return ("   NSTEP       ENERGY          RMS            GMAX         NAME    NUMBER\n"
+            "{0:7d}      {1:11.4E}     1.8547E+01     1.1424E+02     O          1\n\n"
+            " BOND    = {2:13.4f}  ANGLE   = {3:13.4f}  DIHED      = {3:13.4f}\n"
+            " VDWAALS = {4:13.4f}  EEL     = {5:13.4f}  HBOND      = {3:13.4f}\n"
+            " 1-4 VDW = {3:13.4f}  1-4 EEL = {3:13.4f}  RESTRAINT  = {3:13.4f}\n\n\n").format(
+        step, energy, 0.01 * abs(energy), 0.0, 0.15 * abs(energy), 1.15 * energy - 0.01 * abs(energy))
+
+
+# ================================================================================
+
+def _dynamicsRecord(step, time, temperature, pressure, energy, volume, natoms):
+    """ Text of the record of a molecular dynamics step in the sander log file, volume is None without PBC """
+    kinetic = 1.5 * natoms * 0.0019872 * temperature * 2. / 3.
+    potential = energy - kinetic
+    text = (" NSTEP = {0:8d}   TIME(PS) = {1:11.3f}  TEMP(K) = {2:8.2f}  PRESS = {3:8.1f}\n"
+            " Etot   = {4:14.4f}  EKtot   = {5:14.4f}  EPtot      = {6:14.4f}\n"
+            " BOND   = {7:14.4f}  ANGLE   = {7:14.4f}  DIHED      = {7:14.4f}\n"
+            " 1-4 NB = {7:14.4f}  1-4 EEL = {7:14.4f}  VDWAALS    = {8:14.4f}\n"
+            " EELEC  = {9:14.4f}  EHBOND  = {7:14.4f}  RESTRAINT  = {7:14.4f}\n").format(
+        step, time, temperature, pressure, energy, kinetic, potential, 0.0, 0.15 * abs(potential), 1.15 * potential)
+    if volume is not None:
+        text += (" EKCMT  = {0:14.4f}  VIRIAL  = {1:14.4f}  VOLUME     = {2:14.4f}\n"
+                 "                                                    Density    = {3:14.4f}\n"
+                 " Ewald error estimate:   0.1184E-03\n").format(
+            kinetic / 2., kinetic / 2. - pressure * volume / 68568.415, volume, natoms / 3. * 18.015 / volume / 0.6022)
+    return text + " ------------------------------------------------------------------------------\n\n"
+
+
+# ================================================================================
+
+def timingstext(nrSteps, walltime=None):
+    """ Text of the TIMINGS section of a sander log file, with the timings rescaled to the number of steps
+
+    :param nrSteps: number of steps of the calculation
+    :param walltime: total time of the calculation (in s), when None it is taken from a real sander output
+    :return: text of the TIMINGS section
+    """
+
+    scale = 1.0 if walltime is None else walltime / _SANDER_TIMINGS[-1][2]
+    total = _SANDER_TIMINGS[-1][2] * scale
+    text = ["\n--------------------------------------------------------------------------------\n"
+            "   5.  TIMINGS\n"
+            "--------------------------------------------------------------------------------\n\n"]
+    for depth, name, seconds, parent in _SANDER_TIMINGS:
+        text.append("|{0}{1:27s}{2:8.2f} ({3:5.2f}% of {4})\n".format(" " * depth, name, seconds * scale,
+                                                                     seconds / total * 100. * scale, parent))
+    elapsed = _SANDER_TIMINGS[-3][2] * scale
+    perStep = elapsed / max(nrSteps, 1) * 1000.
+    nsPerDay = 0.001 * max(nrSteps, 1) / elapsed * 86400. if elapsed > 0. else 0.
+    text.append("\n| Final Performance Info:\n"
+                "|     -----------------------------------------------------\n"
+                "|     Average timings for all steps:\n"
+                "|     Elapsed(s) = {0:10.2f} Per Step(ms) = {1:10.2f}\n"
+                "|         ns/day = {2:10.2f}   seconds/ns = {3:10.2f}\n"
+                "|     -----------------------------------------------------\n\n".format(
+                    elapsed, perStep, nsPerDay, 86400. / nsPerDay if nsPerDay > 0. else 0.))
+    text.append("|  Setup CPU time:     {0:12.2f} seconds\n"
+                "|  NonSetup CPU time:  {1:12.2f} seconds\n"
+                "|  Total CPU time:     {2:12.2f} seconds     {3:.2f} hours\n\n"
+                "|  Setup wall time:    {4:5d}    seconds\n"
+                "|  NonSetup wall time: {5:5d}    seconds\n"
+                "|  Total wall time:    {5:5d}    seconds     {3:.2f} hours\n".format(
+                    total - elapsed, elapsed, total, total / 3600., 0, int(round(total))))
+    return "".join(text)
+
+
+# ================================================================================
+
+def writetrajectory(fileName, natoms, nrFrames, velocity=True, forces=True, seed=0, initial=None, timeStep=0.01):
+    """ Write a NetCDF trajectory with the Amber convention (mdcrd file) for a synthetic system.
+    Frames are generated with random displacements of the atoms from the initial coordinates.
+
+    :param fileName: name of the NetCDF file
+    :param natoms: number of atoms of the system
+    :param nrFrames: number of frames of the trajectory
+    :param velocity: write the velocities of the atoms
+    :param forces: write the forces acting on the atoms
+    :param seed: seed of the random number generator
+    :param initial: AmberSnapshot with the initial coordinates, when None the synthetic water box is used
+    :param timeStep: time (in ps) between two frames of the trajectory
+    """
+
+    rng = np.random.RandomState(seed)
+    if initial is None: initial = snapshot(natoms, velocity=False, seed=seed)
+    coords = np.transpose(initial.coords).astype(np.float32)
+
+    with netcdf_file(fileName, "w", version=2) as ncfile:
+        _netcdfHeader(ncfile, "AMBER", len(coords), frames=True)
+        ncfile.createVariable("time", "f", ("frame",)).units = b"picosecond"
+        ncfile.variables["time"][:] = np.arange(1, nrFrames + 1, dtype=np.float32) * timeStep
+
+        variables = [("coordinates", "angstrom", None)]
+        if velocity: variables.append(("velocities", "angstrom/picosecond", 20.455))
+        if forces: variables.append(("forces", "kilocalorie/mole/angstrom", None))
+        for name, units, scale in variables:
+            var = ncfile.createVariable(name, "f", ("frame", "atom", "spatial"))
+            var.units = units.encode()
+            if scale: var.scale_factor = scale
+            if name == "coordinates":
+                var[:] = coords[None, :, :] + rng.normal(scale=0.1, size=(nrFrames, 1, 1)).astype(np.float32)
+            else:
+                var[:] = rng.normal(size=(nrFrames, len(coords), 3)).astype(np.float32)
+
+        if initial.unitcell is not None:
+            ncfile.createVariable("cell_lengths", "d", ("frame", "cell_spatial")).units = b"angstrom"
+            ncfile.variables["cell_lengths"][:] = np.tile(initial.unitcell[0:3], (nrFrames, 1))
+            ncfile.createVariable("cell_angles", "d", ("frame", "cell_angular")).units = b"degree"
+            ncfile.variables["cell_angles"][:] = np.tile(np.array(initial.unitcell[3:]) / constants.Deg2Rad,
+                                                         (nrFrames, 1))
+
+
+# ================================================================================
+
+def writerestart(fileName, natoms, seed=0, final=None, time=0.0):
+    """ Write a NetCDF restart file with the Amber convention (restrt file) for a synthetic system
+
+    :param fileName: name of the NetCDF file
+    :param natoms: number of atoms of the system
+    :param seed: seed of the random number generator
+    :param final: AmberSnapshot with the data to write, when None the synthetic water box is used
+    :param time: time (in ps) of the snapshot
+    """
+
+    data = final if final is not None else snapshot(natoms, velocity=True, seed=seed)
+    with netcdf_file(fileName, "w", version=2) as ncfile:
+        _netcdfHeader(ncfile, "AMBERRESTART", len(data.coords[0]), frames=False)
+        ncfile.createVariable("time", "d", ()).units = b"picosecond"
+        ncfile.variables["time"].data[()] = time
+        ncfile.createVariable("coordinates", "d", ("atom", "spatial")).units = b"angstrom"
+        ncfile.variables["coordinates"][:] = np.transpose(data.coords)
+        if data.velocity is not None:
+            var = ncfile.createVariable("velocities", "d", ("atom", "spatial"))
+            var.units, var.scale_factor = b"angstrom/picosecond", 20.455
+            var[:] = np.transpose(data.velocity) * constants.Bohr2Ang * constants.MDtime2au
+        if data.unitcell is not None:
+            ncfile.createVariable("cell_lengths", "d", ("cell_spatial",)).units = b"angstrom"
+            ncfile.variables["cell_lengths"][:] = data.unitcell[0:3]
+            ncfile.createVariable("cell_angles", "d", ("cell_angular",)).units = b"degree"
+            ncfile.variables["cell_angles"][:] = np.array(data.unitcell[3:]) / constants.Deg2Rad
+
+
+# ================================================================================
+
+def _netcdfHeader(ncfile, conventions, natoms, frames):
+    """ Define global attributes, dimensions and label variables of an Amber NetCDF file """
+
+    ncfile.Conventions = conventions.encode()
+    ncfile.ConventionVersion = b"1.0"
+    ncfile.program = b"sander"
+    ncfile.programVersion = b"18.0"
+    if frames: ncfile.createDimension("frame", None)
+    ncfile.createDimension("spatial", 3)
+    ncfile.createDimension("atom", natoms)
+    ncfile.createDimension("cell_spatial", 3)
+    ncfile.createDimension("cell_angular", 3)
+    ncfile.createDimension("label", 5)
+    ncfile.createVariable("spatial", "c", ("spatial",))[:] = np.array(list(b"xyz"), dtype="S1")
+    ncfile.createVariable("cell_spatial", "c", ("cell_spatial",))[:] = np.array(list(b"abc"), dtype="S1")
+    ncfile.createVariable("cell_angular", "c", ("cell_angular", "label"))[:] = \
+        np.array([list(b"alpha"), list(b"beta "), list(b"gamma")], dtype="S1")
+
+
+# ================================================================================
+
+def writecalculation(calcDir, natoms, inputData, nrRecords=None, nrFrames=None, seed=0):
+    """ Write a complete directory of a synthetic AMBER calculation, that can be read with AmberOutput:
+    input, topology, coordinates, log file, mdcrd and restrt files
+
+    :param calcDir: directory of the calculation (it is created when it does not exist)
+    :param natoms: number of atoms of the system
+    :param inputData: AmberInput instance with the input of the calculation
+    :param nrRecords: number of printed steps of the log file, None to use the value defined by the input
+    :param nrFrames: number of frames of the mdcrd file, None to use the value defined by the input
+    :param seed: seed of the random number generator
+    """
+
+    if not os.path.isdir(calcDir): os.makedirs(calcDir)
+    natoms = 3 * nrWaters(natoms)
+    minimize = int(inputData["imin"]) == 1
+    nrSteps = int(inputData["maxcyc"] if minimize else inputData["nstlim"])
+    if nrFrames is None: nrFrames = max(1, nrSteps // int(inputData["ntwx"]))
+
+    with open(os.path.join(calcDir, AmberCalculator.INPNAME), "w") as f:
+        f.write(inputData.inputtext)
+    with open(os.path.join(calcDir, AmberCalculator.TOPNAME), "w") as f:
+        f.write(topology(natoms).topotext)
+    with open(os.path.join(calcDir, AmberCalculator.CRDNAME), "w") as f:
+        f.write(snapshot(natoms, velocity=False, seed=seed).crdtext)
+    with open(os.path.join(calcDir, AmberCalculator.OUTNAME), "w") as f:
+        f.write(logtext(natoms, inputData, nrRecords, seed))
+    writetrajectory(os.path.join(calcDir, AmberCalculator.MDCRDNAME), natoms, nrFrames,
+                    velocity=not minimize, forces=not minimize, seed=seed)
+    writerestart(os.path.join(calcDir, AmberCalculator.RESTRTNAME), natoms, seed)
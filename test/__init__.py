@@ -1,4 +1,12 @@
+from test.ambercalculator import TestAmberCalculator
+from test.amberanalysis import TestAmberAnalysis
+from test.amberarchive import TestAmberArchive
 from test.amberinput import TestAmberInput
-from test.amberoutput import TestAmberOutput
+from test.amberoutput import TestAmberOutput, TestAmberOutputSynthetic
+from test.amberoutputcollection import TestAmberOutputCollection
+from test.amberrunarchive import TestAmberRunArchive
+from test.amberselection import TestAmberSelection
 from test.ambersnapshot import TestAmberSnapshot
 from test.ambertopology import TestAmberTopology 
+from test.importtime import TestImportTime
+from test.netcdf3 import TestNetCDF3File
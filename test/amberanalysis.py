@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+
+import unittest
+from ambercalculator import AmberCalculator, AmberError, AmberOutput, AmberSelection, constants
+from benchmark import synthetic
+from scipy.io import netcdf_file
+import os
+import itertools
+import shutil
+import tempfile
+import math
+import numpy as np
+
+
+######################################################################################################################
+
+class TestAmberAnalysis(unittest.TestCase):
+    """The AmberAnalysis class is tested on a synthetic trajectory of a water box in a truncated octahedron,
+    in which each frame is randomly rotated, translated and distorted: the results of the chunked kernels
+    are compared with direct computations on the whole trajectory"""
+
+    # Number of atoms and of frames of the synthetic system, and edge of the unit cell
+    _NATOMS = 300
+    _NFRAMES = 20
+    _EDGE = 22.0
+
+    # ================================================================================================================
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.workDir = tempfile.mkdtemp(prefix="testAmberAnalysis")
+        synthetic.writecalculation(cls.workDir, cls._NATOMS, synthetic.inputfile(minimize=False, nrSteps=200))
+
+        # rewrite the mdcrd with the distorted frames and the unit cell of a truncated octahedron
+        rng = np.random.RandomState(0)
+        initial = np.transpose(synthetic.snapshot(cls._NATOMS, velocity=False).coords)
+        cls.frames = np.array([np.dot(initial, cls._rotation(rng)) + rng.normal(scale=0.3, size=initial.shape)
+                               + rng.normal(size=3) for i in range(cls._NFRAMES)]).astype(np.float32)
+        cls.angle = math.acos(-1. / 3.)
+        with netcdf_file(os.path.join(cls.workDir, AmberCalculator.MDCRDNAME), "w", version=2) as ncfile:
+            synthetic._netcdfHeader(ncfile, "AMBER", len(initial), frames=True)
+            ncfile.createVariable("coordinates", "f", ("frame", "atom", "spatial")).units = b"angstrom"
+            ncfile.variables["coordinates"][:] = cls.frames
+            ncfile.createVariable("cell_lengths", "d", ("frame", "cell_spatial")).units = b"angstrom"
+            ncfile.variables["cell_lengths"][:] = np.full((cls._NFRAMES, 3), cls._EDGE)
+            ncfile.createVariable("cell_angles", "d", ("frame", "cell_angular")).units = b"degree"
+            ncfile.variables["cell_angles"][:] = np.full((cls._NFRAMES, 3), cls.angle / constants.Deg2Rad)
+        cls.frames = cls.frames.astype(np.float64)
+
+        cls.output = AmberOutput(cls.workDir, storeFiles=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workDir)
+
+    # ================================================================================================================
+
+    @staticmethod
+    def _rotation(rng):
+        """Random rotation matrix, from the QR decomposition of a random matrix"""
+        q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+        q *= np.sign(np.diag(r))
+        return q * np.linalg.det(q)
+
+    @staticmethod
+    def _fit(coords, reference, weights):
+        """Superimpose coords on reference with the Kabsch algorithm, return the centered coordinates"""
+        weights = weights / weights.sum()
+        coords, reference = coords - np.dot(weights, coords), reference - np.dot(weights, reference)
+        u, s, vt = np.linalg.svd(np.dot(coords.T * weights, reference))
+        return np.dot(coords, np.dot(u * [1., 1., np.sign(np.linalg.det(np.dot(u, vt)))], vt)), reference
+
+    def _distances(self, first, second):
+        """Minimum image distances between two sets of atoms, checking all the images up to two cells away"""
+        lattice = AmberCalculator._latticeVectors([self._EDGE] * 3 + [self.angle] * 3)
+        vectors = first[:, None, :] - second[None, :, :]
+        squares = np.full(vectors.shape[:2], np.inf)
+        for shift in itertools.product(range(-2, 3), repeat=3):
+            squares = np.minimum(squares, np.sum((vectors + np.dot(shift, lattice)) ** 2, axis=2))
+        return np.sqrt(squares)
+
+    # ================================================================================================================
+
+    def test_structure(self):
+        """Test RMSD, RMSF and radius of gyration, that do not depend on the size of the chunks
+        and on the number of processes"""
+
+        analysis = self.output.analysis(chunkSize=3)
+        atoms = analysis.atoms(":1-20")
+        self.assertTrue(np.array_equal(atoms, np.arange(60)))
+        masses = analysis.masses[atoms]
+
+        rmsd = analysis.rmsd(":1-20", massWeighted=True)
+        for frame, value in zip(self.frames, rmsd):
+            fitted, reference = self._fit(frame[atoms], self.frames[0][atoms], masses)
+            self.assertAlmostEqual(value, math.sqrt(np.dot(masses, np.sum((fitted - reference) ** 2, axis=1)) /
+                                                    masses.sum()), places=5)
+
+        fitted = np.array([self._fit(frame[atoms], self.frames[0][atoms], np.ones(len(atoms)))[0]
+                           for frame in self.frames])
+        rmsf = np.sqrt(np.mean(np.sum((fitted - fitted.mean(axis=0)) ** 2, axis=2), axis=0))
+        self.assertTrue(np.allclose(analysis.rmsf(AmberSelection.frommask("1-60")), rmsf))
+
+        weights = analysis.masses / analysis.masses.sum()
+        centered = self.frames - np.einsum("fni,n->fi", self.frames, weights)[:, None, :]
+        gyration = np.sqrt(np.einsum("fni,fni,n->f", centered, centered, weights))
+        self.assertTrue(np.allclose(analysis.radiusOfGyration(), gyration))
+        # frames that are not equally spaced are read one at a time, with the same results
+        self.assertTrue(np.allclose(analysis.radiusOfGyration(frames=[7, 1, 2, 5]), gyration[[7, 1, 2, 5]]))
+
+        parallel = self.output.analysis(chunkSize=4, nProcesses=2)
+        self.assertTrue(np.allclose(parallel.rmsd(":1-20", massWeighted=True), rmsd))
+        self.assertTrue(np.allclose(parallel.radiusOfGyration(), gyration))
+
+    # ================================================================================================================
+
+    def test_msd(self):
+        """Test the mean square displacement on a subset of the frames"""
+
+        msd = self.output.analysis(chunkSize=2).msd("@1-30", frames=slice(2, None, 3))
+        reference = np.mean(np.sum((self.frames[2::3, :30] - self.frames[2, :30]) ** 2, axis=2), axis=1)
+        self.assertTrue(np.allclose(msd, reference))
+
+    # ================================================================================================================
+
+    def test_distances(self):
+        """Test the radial distribution function and the occupancy of the solvation shell, with the minimum
+        image convention in a non-orthogonal unit cell"""
+
+        analysis = self.output.analysis(chunkSize=1)
+        oxygens = np.arange(0, self.frames.shape[1], 3)
+
+        r, g = analysis.rdf(oxygens, rmax=8.0, nbins=40, frames=[0, 5])
+        edges = np.linspace(0., 8.0, 41)
+        histogram = sum(np.histogram(self._distances(self.frames[f][oxygens], self.frames[f][oxygens])
+                                     [~np.eye(len(oxygens), dtype=bool)], bins=edges)[0] for f in [0, 5])
+        volume = abs(np.linalg.det(AmberCalculator._latticeVectors([self._EDGE] * 3 + [self.angle] * 3)))
+        shells = 4. / 3. * math.pi * (edges[1:] ** 3 - edges[:-1] ** 3)
+        self.assertTrue(np.allclose(r, 0.5 * (edges[1:] + edges[:-1])))
+        self.assertTrue(np.allclose(g, histogram * volume / (2 * shells * len(oxygens) * (len(oxygens) - 1))))
+
+        occupancy = analysis.shellOccupancy(":1-3", ":4-100", cutoff=3.5)
+        solute, solvent = analysis.atoms(":1-3"), analysis.atoms(":4-100")
+        for frame, count in zip(self.frames, occupancy):
+            inShell = np.any(self._distances(frame[solvent], frame[solute]) <= 3.5, axis=1)
+            self.assertEqual(count, len(np.unique(analysis.residues[solvent][inShell])))
+
+        with self.assertRaises(AmberError):
+            analysis.rdf(oxygens, rmax=self._EDGE)
+
+
+######################################################################################################################
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,107 @@
+#! /usr/bin/env python
+
+import unittest
+from ambercalculator import AmberCalculator, AmberError, AmberOutput
+from ambercalculator.archive import AmberArchive, isarchive
+from benchmark import synthetic
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+######################################################################################################################
+
+class TestAmberArchive(unittest.TestCase):
+    """The archives are written from the synthetic calculations of benchmark/synthetic, and the results read
+    from the archives are compared with the results read from the directories of the calculations"""
+
+    # Number of atoms of the synthetic system
+    _NATOMS = 300
+
+    # ================================================================================================================
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.workDir = tempfile.mkdtemp(prefix="testAmberArchive")
+        cls.calcDir = os.path.join(cls.workDir, "calc")
+        synthetic.writecalculation(cls.calcDir, cls._NATOMS, synthetic.inputfile(minimize=False, nrSteps=450))
+        cls.output = AmberOutput(cls.calcDir, storeFiles=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workDir)
+
+    # ================================================================================================================
+
+    def test_archive(self):
+        """Test that an archive is opened as a calculation, with the coordinates within the precision,
+        the velocities and the forces when they are stored, and the other files without loss"""
+
+        fileName = os.path.join(self.workDir, "full.arc")
+        self.output.writeArchive(fileName, precision=1.e-3, velocities=1.e-4, forces=1.e-3, blockSize=8)
+        self.assertTrue(isarchive(fileName))
+
+        archived = AmberOutput(fileName)
+        self.assertTrue(archived.storeFiles)
+        self.assertEqual(archived.records.tobytes(), self.output.records.tobytes())
+        self.assertEqual(archived.logtext, self.output.logtext)
+        # the restrt is stored without loss, the frames of the trajectory with the requested precision
+        self.assertEqual(archived.snapshot(-1), self.output.snapshot(-1))
+        frames = [44, 3, 17, 16]
+        self.assertLessEqual(np.abs(archived[frames].coords - self.output[frames].coords).max(), 0.5e-3 + 1.e-6)
+        self.assertTrue(np.allclose(archived.snapshot(9).velocity, self.output.snapshot(9).velocity, atol=1.e-6))
+        self.assertTrue(np.allclose(archived.snapshot(9).unitcell, self.output.snapshot(9).unitcell))
+        self.assertTrue(np.allclose(np.asarray(archived.gradient), np.asarray(self.output.gradient), atol=1.e-6))
+        del archived
+        self.assertTrue(os.path.isfile(fileName))
+
+    # ================================================================================================================
+
+    def test_coordinatesonly(self):
+        """Test an archive with the coordinates only, that is much smaller than the mdcrd file"""
+
+        fileName = os.path.join(self.workDir, "coordinates.arc")
+        self.output.writeArchive(fileName, precision=1.e-2)
+
+        with AmberArchive(fileName) as archive:
+            mdcrd = archive.netcdf(AmberCalculator.MDCRDNAME)
+            self.assertEqual(set(mdcrd.variables), {"coordinates", "time", "cell_lengths", "cell_angles"})
+            self.assertEqual(mdcrd.variables["coordinates"].shape, (45, self._NATOMS, 3))
+            self.assertEqual(mdcrd.variables["coordinates"][-1, 7].shape, (3,))
+            coordinates = mdcrd.variables["coordinates"].data
+            self.assertTrue(np.array_equal(coordinates[-1], coordinates[44]))
+            self.assertTrue(np.array_equal(coordinates[30:3:-9], coordinates[[30, 21, 12]]))
+            with self.assertRaises(IndexError):
+                coordinates[45]
+        self.assertLess(os.path.getsize(fileName), os.path.getsize(self.output.mdcrdfile) / 5)
+        self.assertIsNone(AmberOutput(fileName).snapshot(3).velocity)
+
+    # ================================================================================================================
+
+    def test_writeerror(self):
+        """Test that an archive that cannot be written raises an AmberError and leaves no temporary file"""
+
+        fileName = os.path.join(self.workDir, "error.arc")
+        with self.assertRaises(AmberError):
+            AmberArchive.write(self.output, fileName, precision=1.e-12)
+        self.assertFalse([name for name in os.listdir(self.workDir) if name.startswith("error.arc")])
+
+    # ================================================================================================================
+
+    def test_notarchive(self):
+        """Test that a file that is not an archive raises an AmberError"""
+
+        fileName = os.path.join(self.workDir, "text")
+        with open(fileName, "w") as f:
+            f.write("this is not an archive\n")
+        self.assertFalse(isarchive(fileName))
+        with self.assertRaises(AmberError):
+            AmberArchive(fileName)
+
+
+######################################################################################################################
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
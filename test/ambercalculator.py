@@ -0,0 +1,359 @@
+#! /usr/bin/env python
+
+import unittest
+from ambercalculator import AmberCalculator, AmberError, AmberOutput, AmberSegmentedOutput
+from benchmark import synthetic, standin
+import os
+import json
+import shutil
+import tempfile
+import math
+import concurrent.futures
+import urllib.request
+from unittest import mock
+import numpy as np
+
+
+######################################################################################################################
+
+class TestAmberCalculator(unittest.TestCase):
+    """The AmberCalculator class is tested with the stand-in executables of benchmark/standin, that emulate the
+    AMBER programs writing files with synthetic data: these tests check the wrapper and not AMBER itself"""
+
+    # Number of atoms of the synthetic system (a box of water molecules)
+    _NATOMS = 300
+
+    # ================================================================================================================
+
+    @classmethod
+    def setUpClass(cls):
+
+        # all the calculations and the cache of ambercalculator are in a temporary directory
+        cls.workDir = tempfile.mkdtemp(prefix="testAmberCalculator")
+        cls.cacheDir = os.path.join(cls.workDir, "cache")
+
+        # synthetic system used in the calculations: topology, snapshot and MD input with 10 printed steps
+        cls.topology = synthetic.topology(cls._NATOMS)
+        cls.snapshot = synthetic.snapshot(cls._NATOMS)
+        cls.MDinput = synthetic.inputfile(minimize=False, nrSteps=100, nprntsteps=10)
+
+    @classmethod
+    def tearDownClass(cls):
+        # wait for the directories of the closed calculations, that are removed in the background
+        AmberOutput.flushCleanup()
+        shutil.rmtree(cls.workDir)
+
+    # ================================================================================================================
+
+    def test_run(self):
+        """Test a complete MD run: the results are parsed and the run record is attached to the output"""
+
+        with standin.activate(cache=self.cacheDir):
+            output = AmberCalculator.run(self.MDinput, self.topology, self.snapshot,
+                                         calcDir=os.path.join(self.workDir, "run"))
+
+        self.assertEqual(output.type, "MD")
+        self.assertEqual(len(output.energy), 10)
+        # all the terms of the printed steps are in the records, the dictionaries are views of the records
+        self.assertEqual(output.records.shape, (10,))
+        self.assertIn("EPtot", output.records.dtype.names)
+        self.assertEqual(sorted(output.temperature.values()), sorted(output.records["TEMP"].tolist()))
+        self.assertEqual(output.runinfo["exitstatus"], 0)
+        self.assertFalse(output.runinfo["reused"])
+        self.assertEqual(set(output.runinfo["stages"]), {"check", "cleanup", "write", "execute", "parse"})
+        self.assertEqual(output.snapshot(-1).coords.shape, (3, self._NATOMS))
+        self.assertEqual(output.snapshot(5).velocity.shape, (3, self._NATOMS))
+        # many frames are read together in a trajectory, with the same data of the single snapshots
+        trajectory = output[2:8:2]
+        self.assertEqual(trajectory.coords.shape, (3, 3, self._NATOMS))
+        self.assertEqual(trajectory[1], output.snapshot(4))
+        self.assertEqual(output.snapshots([7, 1])[0], output.snapshot(7))
+        # the gradient is read from the mdcrd one frame at a time
+        gradient = output.gradient
+        self.assertEqual(gradient.shape, (10, self._NATOMS, 3))
+        self.assertTrue(np.allclose(np.asarray(gradient)[4], gradient[4]))
+        self.assertTrue(np.allclose([frame[0] for frame in gradient], gradient[:, 0]))
+        self.assertTrue(np.allclose(np.asarray(gradient)[7:1:-2], gradient[7:1:-2]))
+        self.assertTrue(np.allclose(gradient[-1], gradient[9]))
+        with self.assertRaises(IndexError):
+            gradient[10]
+        self.assertEqual(gradient.astype(np.float32)[4].dtype, np.float32)
+        # the text of the log file is not kept in memory, it is read from the file when requested
+        self.assertIsNone(output.dataDict["logtext"])
+        self.assertIn("5.  TIMINGS", output.logtext)
+
+    # ================================================================================================================
+
+    def test_runreuse(self):
+        """Test that the results of an identical calculation are read from the existing directory"""
+
+        calcDir = os.path.join(self.workDir, "reuse")
+        with standin.activate(cache=self.cacheDir):
+            AmberCalculator.run(self.MDinput, self.topology, self.snapshot, calcDir=calcDir, store=True)
+            output = AmberCalculator.run(self.MDinput, self.topology, self.snapshot, calcDir=calcDir)
+
+        self.assertTrue(output.runinfo["reused"])
+        self.assertIsNone(output.runinfo["command"])
+
+    # ================================================================================================================
+
+    def test_runerror(self):
+        """Test that a failed AMBER calculation raises an AmberError and is reported to the run hooks"""
+
+        records = []
+        AmberCalculator.addRunHook(records.append)
+        try:
+            with standin.activate(cache=self.cacheDir, fail="sander"):
+                with self.assertRaises(AmberError):
+                    AmberCalculator.run(self.MDinput, self.topology, self.snapshot,
+                                        calcDir=os.path.join(self.workDir, "error"))
+        finally:
+            AmberCalculator.removeRunHook(records.append)
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["exitstatus"], 1)
+        self.assertIsNotNone(records[0]["error"])
+
+    # ================================================================================================================
+
+    def test_runparallel(self):
+        """Test a run with MPI: the number of tasks is read from the TIMINGS of the output"""
+
+        with standin.activate(cache=self.cacheDir):
+            output = AmberCalculator.run(self.MDinput, self.topology, self.snapshot,
+                                         calcDir=os.path.join(self.workDir, "parallel"), nCores=4)
+
+        self.assertEqual(output.timings["ntasks"], 4)
+        self.assertEqual(output.timings["natom"], self._NATOMS)
+
+    # ================================================================================================================
+
+    def test_runsegmented(self):
+        """Test a MD run split in segments: the results are stitched with a continuous time"""
+
+        with standin.activate(cache=self.cacheDir):
+            output = AmberCalculator.runSegmented(self.MDinput, self.topology, self.snapshot, 50,
+                                                  calcDir=os.path.join(self.workDir, "segmented"))
+
+        self.assertIsInstance(output, AmberSegmentedOutput)
+        times = sorted(output.energy.keys())
+        self.assertEqual(len(times), 10)
+        self.assertTrue(all(t2 > t1 for t1, t2 in zip(times[:-1], times[1:])))
+        # a trajectory can span the frames of many segments
+        trajectory = output[3:8]
+        self.assertEqual(len(trajectory), 5)
+        self.assertEqual(trajectory[4], output.snapshot(7))
+
+    # ================================================================================================================
+
+    def test_runsegmentederror(self):
+        """Test that a MD run cannot be split in segments without steps"""
+
+        calcDir = os.path.join(self.workDir, "nosegments")
+        for segmentSteps in [0, -10]:
+            with self.assertRaises(AmberError):
+                AmberCalculator.runSegmented(self.MDinput, self.topology, self.snapshot, segmentSteps, calcDir=calcDir)
+        self.assertFalse(os.path.exists(calcDir))
+
+    # ================================================================================================================
+
+    def test_runsegmentedrestart(self):
+        """Test that a segmented MD interrupted by a failed segment is resumed from the first missing segment"""
+
+        calcDir = os.path.join(self.workDir, "segmentedrestart")
+        logFile = os.path.join(self.workDir, "segmentedrestart.log")
+
+        # the first two segments are completed (and stored), then the third one fails
+        with standin.activate(cache=self.cacheDir):
+            AmberCalculator.runSegmented(synthetic.inputfile(minimize=False, nrSteps=40, nprntsteps=10),
+                                         self.topology, self.snapshot, 20, calcDir=calcDir, store=True)
+        with standin.activate(cache=self.cacheDir, fail="sander"):
+            with self.assertRaises(AmberError):
+                AmberCalculator.runSegmented(self.MDinput, self.topology, self.snapshot, 20, calcDir=calcDir)
+        self.assertFalse(AmberOutput.completed(os.path.join(calcDir, "segment003")))
+
+        # when the dynamics is run again, only the failed segment and the following ones are executed
+        records = []
+        AmberCalculator.addRunHook(records.append)
+        try:
+            with standin.activate(cache=self.cacheDir, log=logFile):
+                output = AmberCalculator.runSegmented(self.MDinput, self.topology, self.snapshot, 20,
+                                                      calcDir=calcDir)
+        finally:
+            AmberCalculator.removeRunHook(records.append)
+
+        self.assertEqual([record["reused"] for record in records], [True, True, False, False, False])
+        with open(logFile) as f:
+            self.assertEqual([line.split()[0] for line in f].count("sander"), 3)
+        times = np.array(sorted(output.energy.keys()))
+        self.assertEqual(len(times), 10)
+        self.assertTrue(np.allclose(np.diff(times), times[1] - times[0]))
+        self.assertEqual(output[4], output.segments[2].snapshot(0))
+
+    # ================================================================================================================
+
+    def test_solvatedmoleculecache(self):
+        """Test that the parameters of a molecule are computed once and then reused from the cache,
+        with the coordinates of the new geometry"""
+
+        labels = ["O", "H", "H"]
+        geometry = [[0.0, 0.0, 0.0], [0.96, 0.0, 0.0], [-0.24, 0.93, 0.0]]
+        shifted = [[x + 1.0, y, z] for x, y, z in geometry]
+        logFile = os.path.join(self.workDir, "solvation.log")
+        calcDir = os.path.join(self.workDir, "solvation")
+
+        with standin.activate(cache=self.cacheDir, log=logFile):
+            AmberCalculator.createSolvatedMolecule(labels, geometry, 8.0, calcDir=calcDir, residueName="WTR")
+            AmberCalculator.createSolvatedMolecule(labels, shifted, 10.0, calcDir=calcDir, residueName="WTR")
+            with open(os.path.join(calcDir, "molecule.mol2")) as f:
+                mol2Text = f.read()
+            # a different net charge defines a different molecule
+            AmberCalculator.createSolvatedMolecule(labels, geometry, 8.0, calcDir=calcDir, residueName="WTR",
+                                                   netCharge=-1)
+
+        with open(logFile) as f:
+            programs = [line.split()[0] for line in f]
+        self.assertEqual(programs.count("antechamber"), 2)
+        self.assertEqual(programs.count("tleap"), 3)
+        self.assertIn("1.9600", mol2Text)
+
+    # ================================================================================================================
+
+    def test_solvatedmolecules(self):
+        """Test the parallel preparation of many molecules, with the error of one molecule reported in the results"""
+
+        water = (["O", "H", "H"], [[0.0, 0.0, 0.0], [0.96, 0.0, 0.0], [-0.24, 0.93, 0.0]])
+        specs = [water + ("water", 8.0),
+                 water + ("unknownsolvent", 8.0),
+                 {"atomlabels": water[0], "coords": water[1], "solvsize": 10.0, "residueName": "WTR"}]
+
+        with standin.activate(cache=self.cacheDir):
+            results = AmberCalculator.createSolvatedMolecules(specs, calcDir=os.path.join(self.workDir, "batch"),
+                                                              nProcesses=2)
+
+        self.assertEqual(len(results), 3)
+        self.assertIsInstance(results[1], AmberError)
+        for snapshot, topology in [results[0], results[2]]:
+            self.assertEqual(len(snapshot.coords[0]), len(topology.charges))
+        self.assertGreater(len(results[2][1].charges), len(results[0][1].charges))
+
+    # ================================================================================================================
+
+    def test_solvatedmoleculesdownload(self):
+        """Test that the files of a solvent are downloaded once for all the molecules prepared in parallel"""
+
+        water = (["O", "H", "H"], [[0.0, 0.0, 0.0], [0.96, 0.0, 0.0], [-0.24, 0.93, 0.0]])
+        sourceFile = os.path.join(self.workDir, "downloadbox.off")
+        with open(sourceFile, "w") as f:
+            f.write("!!index array str\n \"BOX\"\n")
+        countFile = os.path.join(self.workDir, "downloads")
+        retrieve = urllib.request.urlretrieve
+
+        def countedRetrieve(url, fileName):
+            # the processes of the pool are forked, and inherit this function: the downloads are counted in a file
+            with open(countFile, "a") as f:
+                f.write(url + "\n")
+            return retrieve(url, fileName)
+
+        try:
+            with standin.activate(cache=self.cacheDir), mock.patch("urllib.request.urlretrieve", countedRetrieve):
+                AmberCalculator.registerSolvent("download", "BOX", {"box.off": "file://" + sourceFile},
+                                                leapCommands="loadOff box.off")
+                results = AmberCalculator.createSolvatedMolecules(
+                    [water + ("download", 8.0)] * 4, calcDir=os.path.join(self.workDir, "downloadbatch"), nProcesses=2)
+        finally:
+            for solvents in AmberCalculator._AMBERSOLVENTS.values():
+                solvents.pop("download", None)
+
+        self.assertFalse([result for result in results if isinstance(result, AmberError)])
+        with open(countFile) as f:
+            self.assertEqual(f.read().splitlines(), ["file://" + sourceFile])
+
+    # ================================================================================================================
+
+    def test_solvate(self):
+        """Test the solvation of a molecule with the solvent box saved by tleap: the solvent does not overlap
+        with the molecule, and the topology and the snapshot are consistent"""
+
+        water = (["O", "H", "H"], [[0.0, 0.0, 0.0], [0.96, 0.0, 0.0], [-0.24, 0.93, 0.0]])
+        with standin.activate(cache=self.cacheDir):
+            molSnapshot, molTopology = AmberCalculator.createSolvatedMolecule(*water, None,
+                                                                              calcDir=os.path.join(self.workDir, "mol"))
+            boxSnapshot, boxTopology = AmberCalculator.solventBox("water", calcDir=os.path.join(self.workDir, "box"))
+        snapshot, topology = AmberCalculator.solvate(molTopology, molSnapshot, boxTopology, boxSnapshot, 8.0,
+                                                     closeness=2.0)
+
+        coords = np.array(snapshot.coords).T
+        self.assertEqual(len(coords), len(topology.charges))
+        self.assertEqual(len(molSnapshot.coords[0]), 3)
+        self.assertGreater(np.min(np.linalg.norm(coords[3:, None, :] - coords[None, :3, :], axis=2)), 2.0)
+        self.assertTrue(np.allclose(snapshot.unitcell[3:], math.acos(-1. / 3.)))
+        self.assertEqual(topology.sections["POINTERS"][1][27], 2)
+
+    # ================================================================================================================
+
+    def test_solventlibrary(self):
+        """Test a custom solvent box read from local files: the files are fetched once into the solvent cache,
+        then the solvent can be used without the original files, and a wrong checksum is an error"""
+
+        water = (["O", "H", "H"], [[0.0, 0.0, 0.0], [0.96, 0.0, 0.0], [-0.24, 0.93, 0.0]])
+        sourceDir = os.path.join(self.workDir, "solventfiles")
+        os.makedirs(sourceDir)
+        with open(os.path.join(sourceDir, "box.off"), "w") as f:
+            f.write("!!index array str\n \"BOX\"\n")
+        calcDir = os.path.join(self.workDir, "customsolvent")
+        try:
+            with standin.activate(cache=self.cacheDir):
+                AmberCalculator.registerSolvent("custom", "BOX", {"box.off": os.path.join(sourceDir, "box.off")},
+                                                leapCommands="loadOff box.off")
+                AmberCalculator.createSolvatedMolecule(*water, 8.0, calcDir=calcDir, solvent="custom")
+                os.remove(os.path.join(sourceDir, "box.off"))
+                snapshot, topology = AmberCalculator.createSolvatedMolecule(*water, 8.0, calcDir=calcDir,
+                                                                            solvent="custom")
+                with open(os.path.join(calcDir, "box.off")) as f:
+                    self.assertIn("BOX", f.read())
+
+                # a file found in a local directory is used to seed the cache, after checking its checksum
+                with open(os.path.join(sourceDir, "other.off"), "w") as f:
+                    f.write("other box\n")
+                AmberCalculator.registerSolvent("wrong", "BOX", {"other.off": ("https://example.invalid/other.off", "0" * 64)})
+                with self.assertRaises(AmberError):
+                    AmberCalculator.seedSolventCache(sourceDir)
+        finally:
+            for solvents in AmberCalculator._AMBERSOLVENTS.values():
+                solvents.pop("custom", None)
+                solvents.pop("wrong", None)
+
+        self.assertEqual(len(snapshot.coords[0]), len(topology.charges))
+
+    # ================================================================================================================
+
+    def test_solventmanifest(self):
+        """Test that the entries of the solvent cache manifest written at the same time by many processes are kept"""
+
+        sources = ["https://example.invalid/box{0:02d}.off".format(n) for n in range(40)]
+        with standin.activate(cache=self.cacheDir):
+            with concurrent.futures.ProcessPoolExecutor(max_workers=4) as executor:
+                list(executor.map(AmberCalculator._solventManifest, sources,
+                                  [{"filename": "box.off", "sha256": str(n)} for n in range(len(sources))]))
+            entries = [AmberCalculator._solventManifest(source) for source in sources]
+        self.assertEqual([entry.get("sha256") for entry in entries], [str(n) for n in range(len(sources))])
+
+    # ================================================================================================================
+
+    def test_environmentrecord(self):
+        """Test that the paths of the executables are stored in the on-disk record of the environment"""
+
+        with standin.activate(cache=self.cacheDir):
+            sander = AmberCalculator._executable("sander")
+            with open(os.path.join(self.cacheDir, AmberCalculator._ENVRECORDNAME)) as f:
+                records = json.load(f)
+
+        self.assertEqual(sander, os.path.join(standin.STANDINHOME, "bin", "sander"))
+        self.assertTrue(any(r.get("executables", {}).get("sander", [None])[0] == sander for r in records.values()))
+
+
+######################################################################################################################
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -1,9 +1,15 @@
 #! /usr/bin/env python
 
 import unittest
-from ambercalculator import AmberOutput, AmberSnapshot
+from ambercalculator import AmberError, AmberOutput, AmberSnapshot
+from benchmark import synthetic
 import os
+import sys
+import shutil
+import subprocess
 import tarfile
+import tempfile
+import numpy as np
 
 
 ######################################################################################################################
@@ -132,6 +138,147 @@ class TestAmberOutput(unittest.TestCase):
         del cls.OptOutput
 
 
+######################################################################################################################
+
+class TestAmberOutputSynthetic(unittest.TestCase):
+    """The methods of AmberOutput that do not depend on the details of a real calculation are tested on
+    synthetic calculations, written with benchmark/synthetic: a minimization and a MD run"""
+
+    # Number of atoms of the synthetic system
+    _NATOMS = 300
+
+    # ================================================================================================================
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.workDir = tempfile.mkdtemp(prefix="testAmberOutputSynthetic")
+        cls.mdDir, cls.optDir = os.path.join(cls.workDir, "md"), os.path.join(cls.workDir, "opt")
+        synthetic.writecalculation(cls.mdDir, cls._NATOMS, synthetic.inputfile(minimize=False, nrSteps=200))
+        synthetic.writecalculation(cls.optDir, cls._NATOMS, synthetic.inputfile(minimize=True, nrSteps=50,
+                                                                                 nprntsteps=5))
+        cls.MDOutput = AmberOutput(cls.mdDir, storeFiles=True)
+        cls.OptOutput = AmberOutput(cls.optDir, storeFiles=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.MDOutput
+        del cls.OptOutput
+        shutil.rmtree(cls.workDir)
+
+    # ================================================================================================================
+
+    def test_close(self):
+        """Test that a closed calculation is removed in the background, and that the data already read are kept"""
+
+        calcDir = os.path.join(self.workDir, "close", "calc")
+        shutil.copytree(self.mdDir, calcDir)
+        with AmberOutput(calcDir) as output:
+            output.snapshot(-1)
+        # the directory is moved to the trash at once, and deleted by the cleanup thread
+        self.assertFalse(os.path.exists(calcDir))
+        AmberOutput.flushCleanup()
+        self.assertEqual(os.listdir(os.path.dirname(calcDir)), [])
+        self.assertEqual(output.type, "MD")
+        output.close()
+
+        # an instance that is not initialized does not look for its attributes in dataDict
+        with self.assertRaises(AttributeError):
+            AmberOutput.__new__(AmberOutput).records
+        with self.assertRaises(KeyError):
+            self.MDOutput["notAKey"]
+
+    # ================================================================================================================
+
+    def test_lean(self):
+        """Test that lean instances of the same system, read from different directories, share the topology
+        and do not keep the log"""
+
+        leanDirs = [os.path.join(self.workDir, "lean", name) for name in ["calc0", "calc1"]]
+        for leanDir in leanDirs:
+            shutil.copytree(self.mdDir, leanDir)
+        outputs = [AmberOutput(leanDir, storeFiles=True, keepLog=True, lean=True) for leanDir in leanDirs]
+        self.assertIs(outputs[0].topology, outputs[1].topology)
+        self.assertEqual(outputs[0].topology, self.MDOutput.topology)
+        self.assertIsNot(outputs[0].topology, self.MDOutput.topology)
+        self.assertIsNone(outputs[1].dataDict["logtext"])
+        self.assertEqual(outputs[1].logtext, self.MDOutput.logtext)
+        self.assertEqual(outputs[1].temperature, self.MDOutput.temperature)
+        self.assertNotIn("temperature", outputs[1].dataDict)
+
+        # a different system does not share the topology
+        otherDir = os.path.join(self.workDir, "lean", "other")
+        synthetic.writecalculation(otherDir, 30, synthetic.inputfile(minimize=False, nrSteps=20))
+        other = AmberOutput(otherDir, storeFiles=True, lean=True)
+        self.assertNotEqual(other.topology, outputs[0].topology)
+
+    # ================================================================================================================
+
+    def test_plotoutputs(self):
+        """Test the AmberOutput method that writes the plots of many calculations on a pool of processes"""
+
+        # the calculations are given as directories and as instances, an unknown directory gives an error
+        pdfFileNames = [os.path.join(self.workDir, name) for name in ["batchOpt.pdf", "batchMD.pdf", "batchError.pdf"]]
+        results = AmberOutput.plotOutputs([self.optDir, self.MDOutput, os.path.join(self.workDir, "notACalculation")],
+                                          pdfFileNames, nProcesses=2)
+        self.assertEqual(results[:2], pdfFileNames[:2])
+        self.assertTrue(os.path.isfile(pdfFileNames[0]) and os.path.isfile(pdfFileNames[1]))
+        self.assertIsInstance(results[2], AmberError)
+        self.assertFalse(os.path.exists(pdfFileNames[2]))
+
+    # ================================================================================================================
+
+    def test_downsample(self):
+        """Test that the downsampling of a line keeps its extremes and its first and last point"""
+
+        x = np.arange(100000)
+        y = np.sin(x / 1000.) + np.where(x == 54321, 5., 0.)
+        xs, ys = AmberOutput._downsample(x, y, 500)
+        self.assertLessEqual(len(xs), 500)
+        self.assertTrue(np.all(np.diff(xs) > 0))
+        self.assertEqual((xs[0], xs[-1]), (0, 99999))
+        self.assertEqual((ys.max(), ys.min()), (y.max(), y.min()))
+        self.assertTrue(np.array_equal(y[xs], ys))
+        self.assertIs(AmberOutput._downsample(x, y, None)[1], y)
+
+    # ================================================================================================================
+
+    def test_recordnames(self):
+        """Test that the units and the other suffixes in parentheses are removed from the names of the terms"""
+
+        logLines = []
+        for line in synthetic.logtext(30, synthetic.inputfile(minimize=False, nrSteps=20)).splitlines(keepends=True):
+            logLines.append(line)
+            if line.startswith(" EELEC"):
+                logLines.append(" EAMBER (non-restraint)  =      -301.2958\n")
+        records = AmberOutput._parseAmberLog(logLines)["records"]
+        self.assertIn("EAMBER", records.dtype.names)
+        self.assertIn("TEMP", records.dtype.names)
+        self.assertTrue(all(name == name.strip() for name in records.dtype.names))
+        self.assertTrue(np.all(records["EAMBER"] == -301.2958))
+
+    # ================================================================================================================
+
+    def test_exit(self):
+        """Test that the directories of the instances that are alive at the exit of the interpreter are removed,
+        both before and after the cleanup thread has been started, and that the interpreter exits"""
+
+        exitDir = os.path.join(self.workDir, "exit")
+        for name in ["calc0", "calc1", "calc2"]:
+            shutil.copytree(self.mdDir, os.path.join(exitDir, name))
+        script = "from ambercalculator import AmberOutput\n" \
+                 "first = AmberOutput('calc0')\n" \
+                 "AmberOutput('calc1').close()\n" \
+                 "last = AmberOutput('calc2')\n"
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            [os.path.dirname(os.path.dirname(os.path.realpath(__file__))), os.environ.get("PYTHONPATH", "")]))
+        result = subprocess.run([sys.executable, "-c", script], cwd=exitDir, env=environment, timeout=60,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.assertEqual(result.returncode, 0, result.stderr.decode())
+        self.assertEqual(result.stderr, b"")
+        self.assertEqual(os.listdir(exitDir), [])
+
+
 ######################################################################################################################
 
 if __name__ == '__main__':
@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+
+import unittest
+from ambercalculator import AmberError, AmberOutput, AmberOutputCollection
+from benchmark import synthetic
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+######################################################################################################################
+
+class TestAmberOutputCollection(unittest.TestCase):
+    """The AmberOutputCollection class is tested on a chain of synthetic calculations (a minimization followed by
+    two MD runs), and its statistical tools are compared with direct implementations on model time series"""
+
+    # Number of atoms of the synthetic system
+    _NATOMS = 300
+
+    # ================================================================================================================
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.workDir = tempfile.mkdtemp(prefix="testAmberOutputCollection")
+        inputs = [synthetic.inputfile(minimize=True, nrSteps=50, nprntsteps=10),
+                  synthetic.inputfile(minimize=False, nrSteps=500, nprntsteps=10),
+                  synthetic.inputfile(minimize=False, nrSteps=1000, nprntsteps=10)]
+        cls.outputs = []
+        for n, inputData in enumerate(inputs):
+            calcDir = os.path.join(cls.workDir, "stage{0}".format(n))
+            synthetic.writecalculation(calcDir, cls._NATOMS, inputData, seed=n)
+            cls.outputs.append(AmberOutput(calcDir, storeFiles=True))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workDir)
+
+    # ================================================================================================================
+
+    @staticmethod
+    def _inefficiency(values):
+        """Statistical inefficiency of a series, computed with an explicit sum over the lags"""
+        deviations = values - values.mean()
+        variance, inefficiency = np.mean(deviations ** 2), 1.0
+        for lag in range(1, len(values)):
+            correlation = np.mean(deviations[:-lag] * deviations[lag:]) / variance
+            if correlation <= 0.:
+                break
+            inefficiency += 2. * correlation * (1. - lag / len(values))
+        return inefficiency
+
+    # ================================================================================================================
+
+    def test_records(self):
+        """Test that the records of the stages are joined with a continuous time along the MD stages"""
+
+        collection = AmberOutputCollection(self.outputs)
+        self.assertEqual(len(collection), 3)
+        self.assertEqual(len(collection.records), sum(len(output.records) for output in self.outputs))
+        self.assertEqual(collection.stages.tolist(), [0] * 5 + [1] * 50 + [2] * 100)
+
+        time, temperature = collection.series("temperature")
+        self.assertEqual(len(time), 150)
+        self.assertTrue(np.all(np.diff(time) > 0))
+        self.assertTrue(np.array_equal(temperature, np.concatenate([o.records["TEMP"] for o in self.outputs[1:]])))
+        self.assertEqual(len(collection.series("EPtot", stages=[2])[1]), 100)
+        with self.assertRaises(AmberError):
+            collection.series("UNKNOWN")
+
+        time, average = collection.runningAverage("energy", window=10)
+        self.assertEqual(len(average), 141)
+        self.assertAlmostEqual(average[0], collection.series("energy")[1][:10].mean())
+        self.assertAlmostEqual(collection.runningAverage("energy")[1][-1], collection.series("energy")[1].mean())
+
+        summary = collection.summary()
+        self.assertEqual(set(summary), {"energy", "temperature", "pressure", "volume"})
+        self.assertGreater(summary["temperature"]["error"], 0.)
+
+    # ================================================================================================================
+
+    def test_statistics(self):
+        """Test the statistical inefficiency of an AR(1) process, for many origins together, and the detection of
+        the equilibration of a series with an initial relaxation"""
+
+        rng = np.random.RandomState(0)
+        values = np.zeros(3000)
+        for i in range(1, len(values)):
+            values[i] = 0.9 * values[i - 1] + rng.normal()
+        origins = np.array([0, 10, 500, 2990])
+        inefficiencies = AmberOutputCollection._statisticalInefficiency(values, origins)
+        self.assertTrue(np.allclose(inefficiencies, [self._inefficiency(values[o:]) for o in origins]))
+        self.assertEqual(AmberOutputCollection._statisticalInefficiency(np.ones(10), np.array([0]))[0], 1.0)
+
+        # a relaxation of the temperature at the beginning of the second MD stage
+        collection = AmberOutputCollection(self.outputs)
+        temperature = collection.records["TEMP"]
+        start = np.flatnonzero(collection.stages == 1)[0]
+        temperature[start:start + 150] += 200. * np.exp(-np.arange(150) / 5.)
+        equilibration = collection.equilibration("temperature")
+        self.assertGreater(equilibration["index"], 5)
+        self.assertLess(equilibration["index"], 50)
+        self.assertGreater(equilibration["samples"], 1.)
+
+
+######################################################################################################################
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
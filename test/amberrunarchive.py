@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+
+import unittest
+from ambercalculator import AmberError, AmberOutput
+from ambercalculator.runarchive import AmberRunArchive, splitpath
+from benchmark import synthetic
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+import numpy as np
+
+
+######################################################################################################################
+
+class TestAmberRunArchive(unittest.TestCase):
+    """A synthetic MD calculation is stored in tar and zip archives, with and without compression, and the
+    results read from the archives are compared with the results read from the directory of the calculation"""
+
+    # Number of atoms of the synthetic system
+    _NATOMS = 300
+
+    # ================================================================================================================
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.workDir = tempfile.mkdtemp(prefix="testAmberRunArchive")
+        cls.calcDir = os.path.join(cls.workDir, "run01")
+        synthetic.writecalculation(cls.calcDir, cls._NATOMS, synthetic.inputfile(minimize=False, nrSteps=300))
+        cls.output = AmberOutput(cls.calcDir, storeFiles=True)
+
+        # the calculation is stored in a subdirectory of the tar archives, and at the root of the zip archives
+        for mode, name in [("w:gz", "runs.tar.gz"), ("w:", "runs.tar")]:
+            with tarfile.open(os.path.join(cls.workDir, name), mode) as tar:
+                tar.add(cls.calcDir, arcname="runs/run01")
+        for compression, name in [(zipfile.ZIP_DEFLATED, "deflated.zip"), (zipfile.ZIP_STORED, "stored.zip")]:
+            with zipfile.ZipFile(os.path.join(cls.workDir, name), "w", compression) as archive:
+                for fileName in os.listdir(cls.calcDir):
+                    archive.write(os.path.join(cls.calcDir, fileName), fileName)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workDir)
+
+    # ================================================================================================================
+
+    def test_archives(self):
+        """Test that a calculation is read from the archives as from its directory"""
+
+        for path in ["runs.tar.gz/runs/run01", "runs.tar.gz", "runs.tar/runs/run01", "deflated.zip", "stored.zip"]:
+            archived = AmberOutput(os.path.join(self.workDir, path))
+            self.assertTrue(archived.storeFiles)
+            self.assertEqual(archived.records.tobytes(), self.output.records.tobytes())
+            self.assertEqual(archived.topology, self.output.topology)
+            self.assertEqual(archived.logtext, self.output.logtext)
+            self.assertEqual(archived.snapshot(-1), self.output.snapshot(-1))
+            self.assertEqual(archived.snapshot(7), self.output.snapshot(7))
+            self.assertTrue(np.array_equal(archived[::4].coords, self.output[::4].coords))
+            self.assertTrue(np.allclose(archived.analysis(chunkSize=4).rmsd(), self.output.analysis().rmsd()))
+            del archived
+        self.assertTrue(os.path.isfile(os.path.join(self.workDir, "runs.tar.gz")))
+
+    # ================================================================================================================
+
+    def test_members(self):
+        """Test the files of an archive, the paths through the archives and the errors for missing calculations"""
+
+        archiveFile = os.path.join(self.workDir, "runs.tar")
+        self.assertEqual(splitpath(os.path.join(archiveFile, "runs", "run01")), (archiveFile, "runs/run01"))
+        self.assertEqual(splitpath(self.calcDir), (None, self.calcDir))
+        with AmberRunArchive(archiveFile, "runs") as archive:
+            self.assertEqual(archive.files, sorted(os.listdir(self.calcDir)))
+
+        with self.assertRaises(AmberError):
+            AmberOutput(os.path.join(self.workDir, "runs.tar", "run02"))
+        with open(os.path.join(self.workDir, "text"), "w") as f:
+            f.write("this is not an archive\n")
+        with self.assertRaises(AmberError):
+            AmberOutput(os.path.join(self.workDir, "text"))
+
+
+######################################################################################################################
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
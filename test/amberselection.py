@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+
+import unittest
+from ambercalculator import AmberSelection, AmberCalculator, AmberError
+import numpy as np
+
+
+######################################################################################################################
+
+class TestAmberSelection(unittest.TestCase):
+
+    # Amber masks used for the tests, and the corresponding lists of atoms
+    _MASK1 = "1-10,20-30,45"
+    _MASK2 = "5-25,40-50"
+
+    # ================================================================================================================
+
+    def setUp(self):
+
+        # the selections are compared with the same operations on python sets
+        self.selection1, self.selection2 = AmberSelection.frommask(self._MASK1), AmberSelection.frommask(self._MASK2)
+        self.set1 = set(range(1, 11)) | set(range(20, 31)) | {45}
+        self.set2 = set(range(5, 26)) | set(range(40, 51))
+
+    # ================================================================================================================
+
+    def test_conversions(self):
+        """Test the conversion of a selection to and from Amber masks and arrays of indices"""
+
+        self.assertEqual(self.selection1.atoms.tolist(), sorted(self.set1))
+        self.assertEqual(self.selection1.indices.tolist(), sorted(i - 1 for i in self.set1))
+        self.assertEqual(self.selection1.mask(), self._MASK1)
+        self.assertEqual(AmberSelection.fromindices(self.selection1.indices), self.selection1)
+        # the atoms can be given unsorted and with repetitions
+        self.assertEqual(AmberSelection.fromatoms([45, 3, 2, 1, 2]).mask(prefix="@"), "@1-3,45")
+        self.assertEqual(len(self.selection1), len(self.set1))
+        with self.assertRaises(AmberError):
+            AmberSelection.frommask(":WAT")
+
+    # ================================================================================================================
+
+    def test_setoperations(self):
+        """Test union, intersection and difference of two selections"""
+
+        self.assertEqual(set(self.selection1 | self.selection2), self.set1 | self.set2)
+        self.assertEqual(set(self.selection1 & self.selection2), self.set1 & self.set2)
+        self.assertEqual(set(self.selection1 - self.selection2), self.set1 - self.set2)
+        self.assertEqual(set(self.selection2 - self.selection1), self.set2 - self.set1)
+        self.assertEqual(set(self.selection1 ^ self.selection2), self.set1 ^ self.set2)
+        self.assertEqual(len(self.selection1 & AmberSelection()), 0)
+
+    # ================================================================================================================
+
+    def test_membership(self):
+        """Test the vectorized membership test"""
+
+        atoms = np.arange(0, 60)
+        self.assertEqual(self.selection1.contains(atoms).tolist(), [int(a) in self.set1 for a in atoms])
+        self.assertIn(45, self.selection1)
+        self.assertNotIn(44, self.selection1)
+
+    # ================================================================================================================
+
+    def test_amberformat(self):
+        """Test the conversion functions of AmberCalculator between lists of atoms and Amber-style strings"""
+
+        self.assertEqual(AmberCalculator.atomlist2amberformat([1, 2, 3, 5, 9, 10, 11, 12]), "':1-3,5,9-12'")
+        self.assertEqual(AmberCalculator.amberformat2atomlist("':1-3,5,9-12'"), [1, 2, 3, 5, 9, 10, 11, 12])
+
+
+######################################################################################################################
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
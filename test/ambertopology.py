@@ -2,6 +2,7 @@
 
 import unittest
 from ambercalculator import AmberTopology
+from benchmark import synthetic
 import os
 import numpy as np
 import math
@@ -75,6 +76,70 @@ class TestAmberTopology(unittest.TestCase):
 
     # ================================================================================================================
 
+    def test_shared(self):
+        """Test that equal topologies share the same instance and the same text, as long as they are alive"""
+
+        topotext = self.testTopology.topotext
+        shared = AmberTopology.shared(topotext)
+        copy = AmberTopology.shared("".join(list(topotext)))
+        self.assertIs(copy, shared)
+        self.assertIs(copy.topotext, topotext)
+        self.assertIsNot(AmberTopology.shared(topotext.replace("CHARGE", "CHARGE ")), shared)
+
+    # ================================================================================================================
+
+    def test_atomsandresidues(self):
+        """Test the AmberTopology method that extracts atomic symbols, coordinates and residues"""
+
+        snapshot = synthetic.snapshot(5223)
+        symbols, coords, residues = self.testTopology.atomsandresidues(snapshot)
+
+        # the solute (first residue) has 24 atoms, followed by 1733 water molecules
+        self.assertEqual(list(residues[:25]), [1] * 24 + [2])
+        self.assertEqual(residues[-1], 1734)
+        self.assertEqual(list(symbols[24:27]), ["O", "H", "H"])
+        self.assertEqual(np.sum(symbols == "H"), 2 * 1733 + 10)
+        self.assertTrue(np.allclose(coords, np.array(snapshot.coords).T))
+
+    # ================================================================================================================
+
+    def test_sections(self):
+        """Test that the topology file written from the parsed sections is identical to the original one"""
+
+        copyTopology = AmberTopology.fromsections(self.testTopology.sections)
+
+        # the first line has the date of the file, the other lines should be identical (apart from trailing spaces)
+        self.assertEqual([line.rstrip() for line in copyTopology.topotext.splitlines()[1:]],
+                         [line.rstrip() for line in self.testTopology.topotext.splitlines()[1:]])
+
+    # ================================================================================================================
+
+    def test_addsolvent(self):
+        """Test the AmberTopology method that adds solvent residues to the topology"""
+
+        solvent = synthetic.topology(30)
+        unitcell = [40.0] * 3 + [math.acos(-1. / 3.)] * 3
+        sections = self.testTopology.addsolvent(solvent, 10, unitcell).sections
+        original = self.testTopology.sections
+
+        # number of atoms, residues, bonds and molecules
+        self.assertEqual(sections["POINTERS"][1][0], original["POINTERS"][1][0] + 30)
+        self.assertEqual(sections["POINTERS"][1][11], original["POINTERS"][1][11] + 10)
+        self.assertEqual(len(sections["BONDS_INC_HYDROGEN"][1]), len(original["BONDS_INC_HYDROGEN"][1]) + 90)
+        self.assertEqual(np.sum(sections["ATOMS_PER_MOLECULE"][1]), sections["POINTERS"][1][0])
+        self.assertEqual(list(sections["SOLVENT_POINTERS"][1]), [1, 1744, 2])
+        self.assertTrue(np.allclose(sections["BOX_DIMENSIONS"][1], [109.4712206, 40.0, 40.0, 40.0]))
+        self.assertTrue(np.allclose(np.array(sections["CHARGE"][1][-3:]), solvent.sections["CHARGE"][1][:3]))
+
+        # Lennard-Jones coefficients: the water oxygen of the topology and the one of the solvent are identical
+        nTypes = sections["POINTERS"][1][1]
+        index = sections["NONBONDED_PARM_INDEX"][1].reshape(nTypes, nTypes)
+        coefA = np.where(index > 0, sections["LENNARD_JONES_ACOEF"][1][np.abs(index) - 1], 0.)
+        oxygen, newOxygen = sections["ATOM_TYPE_INDEX"][1][24] - 1, sections["ATOM_TYPE_INDEX"][1][-3] - 1
+        self.assertTrue(np.allclose(coefA[oxygen], coefA[newOxygen], rtol=1.e-4))
+
+    # ================================================================================================================
+
     def tearDown(self):
         del self.testTopology, self.atomnames, self.charge
 
@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+
+import unittest
+import os
+import subprocess
+import sys
+import json
+
+
+######################################################################################################################
+
+class TestImportTime(unittest.TestCase):
+
+    # maximum time (in seconds) allowed for "import ambercalculator" in a fresh interpreter,
+    # the value can be changed with the environment variable AMBERCALCULATOR_IMPORT_BUDGET
+    _IMPORTBUDGET = float(os.environ.get("AMBERCALCULATOR_IMPORT_BUDGET", 0.15))
+    # number of repetitions of the import time measure, the best timing is compared with the budget
+    _NREPEAT = 3
+
+    # modules that should not be imported when ambercalculator is imported
+    _HEAVYMODULES = ["numpy", "scipy", "matplotlib", "subprocess", "urllib.request", "fileinput"]
+
+    # ================================================================================================================
+
+    @classmethod
+    def _runChild(cls, code):
+        """Run python code in a fresh interpreter, from the root directory of the package, and
+        return the data that the child process prints to standard output in json format"""
+
+        rootpath = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        result = subprocess.run([sys.executable, "-c", code], cwd=rootpath, check=True, stdout=subprocess.PIPE)
+        return json.loads(result.stdout.decode().splitlines()[-1])
+
+    # ================================================================================================================
+
+    def test_heavymodules(self):
+        """Test that heavy dependencies are not imported together with the package"""
+
+        loaded = self._runChild("import sys, json; import ambercalculator; "
+                                "print(json.dumps([m for m in {0} if m in sys.modules]))".format(self._HEAVYMODULES))
+        self.assertEqual(loaded, [])
+
+    # ================================================================================================================
+
+    def test_inputonly(self):
+        """Test that the generation of an AMBER input file does not need any heavy dependency"""
+
+        loaded = self._runChild("import sys, json; from ambercalculator import AmberInput; "
+                                "text = AmberInput(minimize=False, nrSteps=100).inputtext; "
+                                "print(json.dumps([m for m in {0} if m in sys.modules]))".format(self._HEAVYMODULES))
+        self.assertEqual(loaded, [])
+
+    # ================================================================================================================
+
+    def test_importbudget(self):
+        """Test that the time needed to import the package is within the budget"""
+
+        timings = [self._runChild("import time, json; t = time.perf_counter(); import ambercalculator; "
+                                  "print(json.dumps(time.perf_counter() - t))") for _ in range(self._NREPEAT)]
+        self.assertLess(min(timings), self._IMPORTBUDGET)
+
+
+######################################################################################################################
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
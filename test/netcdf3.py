@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+
+import unittest
+from ambercalculator import AmberError
+from ambercalculator.netcdf3 import NetCDF3File
+from scipy.io import netcdf_file
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+######################################################################################################################
+
+class TestNetCDF3File(unittest.TestCase):
+    """The NetCDF3File reader is compared with the NetCDF reader of scipy, for files that are written by scipy"""
+
+    # ================================================================================================================
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.workDir = tempfile.mkdtemp(prefix="testNetCDF3")
+        cls.rng = np.random.RandomState(0)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workDir)
+
+    # ================================================================================================================
+
+    def _writetrajectory(self, fileName, version, nrFrames=4, nrAtoms=5):
+        """Write a trajectory with the AMBER convention, with two record variables and one fixed variable"""
+
+        with netcdf_file(fileName, "w", version=version) as f:
+            f.Conventions = "AMBER"
+            f.createDimension("frame", None)
+            f.createDimension("atom", nrAtoms)
+            f.createDimension("spatial", 3)
+            f.createVariable("spatial", "c", ("spatial",))[:] = np.array(list("xyz"), dtype="S1")
+            f.createVariable("time", "f", ("frame",))[:] = np.arange(nrFrames)
+            coordinates = f.createVariable("coordinates", "f", ("frame", "atom", "spatial"))
+            coordinates.units = "angstrom"
+            coordinates[:] = self.rng.rand(nrFrames, nrAtoms, 3)
+
+    # ================================================================================================================
+
+    def test_variables(self):
+        """Test that the data, the dimensions and the attributes are the same of scipy, for the classic
+        and for the 64-bit offset formats, and that the record variables are read-only views on the file"""
+
+        for version in (1, 2):
+            fileName = os.path.join(self.workDir, "mdcrd{0}".format(version))
+            self._writetrajectory(fileName, version)
+
+            with netcdf_file(fileName, mmap=False) as reference, NetCDF3File(fileName) as ncFile:
+                self.assertEqual(ncFile.numrecs, 4)
+                self.assertEqual(ncFile.attributes["Conventions"], "AMBER")
+                self.assertEqual(ncFile.variables["coordinates"].units, "angstrom")
+                for name, variable in reference.variables.items():
+                    self.assertEqual(ncFile.variables[name].dimensions, variable.dimensions)
+                    self.assertTrue(np.array_equal(ncFile.variables[name].data, variable.data))
+                coordinates = ncFile.variables["coordinates"].data
+                self.assertFalse(coordinates.flags.owndata or coordinates.flags.writeable)
+
+    # ================================================================================================================
+
+    def test_streaming(self):
+        """Test a file written in streaming mode: the number of records is computed from the size of the file"""
+
+        fileName = os.path.join(self.workDir, "streaming")
+        self._writetrajectory(fileName, 2, nrFrames=7)
+        with open(fileName, "r+b") as f:
+            f.seek(4)
+            f.write(b"\xff\xff\xff\xff")
+
+        with NetCDF3File(fileName) as ncFile:
+            self.assertEqual(ncFile.numrecs, 7)
+            self.assertEqual(ncFile.variables["coordinates"].shape, (7, 5, 3))
+
+    # ================================================================================================================
+
+    def test_notnetcdf(self):
+        """Test that a file that is not a NetCDF3 file raises an AmberError"""
+
+        fileName = os.path.join(self.workDir, "text")
+        with open(fileName, "w") as f:
+            f.write("this is not a NetCDF file\n")
+        with self.assertRaises(AmberError):
+            NetCDF3File(fileName)
+
+
+######################################################################################################################
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)